@@ -26,6 +26,9 @@ FindInstalledPython::usage="FindInstalledPython[] finds an installed python kern
 ClosePython::usage="ClosePython[] closes a python kernel";
 PyEvaluate::usage="PyEval[] evaluates code on the python side";
 PyEvaluateString::usage="PyEval[] Evaluates a code string on the python side";
+PyCall::usage="PyCall[f, args, kwargs] calls a python function directly, without generating code for it";
+PyCollect::usage="PyCollect[tickets, timeout] gets the results of the independent PyCalls that have finished";
+PyCallTicket::usage="PyCallTicket[n] stands for an independent PyCall that python is still running";
 PyWrite::usage="PyWrite[] writes a command to the python stdin";
 PyWriteString::usage="PyWriteString[] writes a command string to the python stdin";
 PyRead::usage="PyRead[] reads from the python stdout";
@@ -46,6 +49,11 @@ $DefaultPythonKernel::usage="The default kernel for evaluations";
 $PythonKernels::usage="A listing of the configured python kernels";
 
 CallPythonPacket::usage="A packet of info for python on what to call";
+PyCallPacket::usage="PyCallPacket[f, args, kwargs] tells python to call f on args and kwargs as they are";
+PyCallAsyncPacket::usage="PyCallAsyncPacket[f, args, kwargs] tells python to start a call on its thread pool";
+PyCollectPacket::usage="PyCollectPacket[tickets, timeout] asks python for the calls that have finished";
+PyCoalescedItem::usage="PyCoalescedItem[expr] evaluates one item of a batch python sent, so that it can't take the rest down with it";
+PyCoalescedResult::usage="PyCoalescedResult[value] holds the type-hinted value of a PyCoalescedItem";
 
 EndPackage[];
 
@@ -568,6 +576,74 @@ PyEvaluateString[expr_, ops:OptionsPattern[]]:=
     ]
 
 
+(* ::Subsubsection::Closed:: *)
+(*Call*)
+
+
+Options[PyCall] = 
+  {
+    TimeConstraint->10,
+    Version->Automatic,
+    "Independent"->False
+    };
+PyCall[f:_String|_Integer, args_List:{}, kwargs:_List|_Association:{}, ops:OptionsPattern[]]:=
+  PackageExceptionBlock["Kernel"]@
+    Module[
+      {
+        pker = FindInstalledPython[OptionValue[Version]],
+        link,
+        to = If[NumericQ@OptionValue[TimeConstraint], OptionValue[TimeConstraint], 10]
+      },
+      If[AssociationQ@pker,
+        link = pker["Link"];
+        cleanUpEnv[
+            pker, 
+            OptionValue["Version"],
+            pyEvalPacket[link, 
+              CallPacket[1, 
+                If[TrueQ@OptionValue["Independent"], PyCallAsyncPacket, PyCallPacket][
+                  f, 
+                  AddTypeHints[args, {1}], 
+                  Normal@kwargs
+                  ]
+                ], 
+              to
+              ]
+            ],
+        PackageRaiseException[Automatic,
+          "Found kernel `` which is not a valid kernel",
+          pker
+          ]
+        ]
+    ]
+
+
+Options[PyCollect] = 
+  {
+    Version->Automatic
+    };
+PyCollect[tickets:{___PyCallTicket}|All:All, timeout:_?NumericQ:0, ops:OptionsPattern[]]:=
+  PackageExceptionBlock["Kernel"]@
+    Module[
+      {
+        pker = FindInstalledPython[OptionValue[Version]],
+        link
+      },
+      If[AssociationQ@pker,
+        link = pker["Link"];
+        cleanUpEnv[
+            pker, 
+            OptionValue["Version"],
+            pyEvalPacket[link, CallPacket[1, PyCollectPacket[tickets, N@timeout]], timeout + 10]
+            ],
+        PackageRaiseException[Automatic,
+          "Found kernel `` which is not a valid kernel",
+          pker
+          ]
+        ]
+    ]
+
+
 (* ::Subsubsection::Closed:: *)
 (*Write*)
 
@@ -718,6 +794,32 @@ AddTypeHints[eval_, level_:{0}] :=
   Replace[eval, Values@$TypeHints, level];
 
 
+(* ::Subsubsection::Closed:: *)
+(*PyCoalescedItem*)
+
+
+(* 
+  Gives the same value expr would have as a standalone evaluation, 
+  with aborts and throws stopped at the item instead of ending the whole batch 
+  *)
+PyCoalescedItem[expr_]:=
+  Module[{ok, res},
+    res =
+      CheckAbort[
+        Catch[
+          Catch[ok[expr]],
+          _,
+          Function[{val, tag}, ok[Hold[Throw[val, tag]]]]
+          ],
+        ok[$Aborted]
+        ];
+    PyCoalescedResult@
+      AddTypeHints@
+        Replace[res, {ok[r_]:>r, r_:>Hold[Throw[r]]}]
+    ];
+PyCoalescedItem~SetAttributes~HoldAll;
+
+
 (* ::Subsubsection::Closed:: *)
 (*RegisterTypeHint*)
 
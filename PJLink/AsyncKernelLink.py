@@ -0,0 +1,230 @@
+"""AsyncKernelLink lets asyncio code use a KernelLink without blocking the event loop
+
+"""
+
+import threading, queue
+from .MathLinkExceptions import MathLinkException
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import KernelPacket
+
+###############################################################################################
+#                                                                                             #
+#                                       AsyncKernelLink                                       #
+#                                                                                             #
+###############################################################################################
+
+class AsyncKernelLink:
+    """An asyncio front end for a KernelLink. A single I/O thread owns the link and works through
+submitted jobs one at a time. Each job's future is resolved back on the loop that submitted it by way of
+loop.call_soon_threadsafe, so awaiting an evaluation costs no polling on either side.
+
+    link = AsyncKernelLink(WrappedKernelLink.from_new_kernel())
+    res = await link.evaluate(M.Plus(1, 2))
+    async for pkt in link.packets():
+        ...
+
+    """
+
+    def __init__(self, link, poll_interval = .01):
+        """
+        :param link: the KernelLink to drive. Nothing else should use it while this is running.
+        :param poll_interval: how often (in seconds) to check for packets the kernel sends on its own while someone is listening via packets()
+        """
+        self.link = link
+        self.poll_interval = poll_interval
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._closed = False
+        self._subscribers = [] # (loop, asyncio.Queue) pairs fed by packets()
+        self._subscriber_lock = threading.Lock()
+        link.addPacketListener(self._packetArrived)
+
+    @classmethod
+    def from_new_kernel(cls, debug_level = 0, **kw):
+        from .KernelLink import WrappedKernelLink
+        return cls(WrappedKernelLink.from_new_kernel(debug_level = debug_level), **kw)
+
+    @property
+    def M(self):
+        return self.link.M
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.link)
+
+    ###########################################################################################
+    #                                      Public API                                         #
+    ###########################################################################################
+
+    def evaluate(self, expr, timeout = None):
+        """Evaluates expr on the kernel. Await the result to get the answer.
+
+        :param expr:
+        :param timeout: seconds before the evaluation is interrupted and the future gets a TimeoutError, as for KernelLink.evaluate
+        :return:
+        """
+        return self.submit(self.link._evaluate, expr, timeout = timeout)
+
+    def evaluate_string(self, expr, timeout = None, **opts):
+        """Evaluates the string expr as input on the kernel
+
+        :param expr:
+        :param timeout:
+        :param opts: options for ToExpression
+        :return:
+        """
+        return self.submit(self.link._evaluate, self.M.ToExpression(expr, **opts), timeout = timeout)
+
+    def evaluate_many(self, exprs, window = None, collect = False, timeout = None):
+        """Awaitable version of KernelLink.evaluate_many
+
+        :param exprs:
+        :param window:
+        :param collect:
+        :param timeout:
+        :return:
+        """
+        return self.submit(self.link._evaluateMany, list(exprs), window = window, collect = collect, timeout = timeout)
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the I/O thread, giving back a future for the result on the running loop
+
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        import asyncio
+
+        if self._closed:
+            raise MathLinkException("LinkIsNull", "{} is closed".format(type(self).__name__))
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._ensureThread()
+        self._jobs.put((fn, args, kwargs, fut, loop))
+        return fut
+
+    async def packets(self):
+        """Yields a KernelPacket for each packet the kernel sends, whether in the course of an evaluation
+(Message, Text, Return, ...) or on its own. As with evaluate_stream, a Message packet's content is (symbol, tag).
+
+        :return:
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        pkts = asyncio.Queue()
+        sub = (loop, pkts)
+        with self._subscriber_lock:
+            self._subscribers.append(sub)
+        self._ensureThread()
+        self._jobs.put(None) # wakes up the I/O thread so it starts listening
+        try:
+            while True:
+                pkt = await pkts.get()
+                if pkt is None:
+                    break
+                yield pkt
+        finally:
+            with self._subscriber_lock:
+                if sub in self._subscribers:
+                    self._subscribers.remove(sub)
+
+    def close(self, close_link = True):
+        """Stops the I/O thread once the jobs already submitted are done, optionally closing the link too
+
+        :param close_link:
+        :return:
+        """
+        if not self._closed:
+            self._closed = True
+            self._jobs.put(self._STOP)
+            thread = self._thread
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+            self.link.removePacketListener(self._packetArrived)
+            with self._subscriber_lock:
+                subs = self._subscribers
+                self._subscribers = []
+            for loop, pkts in subs:
+                loop.call_soon_threadsafe(pkts.put_nowait, None)
+            if close_link:
+                self.link.close()
+
+    ###########################################################################################
+    #                                      I/O thread                                         #
+    ###########################################################################################
+
+    _STOP = object()
+
+    def _ensureThread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target = self._run, name = "PJLinkAsyncIO", daemon = True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            # only wake up on a timer when there's someone to hand unprompted packets to
+            timeout = self.poll_interval if len(self._subscribers) > 0 else None
+            try:
+                job = self._jobs.get(timeout = timeout)
+            except queue.Empty:
+                job = None
+
+            if job is self._STOP:
+                break
+            elif job is None:
+                if len(self._subscribers) > 0:
+                    self._drainPackets()
+                continue
+
+            fn, args, kwargs, fut, loop = job
+            if fut.cancelled():
+                continue
+            try:
+                res = fn(*args, **kwargs)
+            except BaseException as e:
+                loop.call_soon_threadsafe(self._resolve, fut, None, e)
+            else:
+                loop.call_soon_threadsafe(self._resolve, fut, res, None)
+
+    @staticmethod
+    def _resolve(fut, res, exc):
+        if not fut.done():
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(res)
+
+    def _drainPackets(self):
+        link = self.link
+        try:
+            while link.ready:
+                pkt = link._nextPacket()
+                if link.notifyPacketListeners(pkt):
+                    link._handlePacket(pkt)
+                link._newPacket()
+        except MathLinkException:
+            link._clearError()
+            Env.log_tb()
+
+    def _packetArrived(self, evt):
+        # packet listener, called on the I/O thread with the link sitting at the start of the packet contents
+        if len(self._subscribers) > 0:
+            name = Env.getPacketName(evt.packet)
+            try:
+                if name == "Message":
+                    content = (evt.link.get(), evt.link.get()) # MessagePacket[symbol, "tag"], as in evaluate_stream
+                else:
+                    content = evt.link.get()
+            except MathLinkException:
+                evt.link._clearError()
+                content = None
+            pkt = KernelPacket(name, content)
+            with self._subscriber_lock:
+                subs = tuple(self._subscribers)
+            for loop, pkts in subs:
+                loop.call_soon_threadsafe(pkts.put_nowait, pkt)
+        return True
@@ -0,0 +1,339 @@
+"""CallExecutor runs independent CallPython requests on a thread pool so that a slow one doesn't hold up the rest,
+and CPU-bound ones on a pool of worker processes so they aren't held up by the GIL
+
+"""
+
+import threading, itertools, traceback
+from collections import OrderedDict
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import BufferedNDArray
+
+###############################################################################################
+#                                                                                             #
+#                                        CallExecutor                                         #
+#                                                                                             #
+###############################################################################################
+
+class CallExecutor:
+    """Hands calls off to a concurrent.futures thread pool and keeps their results, in the order they finish,
+until they're collected (or, once more than max_results are waiting, the oldest are dropped, so calls nobody
+collects don't pile up). Submitting gives back a ticket straight away, so the link is free to take the next call
+while the first one is still running. Calls made this way run off the link's thread, so they can't call back
+into Mathematica.
+
+Calls submitted with process = True go to a ProcessPoolExecutor instead, whose workers are all started up front
+and import Env.CALL_PROCESS_PRELOAD once when they do. The function has to be picklable (i.e. defined at the top
+level of a module) and large array arguments are passed through shared memory rather than pickled.
+
+    ticket = executor.submit(lookup, ("key", ), {})
+    ...
+    for ticket, ok, value in executor.collect(timeout = 1):
+        ...
+
+    """
+
+    def __init__(self, max_workers = None, max_processes = None, preload = None, max_results = None):
+        """
+        :param max_workers: the size of the thread pool, defaults to Env.CALL_POOL_SIZE
+        :param max_processes: the size of the process pool, defaults to Env.CALL_PROCESS_POOL_SIZE
+        :param preload: the modules the worker processes import, defaults to Env.CALL_PROCESS_PRELOAD
+        :param max_results: how many uncollected results to hold on to, defaults to Env.CALL_RESULTS_SIZE
+        """
+        self.max_workers = Env.CALL_POOL_SIZE if max_workers is None else max_workers
+        self.max_processes = Env.CALL_PROCESS_POOL_SIZE if max_processes is None else max_processes
+        self.preload = tuple(Env.CALL_PROCESS_PRELOAD if preload is None else preload)
+        self.max_results = Env.CALL_RESULTS_SIZE if max_results is None else max_results
+        self.dropped = 0
+        self._pool = None
+        self._process_pool = None
+        self._tickets = itertools.count(1)
+        self._running = set()
+        self._done = OrderedDict() # ticket -> (ok, value), in the order the calls finished
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return "{}(max_workers={}, running={}, done={})".format(
+            type(self).__name__, self.max_workers, len(self._running), len(self._done)
+        )
+
+    def submit(self, fn, args = (), kwargs = None, process = False):
+        """Starts fn(*args, **kwargs) on the pool
+
+        :param fn:
+        :param args:
+        :param kwargs:
+        :param process: whether to run fn in a worker process rather than a thread
+        :return: the ticket to collect the result with
+        """
+        with self._cond:
+            ticket = next(self._tickets)
+            self._running.add(ticket)
+        kwargs = {} if kwargs is None else kwargs
+        if process:
+            try:
+                fut, shared = self._submitToProcess(fn, args, kwargs)
+            except Exception as e:
+                self._finish(ticket, (False, self._formatException(e)))
+            else:
+                fut.add_done_callback(lambda f: self._finishProcess(ticket, f, shared))
+        else:
+            self.thread_pool.submit(self._run, ticket, fn, args, kwargs)
+        return ticket
+
+    def call(self, fn, args = (), kwargs = None):
+        """Runs fn(*args, **kwargs) in a worker process and waits for it
+
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        fut, shared = self._submitToProcess(fn, args, {} if kwargs is None else kwargs)
+        try:
+            return fut.result()
+        finally:
+            _SharedArray.release(shared)
+
+    @property
+    def thread_pool(self):
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            with self._cond:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = "PJLinkCall")
+        return self._pool
+
+    @property
+    def process_pool(self):
+        if self._process_pool is None:
+            import os, multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            with self._cond:
+                if self._process_pool is None:
+                    n = self.max_processes or os.cpu_count() or 1
+                    try:
+                        # forking copies the link's threads and file descriptors into the worker, so they're started clean
+                        ctx = multiprocessing.get_context("forkserver")
+                    except ValueError: # no forkserver on Windows
+                        ctx = multiprocessing.get_context("spawn")
+                    pool = ProcessPoolExecutor(
+                        max_workers = n,
+                        mp_context = ctx,
+                        initializer = _startWorker,
+                        initargs = (self.preload, )
+                    )
+                    # workers get started as jobs come in, so this gets them all going (and preloaded) up front
+                    for f in [ pool.submit(_noop) for i in range(n) ]:
+                        f.result()
+                    self._process_pool = pool
+        return self._process_pool
+
+    def _submitToProcess(self, fn, args, kwargs):
+        shared = []
+        args = tuple(_SharedArray.share(a, shared) for a in args)
+        kwargs = { k : _SharedArray.share(v, shared) for k, v in kwargs.items() }
+        try:
+            return self.process_pool.submit(_runInWorker, fn, args, kwargs), shared
+        except Exception:
+            _SharedArray.release(shared)
+            raise
+
+    def _run(self, ticket, fn, args, kwargs):
+        try:
+            res = (True, fn(*args, **kwargs))
+        except Exception as e:
+            if Env.LOG_INFO:
+                Env.logf("Call {} failed with {}", ticket, e, level = "Info")
+            res = (False, self._formatException(e))
+        self._finish(ticket, res)
+
+    def _finishProcess(self, ticket, fut, shared):
+        _SharedArray.release(shared)
+        try:
+            res = (True, fut.result())
+        except Exception as e:
+            res = (False, self._formatException(e))
+        self._finish(ticket, res)
+
+    def _finish(self, ticket, res):
+        with self._cond:
+            self._running.discard(ticket)
+            self._done[ticket] = res
+            while len(self._done) > self.max_results:
+                old, _ = self._done.popitem(last = False)
+                self.dropped += 1
+                if Env.LOG_INFO:
+                    Env.logf("Dropping the uncollected result of call {}", old, level = "Info")
+            self._cond.notify_all()
+
+    @staticmethod
+    def _formatException(e):
+        return "".join(traceback.format_exception(type(e), e, e.__traceback__))
+
+    def collect(self, tickets = None, timeout = None):
+        """Takes the results that are ready, waiting up to timeout for at least one if none are
+
+        :param tickets: the tickets to collect, defaults to all of them
+        :param timeout: how long to wait, None waiting for as long as it takes
+        :return: a list of (ticket, ok, value), in the order the calls finished, where value is the traceback if ok is False
+        """
+        if tickets is not None:
+            tickets = set(tickets)
+        with self._cond:
+            def ready():
+                if tickets is None:
+                    return len(self._done) > 0 or not self._running
+                return any(t in self._done for t in tickets) or not (tickets & self._running)
+            self._cond.wait_for(ready, timeout = timeout)
+            res = []
+            for ticket in list(self._done):
+                if tickets is None or ticket in tickets:
+                    ok, value = self._done.pop(ticket)
+                    res.append((ticket, ok, value))
+            return res
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._running)
+
+    def close(self, wait = False):
+        pool = self._pool
+        self._pool = None
+        if pool is not None:
+            pool.shutdown(wait = wait)
+        pool = self._process_pool
+        self._process_pool = None
+        if pool is not None:
+            pool.shutdown(wait = wait)
+
+class ProcessCall:
+    """Marks a callable registered on a KernelLink as CPU-bound, so that PyCall runs it in a worker process"""
+    __slots__ = ("fn", )
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.fn)
+
+###############################################################################################
+#                                                                                             #
+#                                        _SharedArray                                         #
+#                                                                                             #
+###############################################################################################
+
+class _SharedArray:
+    """Stands in for an array argument that has been copied into a multiprocessing.shared_memory block"""
+    __slots__ = ("name", "shape", "dtype", "offsets", "buffered")
+
+    def __init__(self, name, shape, dtype, offsets = (0, 0), buffered = False):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.offsets = offsets
+        self.buffered = buffered
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype, self.offsets, self.buffered)
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype, self.offsets, self.buffered = state
+
+    @classmethod
+    def share(cls, arg, shared):
+        """Copies arg into shared memory if it's a big enough array, adding the block to shared
+
+        :param arg:
+        :param shared: the list of blocks to release once the call is done
+        :return: the _SharedArray, or arg as is
+        """
+        from multiprocessing import shared_memory
+
+        if isinstance(arg, BufferedNDArray):
+            buff = arg._buffer
+            nbytes = len(buff) * buff.itemsize
+            if nbytes < Env.SHARED_MEMORY_THRESHOLD:
+                return arg
+            shm = shared_memory.SharedMemory(create = True, size = nbytes)
+            shared.append(shm)
+            shm.buf[:nbytes] = memoryview(buff).cast("B")
+            return cls(shm.name, arg.shape, buff.typecode, arg.offsets, buffered = True)
+
+        if Env.HAS_NUMPY:
+            import numpy
+            if isinstance(arg, numpy.ndarray) and arg.dtype != object and arg.nbytes >= Env.SHARED_MEMORY_THRESHOLD:
+                shm = shared_memory.SharedMemory(create = True, size = arg.nbytes)
+                shared.append(shm)
+                numpy.ndarray(arg.shape, dtype = arg.dtype, buffer = shm.buf)[...] = arg
+                return cls(shm.name, arg.shape, arg.dtype.str)
+
+        return arg
+
+    def attach(self, attached):
+        """Gets the array back in a worker, adding the block to attached
+
+        :param attached:
+        :return:
+        """
+        from multiprocessing import shared_memory
+
+        # workers share the parent's resource tracker, so the block stays registered to it just the once
+        shm = shared_memory.SharedMemory(name = self.name)
+        attached.append(shm)
+        if self.buffered:
+            import array
+            from functools import reduce
+            from operator import mul
+            buff = array.array(self.dtype)
+            n = reduce(mul, self.shape, 1) + sum(self.offsets)
+            buff.frombytes(shm.buf[:n * buff.itemsize])
+            return BufferedNDArray(buff, self.shape, self.offsets)
+        import numpy
+        return numpy.ndarray(self.shape, dtype = self.dtype, buffer = shm.buf)
+
+    @staticmethod
+    def release(shared):
+        for shm in shared:
+            try:
+                shm.close()
+                shm.unlink()
+            except (OSError, BufferError):
+                pass
+        del shared[:]
+
+def _startWorker(preload):
+    import importlib
+    for mod in preload:
+        try:
+            importlib.import_module(mod)
+        except ImportError:
+            traceback.print_exc()
+
+def _noop():
+    pass
+
+def _runInWorker(fn, args, kwargs):
+    attached = []
+    try:
+        args = [ a.attach(attached) if isinstance(a, _SharedArray) else a for a in args ]
+        kwargs = { k : v.attach(attached) if isinstance(v, _SharedArray) else v for k, v in kwargs.items() }
+        res = fn(*args, **kwargs)
+        if attached and Env.HAS_NUMPY:
+            import numpy
+            # the shared blocks go away once the call is done, so anything that still points into them gets copied
+            if isinstance(res, numpy.ndarray) and any(
+                    isinstance(a, numpy.ndarray) and numpy.shares_memory(res, a) for a in args + list(kwargs.values())
+            ):
+                res = res.copy()
+        return res
+    finally:
+        args = kwargs = None
+        for shm in attached:
+            try:
+                shm.close()
+            except BufferError:
+                # fn held on to a view, the block goes away when the worker does
+                pass
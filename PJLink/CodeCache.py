@@ -0,0 +1,82 @@
+"""CodeCache keeps the code CallPython packets run compiled, so the same snippet isn't compiled over and over
+
+"""
+
+import threading
+from collections import OrderedDict
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+
+###############################################################################################
+#                                                                                             #
+#                                          CodeCache                                          #
+#                                                                                             #
+###############################################################################################
+
+class CodeCache:
+    """An LRU from Python source to its compiled code object, used for the code CallPython packets ask for.
+The decision between eval and exec is made once, when the source is first compiled, and remembered with it.
+
+    """
+
+    def __init__(self, max_entries = None):
+        """
+        :param max_entries: the most code objects to keep, defaults to Env.CODE_CACHE_SIZE
+        """
+        self.max_entries = Env.CODE_CACHE_SIZE if max_entries is None else max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # source -> (code, is_expression)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "{}(entries={}, max_entries={}, hits={}, misses={})".format(
+            type(self).__name__, len(self), self.max_entries, self.hits, self.misses
+        )
+
+    def compile(self, src):
+        """Compiles src, as an expression if it's a single line that parses as one and as statements otherwise
+
+        :param src:
+        :return: a (code, is_expression) pair
+        """
+        with self._lock:
+            entry = self._entries.get(src)
+            if entry is not None:
+                self._entries.move_to_end(src)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = None
+        if "\n" not in src:
+            try:
+                entry = (compile(src, "<PJLink>", "eval"), True)
+            except SyntaxError:
+                pass
+        if entry is None:
+            entry = (compile(src, "<PJLink>", "exec"), False)
+
+        with self._lock:
+            self._entries[src] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+        return entry
+
+    def run(self, src, env):
+        """Runs src in env, giving back the value if it's an expression and None otherwise
+
+        :param src:
+        :param env:
+        :return:
+        """
+        code, is_expression = self.compile(src)
+        if is_expression:
+            return eval(code, env, env)
+        exec(code, env, env)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,178 @@
+"""DeadlineScheduler runs timed callbacks off a single shared thread, so that timeouts don't cost a thread apiece
+
+"""
+
+import threading, heapq, itertools, time
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+
+###############################################################################################
+#                                                                                             #
+#                                      DeadlineScheduler                                      #
+#                                                                                             #
+###############################################################################################
+
+class ScheduledCall:
+    """A handle on a callback waiting in a DeadlineScheduler"""
+    __slots__ = ("deadline", "fn", "args", "state")
+
+    PENDING   = 0
+    RUNNING   = 1
+    CANCELLED = 2
+
+    def __init__(self, deadline, fn, args):
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.state = self.PENDING
+
+    @property
+    def fired(self):
+        return self.state == self.RUNNING
+
+    def __repr__(self):
+        return "{}({}, in {:.3f}s)".format(type(self).__name__, self.fn, self.deadline - time.monotonic())
+
+class DeadlineScheduler:
+    """Keeps a heap of ScheduledCalls and a single daemon thread that sleeps until the earliest of them is due.
+Callbacks run on that thread, so they should be quick (e.g. putting a message on a link) and not block.
+
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count() # breaks ties between equal deadlines
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @classmethod
+    def shared(cls):
+        """The scheduler everything in PJLink uses, created the first time it's asked for
+
+        :return:
+        """
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, delay, fn, *args):
+        """Calls fn(*args) on the scheduler thread after delay seconds
+
+        :param delay:
+        :param fn:
+        :param args:
+        :return: a ScheduledCall that can be passed to cancel
+        """
+        call = ScheduledCall(time.monotonic() + max(delay, 0), fn, args)
+        with self._cond:
+            heapq.heappush(self._heap, (call.deadline, next(self._counter), call))
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run, name = "PJLinkDeadlines", daemon = True)
+                self._thread.start()
+            elif self._heap[0][2] is call:
+                self._cond.notify()
+        return call
+
+    def cancel(self, call):
+        """Cancels call if it hasn't started running yet
+
+        :param call:
+        :return: whether it was cancelled, False meaning it has already fired (or been cancelled)
+        """
+        with self._cond:
+            if call.state == call.PENDING:
+                # the entry stays in the heap and is skipped when it comes due
+                call.state = call.CANCELLED
+                return True
+            return False
+
+    def _run(self):
+        heap = self._heap
+        cond = self._cond
+        while True:
+            with cond:
+                while True:
+                    while heap and heap[0][2].state == ScheduledCall.CANCELLED:
+                        heapq.heappop(heap)
+                    if not heap:
+                        cond.wait()
+                        continue
+                    wait = heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        call = heapq.heappop(heap)[2]
+                        call.state = call.RUNNING
+                        break
+                    cond.wait(wait)
+            try:
+                call.fn(*call.args)
+            except Exception:
+                Env.log_tb()
+
+###############################################################################################
+#                                                                                             #
+#                                     EvaluationDeadline                                      #
+#                                                                                             #
+###############################################################################################
+
+class EvaluationDeadline:
+    """Enforces a timeout on an evaluation running on link. Once the deadline passes, the steps in
+Env.EVALUATION_ESCALATION are taken one after another, each after its grace period, until the kernel gives up
+the evaluation: interrupt, then abort, then terminate the kernel outright. Leaving the with block calls
+off whatever hasn't happened yet.
+
+    with EvaluationDeadline(link, 5) as deadline:
+        link.waitForAnswer()
+        res = link.get()
+    if deadline.expired:
+        ...
+
+    """
+
+    def __init__(self, link, timeout, escalation = None, scheduler = None):
+        """
+        :param link: the KernelLink the evaluation is running on
+        :param timeout: the number of seconds before the first step is taken
+        :param escalation: (method name, grace period) pairs, defaults to Env.EVALUATION_ESCALATION
+        :param scheduler: the DeadlineScheduler to use, defaults to the shared one
+        """
+        self.link = link
+        self.timeout = timeout
+        self.escalation = tuple(Env.EVALUATION_ESCALATION if escalation is None else escalation)
+        self.scheduler = DeadlineScheduler.shared() if scheduler is None else scheduler
+        self.steps_taken = []
+        self._call = None
+        self._done = False
+
+    @property
+    def expired(self):
+        return len(self.steps_taken) > 0
+
+    def __enter__(self):
+        self._done = False
+        self._call = self.scheduler.schedule(self.timeout, self._escalate, 0)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._done = True
+        call = self._call
+        if call is not None:
+            self.scheduler.cancel(call)
+            self._call = None
+
+    def _escalate(self, step):
+        # runs on the scheduler thread
+        if self._done or step >= len(self.escalation):
+            return
+        method, grace = self.escalation[step]
+        Env.logf("Evaluation on {} passed its deadline, taking step {}", self.link, method, level = "Info")
+        self.steps_taken.append(method)
+        getattr(self.link, method)()
+        if not self._done and step + 1 < len(self.escalation):
+            self._call = self.scheduler.schedule(self.escalation[step + 1][1], self._escalate, step + 1)
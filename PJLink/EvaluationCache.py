@@ -0,0 +1,243 @@
+"""EvaluationCache memoizes evaluations of side-effect free expressions so that repeated requests don't go back to the kernel
+
+"""
+
+import threading
+from collections import OrderedDict
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import MLExpr, MLSym
+from .ExprProgram import ExprProgram
+
+###############################################################################################
+#                                                                                             #
+#                                       EvaluationCache                                       #
+#                                                                                             #
+###############################################################################################
+
+class EvaluationCache:
+    """A size-bounded LRU of evaluation results, keyed on a structural hash of the expression sent to the kernel.
+Only expressions where every head has been marked with pure (or is inert, like List or Rule) are cached, since
+anything else might give a different answer next time. Entries remember the symbols their expression mentions so they can be invalidated by symbol
+or by context when the definitions behind them change.
+
+    cache = link.enable_cache(pure = ("ExportString", "Rasterize"))
+    link.evaluate(M.ExportString(data, "PNG")) # goes to the kernel
+    link.evaluate(M.ExportString(data, "PNG")) # doesn't
+    link.invalidate(context = "Dashboard`")
+
+    """
+
+    inert_heads = frozenset((
+        "List", "Rule", "RuleDelayed", "Association", "Rational", "Complex",
+        "Hold", "HoldComplete", "Unevaluated", "Missing"
+    ))
+
+    def __init__(self, max_bytes = None, pure = ()):
+        """
+        :param max_bytes: the bound on the total size of the cached keys and results, defaults to Env.EVALUATION_CACHE_BYTES
+        :param pure: the heads to start out marked pure
+        """
+        if max_bytes is None:
+            max_bytes = Env.EVALUATION_CACHE_BYTES
+        self.max_bytes = max_bytes
+        self.pure_heads = set()
+        self.pure(*pure)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # digest -> (result, size, symbols)
+        self._by_symbol = {} # symbol name -> set of digests
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "{}(entries={}, nbytes={}, max_bytes={}, hits={}, misses={})".format(
+            type(self).__name__, len(self), self.nbytes, self.max_bytes, self.hits, self.misses
+        )
+
+    def pure(self, *heads):
+        """Marks heads as safe to cache in this cache, i.e. evaluating them twice on the same arguments gives the same answer.
+Can be called directly, cache.pure("ExportString", M.Rasterize), or used as a decorator on a function that
+builds expressions, in which case the heads of the expressions it returns are marked as they come back.
+
+    @cache.pure
+    def thumbnail(img):
+        return M.Rasterize(img, ImageSize = 200)
+
+        :param heads: head names or MLSyms, or a single function to decorate
+        :return:
+        """
+        if len(heads) == 1 and callable(heads[0]) and not isinstance(heads[0], (str, MLSym)):
+            import functools
+
+            fn = heads[0]
+            @functools.wraps(fn)
+            def pure_fn(*args, **kwargs):
+                expr = fn(*args, **kwargs)
+                if isinstance(expr, MLExpr) and isinstance(expr.head, (str, MLSym)):
+                    self.pure(expr.head)
+                return expr
+            return pure_fn
+
+        for head in heads:
+            if isinstance(head, MLSym):
+                head = head.name
+            self.pure_heads.add(head)
+
+    def cacheable(self, expr):
+        """Whether evaluations of expr can be cached, i.e. whether every head in it has been marked pure or is inert.
+Checking only the outermost head isn't enough: Lookup[assoc, RandomReal[]] is different every time.
+
+        :param expr:
+        :return:
+        """
+        if not isinstance(expr, MLExpr):
+            return False
+        pure_heads, inert_heads = self.pure_heads, self.inert_heads
+        stack = [ expr ]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, MLExpr):
+                head = e.head
+                if isinstance(head, MLSym):
+                    head = head.name
+                if isinstance(head, str):
+                    if head not in pure_heads and head not in inert_heads:
+                        return False
+                elif isinstance(head, MLExpr):
+                    stack.append(head)
+                else:
+                    return False
+                stack.extend(e.args)
+            elif isinstance(e, (list, tuple)) and not isinstance(e, MLSym):
+                stack.extend(e)
+            elif isinstance(e, dict):
+                stack.extend(e.keys())
+                stack.extend(e.values())
+        return True
+
+    def key(self, expr, sent = None):
+        """Works out the cache key for evaluating expr
+
+        :param expr: the expression as the caller gave it, used to decide whether it's cacheable
+        :param sent: the expression actually sent to the kernel (i.e. after _add_type_hints), which the key is built from
+        :return: a (digest, symbols, size) key, or None if the evaluation can't be cached
+        """
+        if not self.cacheable(expr):
+            return None
+        prog = ExprProgram.compile(expr if sent is None else sent)
+        if prog is None:
+            return None
+        return (prog.digest(), frozenset(prog.symbols()), prog.nbytes)
+
+    def get(self, key, default = None):
+        """Looks up the cached result for key, marking it as recently used.
+Hits are copies (or, for NumPy arrays, read-only), so callers can't change what's cached out from under each other.
+
+        :param key: a key from key()
+        :param default: what to return on a miss
+        :return:
+        """
+        digest = key[0]
+        with self._lock:
+            try:
+                entry = self._entries[digest]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            result = entry[0]
+        return self._copyOf(result)
+
+    def put(self, key, result):
+        """Caches result under key, evicting the least recently used entries to make room
+
+        :param key: a key from key()
+        :param result:
+        :return:
+        """
+        digest, symbols, key_size = key
+        size = key_size + self._sizeOf(result)
+        if size > self.max_bytes:
+            return
+        # the caller keeps result, so the cache holds on to its own copy
+        result = self._copyOf(result, freeze = True)
+        with self._lock:
+            self._drop(digest)
+            self._entries[digest] = (result, size, symbols)
+            self.nbytes += size
+            for sym in symbols:
+                self._by_symbol.setdefault(sym, set()).add(digest)
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, symbol = None, context = None):
+        """Drops the entries whose expressions mention symbol or any symbol in context.
+Symbols sent without a context are taken to live in Global`. With no arguments this clears the cache.
+
+        :param symbol: a symbol name or MLSym; without a context it matches the symbol in any context
+        :param context: a context name like "Dashboard`"
+        :return: the number of entries dropped
+        """
+        if symbol is None and context is None:
+            with self._lock:
+                n = len(self._entries)
+                self._entries.clear()
+                self._by_symbol.clear()
+                self.nbytes = 0
+            return n
+
+        if isinstance(symbol, MLSym):
+            symbol = symbol.name
+        with self._lock:
+            drop = set()
+            for name, digests in self._by_symbol.items():
+                if symbol is not None and (name == symbol or ("`" not in symbol and name.rsplit("`", 1)[-1] == symbol)):
+                    drop.update(digests)
+                elif context is not None and (name.startswith(context) or (context == "Global`" and "`" not in name)):
+                    drop.update(digests)
+            for digest in drop:
+                self._drop(digest)
+        return len(drop)
+
+    def clear(self):
+        return self.invalidate()
+
+    def _drop(self, digest):
+        # called with the lock held
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            result, size, symbols = entry
+            self.nbytes -= size
+            for sym in symbols:
+                digests = self._by_symbol.get(sym)
+                if digests is not None:
+                    digests.discard(digest)
+                    if not digests:
+                        del self._by_symbol[sym]
+
+    @staticmethod
+    def _copyOf(result, freeze = False):
+        # read-only arrays are shared as is, everything else gets copied
+        if Env.HAS_NUMPY:
+            import numpy
+            if isinstance(result, numpy.ndarray) and result.dtype != object:
+                if freeze:
+                    result = result.copy()
+                    result.setflags(write = False)
+                return result
+        if isinstance(result, (str, bytes, int, float, complex, bool, MLSym)) or result is None:
+            return result
+        import copy
+        return copy.deepcopy(result)
+
+    @staticmethod
+    def _sizeOf(result):
+        prog = ExprProgram.compile(result)
+        if prog is not None:
+            return prog.nbytes
+        import sys
+        return sys.getsizeof(result)
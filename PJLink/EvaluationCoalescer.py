@@ -0,0 +1,129 @@
+"""EvaluationCoalescer merges small evaluations coming in from different threads into a single round-trip to the kernel
+
+"""
+
+import threading
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .MathLinkExceptions import MathLinkException
+from .HelperClasses import MLExpr, MLSym, MPackage
+
+###############################################################################################
+#                                                                                             #
+#                                    EvaluationCoalescer                                      #
+#                                                                                             #
+###############################################################################################
+
+class EvaluationCoalescer:
+    """Nagle-style batching for KernelLink.evaluate. The first caller to come along becomes the leader for a batch:
+it waits up to window seconds (or until max_items callers have joined), then waits for any batch already
+in flight, and sends everything that has piled up as one EvaluatePacket[List[...]]. Each item is wrapped in
+PyCoalescedItem, which stops aborts and throws at the item, so one going wrong doesn't take down the rest and
+each caller gets back the same value it would have gotten evaluating on its own.
+
+    link.enable_coalescing(window = .002)
+    # any number of threads
+    link.evaluate(M.Lookup(table, key))
+
+    """
+
+    def __init__(self, link, window = None, max_items = None):
+        """
+        :param link: the KernelLink to evaluate on
+        :param window: seconds the leader waits for more callers, defaults to Env.COALESCE_WINDOW
+        :param max_items: the most items in a batch, defaults to Env.COALESCE_MAX_ITEMS
+        """
+        self.link = link
+        self.window = Env.COALESCE_WINDOW if window is None else window
+        self.max_items = max(int(Env.COALESCE_MAX_ITEMS if max_items is None else max_items), 1)
+        self.batches = 0
+        self.items = 0
+        self._pending = [] # (expr, Future) pairs waiting to go out
+        self._leading = False
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+
+    def __repr__(self):
+        return "{}(window={}, max_items={}, batches={}, items={})".format(
+            type(self).__name__, self.window, self.max_items, self.batches, self.items
+        )
+
+    def evaluate(self, expr):
+        """Evaluates expr as part of the next batch
+
+        :param expr:
+        :return:
+        """
+        from concurrent.futures import Future
+
+        fut = Future()
+        with self._cond:
+            self._pending.append((expr, fut))
+            lead = not self._leading
+            if lead:
+                self._leading = True
+            elif len(self._pending) >= self.max_items:
+                self._cond.notify_all()
+        if lead:
+            self._lead()
+        return fut.result()
+
+    def _lead(self):
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._pending) >= self.max_items, timeout = self.window)
+        # while the previous batch is still out, this one keeps filling up
+        with self._send_lock:
+            more = True
+            while more:
+                with self._cond:
+                    batch = self._pending[:self.max_items]
+                    del self._pending[:self.max_items]
+                    more = len(self._pending) > 0
+                    if not more:
+                        # anyone who shows up from here on starts the next batch
+                        self._leading = False
+                self._send(batch)
+
+    def _send(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+
+        # even a batch of one goes out wrapped, so a caller sees the same thing whether or not anyone joined it
+        link = self.link
+        try:
+            res = link._dispatchEvaluation(MLExpr(MLSym("List"), tuple(self._isolate(expr) for expr, fut in batch)))
+        except Exception as e:
+            for expr, fut in batch:
+                fut.set_exception(e)
+            return
+
+        if isinstance(res, MLExpr) and self._headName(res) == "List":
+            res = res.args
+        if isinstance(res, (MLSym, MLExpr)) or not isinstance(res, (list, tuple)) or len(res) != len(batch):
+            # the items have (or might have) been evaluated already, so they can't just be sent again
+            exc = MathLinkException("WrappedException", "coalesced batch of {} came back as {}".format(len(batch), res))
+            for expr, fut in batch:
+                fut.set_exception(exc)
+        else:
+            for (expr, fut), r in zip(batch, res):
+                fut.set_result(self._unwrap(r))
+
+    @staticmethod
+    def _isolate(expr):
+        # PyCoalescedItem (see PJLink.wl) holds its argument, stops aborts and throws at the item,
+        # and adds the item's type hints
+        return MLExpr(MLSym(MPackage.PackagePackage + "PyCoalescedItem"), (expr, ))
+
+    @staticmethod
+    def _headName(expr):
+        head = expr.head
+        if isinstance(head, MLSym):
+            head = head.name
+        return head if isinstance(head, str) else None
+
+    @classmethod
+    def _unwrap(cls, res):
+        if isinstance(res, MLExpr) and len(res.args) == 1:
+            head = cls._headName(res)
+            if head is not None and head.endswith("PyCoalescedResult"):
+                return res.args[0]
+        return res
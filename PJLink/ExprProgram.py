@@ -0,0 +1,289 @@
+"""ExprProgram flattens an expression tree (MLExpr, MLSym, scalars, arrays) into a compact token program
+that a link can write out in one go, rather than walking the tree and dispatching a put per node"""
+
+from array import array
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import MLExpr, MLSym, BufferedNDArray
+
+###############################################################################################
+#                                                                                             #
+#                                         ExprProgram                                         #
+#                                                                                             #
+###############################################################################################
+
+class ExprProgram:
+    """A flattened expression. The program is a sequence of opcodes plus the data they consume, in order:
+
+    FUNCTION  -- takes an argument count from ints, then the head and the arguments follow as further ops
+    SYMBOL    -- takes a string table index from ints
+    STRING    -- takes a string table index from ints
+    INTEGER   -- takes its value from ints
+    REAL      -- takes its value from reals
+    ARRAY     -- takes an index into arrays, a packed 1D BufferedNDArray (or an N-dimensional array) put as a List
+
+Repeated strings and symbols share a single string table entry.
+    """
+
+    FUNCTION = 0
+    SYMBOL   = 1
+    STRING   = 2
+    INTEGER  = 3
+    REAL     = 4
+    ARRAY    = 5
+
+    class Uncompilable(Exception):
+        """Raised when an expression contains something that has to go through the general put machinery"""
+        pass
+
+    class _Exit:
+        __slots__ = ("handle",)
+        def __init__(self, handle):
+            self.handle = handle
+
+    def __init__(self):
+        self.ops = array('b')
+        self.ints = array('q')
+        self.reals = array('d')
+        self.strings = []
+        self.arrays = []
+        self._string_ids = {}
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __repr__(self):
+        return "{}(ops={}, strings={}, arrays={})".format(type(self).__name__, len(self.ops), len(self.strings), len(self.arrays))
+
+    @classmethod
+    def compiled_types(cls):
+        """The types compile handles itself, rather than leaving them to a link's putters
+
+        :return:
+        """
+
+        types = (str, MLSym, bool, int, float, complex, bytes, bytearray, MLExpr, list, tuple, BufferedNDArray)
+        if Env.HAS_NUMPY:
+            import numpy as np
+            types = types + (np.ndarray, )
+        return types
+
+    @classmethod
+    def compile(cls, expr, skip = frozenset()):
+        """Compiles expr into an ExprProgram, returning None if it contains objects that can't be compiled
+
+        :param expr:
+        :param skip: types to treat as uncompilable, e.g. ones a link has its own putters registered for
+        :return:
+        """
+
+        prog = cls()
+        try:
+            prog._compile(expr, skip)
+        except (cls.Uncompilable, OverflowError):
+            prog = None
+        return prog
+
+    def _string(self, op, s):
+        try:
+            idx = self._string_ids[s]
+        except KeyError:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self._string_ids[s] = idx
+        self.ops.append(op)
+        self.ints.append(idx)
+
+    def _function(self, head, argc):
+        self.ops.append(self.FUNCTION)
+        self.ints.append(argc)
+        self._string(self.SYMBOL, head)
+
+    def _packed(self, o):
+        # flat lists of only floats or only ints get sent as a single packed array
+        if len(o) == 0:
+            return None
+        t = type(o[0])
+        if t is float and all(type(x) is float for x in o):
+            return BufferedNDArray(array('d', o), [ len(o) ])
+        elif t is int and all(type(x) is int for x in o):
+            try:
+                return BufferedNDArray(array('l', o), [ len(o) ])
+            except OverflowError:
+                return None
+        else:
+            return None
+
+    def _array(self, o):
+        self.ops.append(self.ARRAY)
+        self.ints.append(len(self.arrays))
+        self.arrays.append(o)
+
+    def _compile(self, expr, skip):
+        import math
+
+        np_array = None
+        if Env.HAS_NUMPY:
+            import numpy as np
+            np_array = np.ndarray
+
+        ops = self.ops
+        ints = self.ints
+        reals = self.reals
+        todo = [ expr ]
+        active = set() # containers we're currently inside of, to catch circular references
+
+        while todo:
+            o = todo.pop()
+            t = type(o)
+            if t is self._Exit:
+                active.discard(o.handle)
+            elif t in skip:
+                raise self.Uncompilable(o)
+            elif t is str:
+                self._string(self.STRING, o)
+            elif t is MLSym:
+                self._string(self.SYMBOL, o.name)
+            elif t is bool:
+                self._string(self.SYMBOL, "True" if o else "False")
+            elif o is None:
+                self._string(self.SYMBOL, "Null")
+            elif t is int:
+                ints.append(o) # raises OverflowError for ints that don't fit in 64 bits
+                ops.append(self.INTEGER)
+            elif t is float:
+                if math.isnan(o):
+                    self._string(self.SYMBOL, "Indeterminate")
+                elif math.isinf(o):
+                    if o > 0:
+                        self._string(self.SYMBOL, "Infinity")
+                    else:
+                        self._function("DirectedInfinity", 1)
+                        ops.append(self.INTEGER)
+                        ints.append(-1)
+                else:
+                    ops.append(self.REAL)
+                    reals.append(o)
+            elif t is complex:
+                self._function("Complex", 2)
+                ops.append(self.REAL)
+                reals.append(o.real)
+                ops.append(self.REAL)
+                reals.append(o.imag)
+            elif t is bytes or t is bytearray:
+                self._string(self.STRING, bytes(o).decode("latin-1"))
+            elif t is MLExpr or t is list or t is tuple:
+                # subclasses (MLFunction, namedtuples, ...) might have putters of their own, so they don't get this far
+                handle = id(o)
+                if handle in active:
+                    self._function("PJLink`RecursionError", 2)
+                    self._string(self.STRING, repr(o))
+                    self._string(self.STRING, str(handle))
+                    continue
+
+                if t is MLExpr:
+                    head, args = o.head, o.args
+                else:
+                    packed = self._packed(o)
+                    if packed is not None:
+                        self._array(packed)
+                        continue
+                    head, args = "List", o
+
+                active.add(handle)
+                todo.append(self._Exit(handle))
+                todo.extend(reversed(args))
+                if isinstance(head, MLSym):
+                    head = head.name
+                if isinstance(head, str):
+                    self._function(head, len(args))
+                else:
+                    ops.append(self.FUNCTION)
+                    ints.append(len(args))
+                    todo.append(head)
+            elif isinstance(o, BufferedNDArray) or (np_array is not None and isinstance(o, np_array) and o.ndim > 0 and o.dtype.kind in "iuf"):
+                self._array(o)
+            else:
+                raise self.Uncompilable(o)
+
+    def run(self, put_function, put_symbol, put_string, put_int, put_real, put_array):
+        """Writes out the program by way of the supplied putters
+
+        :param put_function: called with the argument count, the head follows as the next op
+        :param put_symbol:
+        :param put_string:
+        :param put_int:
+        :param put_real:
+        :param put_array:
+        :return:
+        """
+
+        strings = self.strings
+        arrays = self.arrays
+        ints = iter(self.ints)
+        reals = iter(self.reals)
+        FUNCTION, SYMBOL, STRING, INTEGER, REAL = self.FUNCTION, self.SYMBOL, self.STRING, self.INTEGER, self.REAL
+
+        for op in self.ops:
+            if op == SYMBOL:
+                put_symbol(strings[next(ints)])
+            elif op == FUNCTION:
+                put_function(next(ints))
+            elif op == STRING:
+                put_string(strings[next(ints)])
+            elif op == INTEGER:
+                put_int(next(ints))
+            elif op == REAL:
+                put_real(next(reals))
+            else:
+                put_array(arrays[next(ints)])
+
+    @property
+    def nbytes(self):
+        """A rough size for the program, counting its buffers and the data in its string table and arrays
+
+        :return:
+        """
+        size = self.ops.itemsize * len(self.ops) + self.ints.itemsize * len(self.ints) + self.reals.itemsize * len(self.reals)
+        size += sum(len(s) for s in self.strings)
+        for a in self.arrays:
+            size += a.data.nbytes if isinstance(a, BufferedNDArray) else a.nbytes
+        return size
+
+    def symbols(self):
+        """The names of all the symbols the program refers to
+
+        :return:
+        """
+        ints = iter(self.ints)
+        REAL, SYMBOL = self.REAL, self.SYMBOL
+        names = set()
+        for op in self.ops:
+            if op != REAL: # everything else takes its data from ints
+                i = next(ints)
+                if op == SYMBOL:
+                    names.add(self.strings[i])
+        return names
+
+    def digest(self):
+        """A structural hash of the program. Programs compiled from equal expressions have equal digests.
+
+        :return:
+        """
+        import hashlib
+
+        h = hashlib.blake2b(digest_size = 16)
+        h.update(self.ops.tobytes())
+        h.update(self.ints.tobytes())
+        h.update(self.reals.tobytes())
+        for s in self.strings:
+            b = s.encode("utf-8", "surrogatepass")
+            h.update(len(b).to_bytes(8, "little"))
+            h.update(b)
+        for a in self.arrays:
+            if isinstance(a, BufferedNDArray):
+                h.update(repr((a.typecode, tuple(a.shape))).encode())
+                h.update(a.data.tobytes())
+            else:
+                h.update(repr((a.dtype.str, a.shape)).encode())
+                h.update(a.tobytes())
+        return h.digest()
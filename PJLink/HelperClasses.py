@@ -31,7 +31,30 @@ MLExpr.__repr__ = expr_repr
 del expr_repr
 ###############################################################################################
 #                                            MLSym                                            #
-MLSym              = namedtuple("MLSym",              ["name"]            )
+class MLSym(namedtuple("MLSym", ["name"])):
+    """A Mathematica symbol. Symbols are interned, so the same name gives back the same object and comparing two
+symbols mostly comes down to CPython's identity check. The table can't hold the symbols weakly (tuples don't
+support weak references), so instead it is started over once it passes Env.SYMBOL_TABLE_SIZE entries.
+
+    """
+    __slots__ = ()
+    _table = {}
+
+    def __new__(cls, name):
+        try:
+            return cls._table[name]
+        except KeyError:
+            if isinstance(name, str):
+                from sys import intern
+                name = intern(name)
+            sym = super().__new__(cls, name)
+            table = cls._table
+            if len(table) >= Env.SYMBOL_TABLE_SIZE:
+                table.clear()
+            table[name] = sym
+            return sym
+        except TypeError: # unhashable names can't be interned
+            return super().__new__(cls, name)
 def sym_repr(sym):
     return "{}".format(sym.name)
 sym_repr.name = "__repr__"
@@ -55,6 +78,12 @@ PacketArrivedEvent = namedtuple("PacketArrivedEvent", ["packet", "link"]  )
 ###############################################################################################
 #                                            MsgHandlerRecord                                 #
 MsgHandlerRecord   = namedtuple("MsgHandlerRecord",   ["method", "target"])
+###############################################################################################
+#                                            EvaluationResult                                 #
+EvaluationResult   = namedtuple("EvaluationResult",   ["result", "messages", "output"])
+###############################################################################################
+#                                            KernelPacket                                     #
+KernelPacket       = namedtuple("KernelPacket",       ["name", "content"])
 
 ###############################################################################################
 #                                                                                             #
@@ -416,30 +445,23 @@ class LinkWrapper:
         self.checkError = checkError
         self.lock       = lock
         self.timeout    = timeout
-        self.poll_rate  = poll
-        self.__started  = None
+        self.poll_rate  = poll # no longer used; timeouts are handled by the shared DeadlineScheduler
+        self.expired    = False
         self.__locked   = False
-        self.__thread   = None
-
-    def poll(self):
-        import time, threading
+        self.__deadline = None
 
-        if self.__started is None:
-            self.__started = time.time()
+    def _expire(self):
+        # called from the DeadlineScheduler thread when the wrapped call runs past its timeout
+        # the thread lock belongs to the thread inside the with block, so only that thread can let go of it
+        # (on NativeLink and MemoryLink it's an RLock); all this does is flag that the call overran
+        self.expired = True
+        Env.logf("Call on {} ran past its {}s timeout", self.parent, self.timeout, level = "Info")
 
-        if self.timeout:
-            if time.time() - self.__started > 1000*self.timeout:
-                # Env.logf("Aborting wrap call")
-                self.__exit__(None, None, None)
-            else:
-                if self.__thread is None:
-                    self.__thread = threading.Thread(target=self.poll)
-                    self.__thread.start()
-
-                time.sleep(self.poll_rate/1000)
-
-        elif self.__started:
-            self.__exit__(None, None, None)
+    def __release(self):
+        if self.__locked:
+            self.__locked = False
+            # Env.logf("Unlocking thread {}", threading.current_thread())
+            self.parent.thread_lock.release()
 
     def __enter__(self):
 
@@ -451,21 +473,80 @@ class LinkWrapper:
             # Env.logf("Locking thread {}", threading.current_thread())
             self.parent.thread_lock.acquire()
 
+        self.expired = False
         if self.timeout:
-            self.poll()
+            from .DeadlineScheduler import DeadlineScheduler
+            self.__deadline = DeadlineScheduler.shared().schedule(self.timeout, self._expire)
 
         return self
 
     def __exit__(self, type, value, traceback):
-        if self.__thread is not None:
-            self.timeout = None
-        if self.__locked:
-            import threading
-            # Env.logf("Unlocking thread {}", threading.current_thread())
-            self.parent.thread_lock.release()
+        deadline = self.__deadline
+        if deadline is not None:
+            self.__deadline = None
+            from .DeadlineScheduler import DeadlineScheduler
+            DeadlineScheduler.shared().cancel(deadline)
+        self.__release()
         if self.checkError:
             self.parent._check_error(self.check)
 
+class NullLinkWrapper:
+    """The LinkWrapper a link hands out while the calling thread already holds an open LinkTransaction on it
+
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        pass
+
+###############################################################################################
+#                                                                                             #
+#                                       LinkTransaction                                       #
+#                                                                                             #
+###############################################################################################
+
+class LinkTransaction:
+    """A wrapper to allow with ...: syntax to group a set of calls on a link
+
+Holds the link's thread lock for the duration of the block and defers error checking to the end of it.
+While the owning thread is inside the transaction the link hands out NullLinkWrappers from _wrap, so the
+individual calls neither lock nor check for errors themselves. Transactions nest; only the outermost one
+checks the error state.
+
+Since nothing inside raises until the end, transactions are meant for the put paths. A get path that runs in one
+has to check the error state itself before it acts on what it read.
+
+    """
+    def __init__(self, parent, checkLink = True, checkError = True, check = None):
+        self.parent     = parent
+        self.checkLink  = checkLink
+        self.checkError = checkError
+        self.check      = check
+
+    def __enter__(self):
+        import threading
+
+        parent = self.parent
+        if self.checkLink and parent._transaction_depth == 0:
+            parent._check_link()
+        parent.thread_lock.acquire()
+        parent._transaction_owner = threading.get_ident()
+        parent._transaction_depth += 1
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        parent = self.parent
+        parent._transaction_depth -= 1
+        try:
+            if parent._transaction_depth == 0:
+                parent._transaction_owner = None
+                # if we're already unwinding an exception there's no sense in masking it with the link error
+                if self.checkError and type is None:
+                    parent._check_error(self.check)
+        finally:
+            parent.thread_lock.release()
+
 ###############################################################################################
 #                                                                                             #
 #                                          LinkMark                                           #
@@ -1036,12 +1117,16 @@ class MPackageClass(MExprUtils):
     __sym_list = os.path.join(os.path.dirname(__file__), "Resources", "sym_list.json")
     del os
 
+    # the most attribute lookups __getattr__ will memoize as real attributes
+    _ATTR_CACHE_SIZE = 8192
+
     def __init__(self):
         if self.__The_One_True_Package is not None:
             raise TypeError("MPackageClass is not intended to be a single instance class")
         self.__The_One_True_Package = self
         self.__initialized = False
         self.__symbols = None
+        self.__cached_attrs = set()
 
     @property
     def symbol_list(self):
@@ -1064,7 +1149,7 @@ class MPackageClass(MExprUtils):
             for i, namePair in enumerate(names):
                 name, sym = namePair
                 self.__symbols[i] = (name, MLSym(sym))
-                if name not in kd and name not in pd: #constant time lookup hopefully
+                if (name not in kd or name in self.__cached_attrs) and name not in pd: #constant time lookup hopefully
                     setattr(self, name, MLSym(sym))
             self.__symbols = tuple( s for s in self.__symbols if s is not None )
             return True
@@ -1104,7 +1189,8 @@ class MPackageClass(MExprUtils):
 
     def prep_object(self, o, link, coerce = False):
         enc = link.Converter.encode(o, link)
-        link.Env.logf("Encoded object {}. Coersion? {}", enc, coerce)
+        if link.Env.LOG_TRANSFER:
+            link.Env.logf("Encoded object {}. Coersion? {}", enc, coerce, level = "Transfer")
         return self.get_puttable(enc, link, coerce=coerce)
 
     def get_puttable(self, o, link, coerce = False):
@@ -1239,9 +1325,13 @@ class MPackageClass(MExprUtils):
     def _add_type_hints(self, to_eval):
         return self.CompoundExpression(
             self._load_PJLink(),
-            self.F(self.PackageTypeHints+"AddTypeHints", to_eval)
+            self._type_hints(to_eval)
         )
 
+    def _type_hints(self, to_eval):
+        # the bare wrapper, for kernels that already have PJLink loaded (see KernelSession)
+        return self.F(self.PackageTypeHints+"AddTypeHints", to_eval)
+
     def _eval(self, expr, add_type_hints = True):
         return self.EvaluatePacket(expr, _EndPacket=True)
 
@@ -1365,7 +1455,8 @@ class MPackageClass(MExprUtils):
     def _eval_to_image_packet(self, obj, **ops):
         return self._eval(self.Rasterize(obj, **ops))
 
-    def __getattr__(self, sym):
+    def __getattr__(self, attr):
+        sym = attr
         if sym.endswith("_"):
             sym = sym.split("_")[:-1]
             sym[-1] = "$" + sym[-1]
@@ -1373,7 +1464,13 @@ class MPackageClass(MExprUtils):
         else:
             sym = sym.strip("_")
         sym = sym.replace("_", "`")
-        return MLSym(sym)
+        sym = MLSym(sym)
+        # memoize by making it a real attribute, so the next lookup never gets here
+        cached = self.__cached_attrs
+        if not attr.startswith("__") and len(cached) < self._ATTR_CACHE_SIZE:
+            cached.add(attr)
+            setattr(self, attr, sym)
+        return sym
 
 MPackage = MPackageClass()
 
@@ -1578,7 +1675,8 @@ class MDecoder(namedtuple("MDecoder", ["head", "type", "dimensions"])):
         elif dims == (0,):
             dats = []
         else:
-            link.Env.log(otype, dims)
+            if link.Env.LOG_TRANSFER:
+                link.Env.log(otype, dims, level = "Transfer")
             dats = link._getArray(otype, len(dims))
 
         return dats #MStruct(dims, otype, head, dats) #I'd return this but I can't foresee it being useful...
@@ -1671,6 +1769,7 @@ class ObjectDecoder(StructBase):
                 valid = False
 
         except MathLinkException as e:
+            link._clearError()
             valid = False
 
         return valid
@@ -1692,7 +1791,8 @@ class ObjectDecoder(StructBase):
             for name, decoder in self:
                 # link.Env.log(decoder)
                 tres = decoder.decode(link, stack)
-                link.Env.log(tres)
+                if link.Env.LOG_TRANSFER:
+                    link.Env.log(tres, level = "Transfer")
                 stack[name] = tres
             res = self._target(self._name, *stack.items())
         else:
@@ -1723,25 +1823,73 @@ class TypeConverter:
     )
     del os
 
+    # the most heads we'll remember the decoders for before starting the cache over
+    _HEAD_CACHE_SIZE = 1024
+
     def __init__(self, *decoders):
 
         self.decoders = OrderedDict()
         self.encoders = OrderedDict()
+        self._head_decoders = {}
 
         self.load_decoders()
         for name, decoder in decoders:
             if not isinstance(decoder, ObjectDecoder):
                 decoder = ObjectDecoder(decoder)
-            self.decoders[name] = decoder
+            self.add_decoder(name, decoder)
         self.load_encoders()
         # Env.logf("Loaded decoders {} and encoders {}", self.decoders, self.encoders)
 
+    def add_decoder(self, name, decoder):
+        self.decoders[name] = decoder
+        self._head_decoders.clear()
+
+    @staticmethod
+    def _decodes_head(decoder, sym, name):
+        try:
+            head = decoder._head
+        except AttributeError:
+            return True # no way to tell up front, so it has to be tried on everything
+        if head is None:
+            return False
+        elif isinstance(head, str):
+            return name == head
+        else:
+            try:
+                return sym in head or name in head
+            except TypeError:
+                return True
+
+    def decoders_for(self, sym):
+        """Gives the decoders that could apply to a function with head sym, in the order they'd be tried.
+Heads nothing can decode come back as an empty tuple, which is cached like any other.
+
+        :param sym:
+        :return:
+        """
+        try:
+            return self._head_decoders[sym]
+        except KeyError:
+            name = sym.split("`")[-1]
+            decoders = tuple(d for d in self.decoders.values() if self._decodes_head(d, sym, name))
+            if len(self._head_decoders) >= self._HEAD_CACHE_SIZE:
+                self._head_decoders.clear()
+            self._head_decoders[sym] = decoders
+            return decoders
+
     def decode(self, link):
-        """Attempts to decode the objects on link with all the decoders built in
+        """Attempts to decode the objects on link with the decoders registered for its head
 
         """
+        head = link._peekHead()
+        if head is None:
+            return None
+        decoders = self.decoders_for(head)
+        if len(decoders) == 0:
+            return None
+
         with LinkMark(link) as mark:
-            for decoder in self.decoders.values():
+            for decoder in decoders:
                 try:
                     res = decoder.decode(link)
                 except Exception as e:
@@ -1767,7 +1915,7 @@ class TypeConverter:
                 f, ext = os.path.splitext(os.path.basename(f))
                 decoder = self.load_decoder(f, path = path)
                 if decoder is not None:
-                    self.decoders[f] = decoder
+                    self.add_decoder(f, decoder)
 
     def load_decoder(self, name, path = None):
         import os
@@ -1786,7 +1934,7 @@ class TypeConverter:
             decoder = decoder_module._decoder
         except Exception as e:
             import traceback as tb
-            Env.logf(tb.format_exc())
+            Env.log(tb.format_exc(), level = "Error")
         else:
             if not hasattr(decoder, "decode"): # must be defined in the file
                 target = decoder[-1]
@@ -1834,7 +1982,7 @@ class TypeConverter:
             encoder = encoder_module._encoder
         except:
             import traceback as tb
-            Env.log(tb.format_exc())
+            Env.log(tb.format_exc(), level = "Error")
         else:
             if not hasattr(encoder, "encode"): # must be defined in the file
                 encoder = ObjectEncoder(*encoder)
@@ -2528,7 +2676,7 @@ Up to the caller to ensure that link != null.
 
     @classmethod
     def createFromLink(cls, link, allowLoopback = False):
-        from .LoopbackLink import LoopbackLink
+        from .MemoryLink import MemoryLink
 
         typechar = link._getType()
         if isinstance(typechar, int):
@@ -2546,7 +2694,7 @@ Up to the caller to ensure that link != null.
             try:
                 with link._wrap(checkError=False, checkLink=False):
                     cls.__ALLOW_EMPTY=True
-                    ex = Expr(loopback=LoopbackLink())
+                    ex = Expr(loopback=MemoryLink())
                     ex.link.transferExpression(link)
                     return ex
             finally:
@@ -3,7 +3,11 @@ from .MathLinkExceptions import MathLinkException
 from .HelperClasses import *
 from .NativeLink import NativeLink
 from .LoopbackLink import NativeLoopbackLink
+from .KernelSession import KernelSession
+from .CodeCache import CodeCache
+from .CallExecutor import ProcessCall
 from abc import abstractmethod
+import itertools
 
 ###############################################################################################
 #                                                                                             #
@@ -41,8 +45,18 @@ from Mathematica), will want to start with the handleCallPacket() method here.
     def __init__(self):
         self.M = MPackage
         self._reader = None
+        self._cache = None
+        self._coalescer = None
+        self._session = KernelSession(self)
+        self.__accumulatingPS = None
+        self.__last_packet_was_message = False
         super().__init__()
         self._EXEC_ENV = { "Kernel":self , "Mathematica": self.M, "Evaluate": self.evaluateString }
+        self._code_cache = CodeCache()
+        self._callables = {} # call ids and resolved dotted names -> the callables PyCallPacket can invoke
+        self._callable_ids = itertools.count(1)
+        self._call_executor = None
+        self._call_depth = 0
         self.ObjectHandler = ObjectHandler(self._EXEC_ENV)
 
     def get(self):
@@ -58,39 +72,53 @@ from Mathematica), will want to start with the handleCallPacket() method here.
         # self.Env.logf("Getting {} off link", t1)
 
         if t1 == "Function":
+            res = self._readExpression()
+        elif t1 == "Object":
+            res = self._getObject()
+        else:
             try:
-                res = self.Converter.decode(self)
-            except MathLinkException as e:
-                # # self.Env.log_tb()
+                res = self._getSingleObject(t1)
+                # print(res)
+            except (MathLinkException, ValueError, TypeError) as e:
                 self._clearError()
-
-        if res is None:
-
-            if t1 == "Object":
-                res = self._getObject()
-            elif t1 == "Function":
-                res = self.getPacket()
+                self.Env.log_tb()
+                pass # Maybe I should handle these?
             else:
-                try:
-                    res = self._getSingleObject(t1)
-                    # print(res)
-                except (MathLinkException, ValueError, TypeError) as e:
-                    self._clearError()
-                    self.Env.log_tb()
-                    pass # Maybe I should handle these?
-                else:
-                    if t1 == "Symbol":
-                        res = MLSym(res)
+                if t1 == "Symbol":
+                    res = MLSym(res)
 
         # self.Env.logf("Got {} off link", res)
 
         return res
 
+    def _decodeExpression(self):
+        # Gives the type converters a chance at the function waiting on the link, returning None if none of them want it
+        res = None
+        try:
+            res = self.Converter.decode(self)
+        except MathLinkException as e:
+            # # self.Env.log_tb()
+            self._clearError()
+        return res
+
+    def _readExpression(self):
+        """Reads the function waiting on the link, decoding it if there's a converter for it and getting
+it as an MLExpr otherwise. Subclasses that can read a whole expression in one go should override this.
+
+        :return:
+        """
+
+        res = self._decodeExpression()
+        if res is None:
+            res = self.getPacket()
+        return res
+
     def _putReference(self, o):
 
         return self.put(self.ObjectHandler.ref(o))
 
     def getPacket(self):
+        # no transaction here: each getter has to check the link itself, or a failed read hands back junk
         tok = self._getTypeName()
         if tok == "Function":
             f = self._getFunction()
@@ -101,17 +129,257 @@ from Mathematica), will want to start with the handleCallPacket() method here.
             pkt = None
         return pkt
 
-    def _evaluate(self, expr, wait = True):
-        self._evaluateExpr(self.M._add_type_hints(expr))
+    def _evaluate(self, expr, wait = True, timeout = None):
+        to_eval = self._session.wrap(expr)
+        cache = self._cache
+        key = None
+        if wait and cache is not None:
+            key = cache.key(expr, to_eval)
+            if key is not None:
+                res = cache.get(key, self._CACHE_MISS)
+                if res is not self._CACHE_MISS:
+                    return res
+        self._evaluateExpr(to_eval)
         if wait:
-            self.waitForAnswer()
-            return self.get()
+            if timeout is None:
+                res = self._getAnswer()
+            else:
+                res = self._withDeadline(timeout, self._getAnswer)
+            res = self._session.check(res)
+            if key is not None:
+                cache.put(key, res)
+            return res
+
+    _CACHE_MISS = object()
+
+    def _getAnswer(self):
+        self.waitForAnswer()
+        return self.get()
+
+    def _withDeadline(self, timeout, fn, *args, **kwargs):
+        # Runs fn, escalating from interrupt up to killing the kernel if it doesn't finish in time (see EvaluationDeadline).
+        # Either way fn gets to read its answers off, so the link is left clean, and then a TimeoutError is raised.
+        from .DeadlineScheduler import EvaluationDeadline
+        from concurrent.futures import TimeoutError
+
+        deadline = EvaluationDeadline(self, timeout)
+        try:
+            with deadline:
+                res = fn(*args, **kwargs)
+        except MathLinkException as e:
+            if deadline.expired:
+                # most likely the kernel was terminated out from under us
+                self._session.reset()
+                raise TimeoutError("evaluation timed out after {}s ({})".format(timeout, ", ".join(deadline.steps_taken))) from e
+            raise
+        if deadline.expired:
+            raise TimeoutError("evaluation timed out after {}s ({})".format(timeout, ", ".join(deadline.steps_taken)))
+        return res
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def enable_cache(self, max_bytes = None, pure = ()):
+        """Turns on caching of evaluations whose heads have been marked pure (see EvaluationCache.pure)
+
+        :param max_bytes: the bound on the size of the cache, defaults to Env.EVALUATION_CACHE_BYTES
+        :param pure: heads to mark pure in the cache
+        :return: the EvaluationCache
+        """
+        from .EvaluationCache import EvaluationCache
+        if self._cache is None:
+            self._cache = EvaluationCache(max_bytes, pure = pure)
+        else:
+            if max_bytes is not None:
+                self._cache.max_bytes = max_bytes
+            self._cache.pure(*pure)
+        return self._cache
+
+    def disable_cache(self):
+        self._cache = None
+
+    def invalidate(self, symbol = None, context = None):
+        """Drops cached evaluations that mention symbol or anything in context (everything, if neither is given)
 
-    def evaluate(self, expr, wait = True):
+        :param symbol:
+        :param context:
+        :return:
+        """
+        cache = self._cache
+        return 0 if cache is None else cache.invalidate(symbol = symbol, context = context)
+
+    def evaluate(self, expr, wait = True, timeout = None):
+        """Evaluates expr on the kernel
+
+        :param expr:
+        :param wait: whether to wait for the answer
+        :param timeout: the number of seconds to give the evaluation before interrupting, aborting, and finally terminating it (see Env.EVALUATION_ESCALATION), in which case a TimeoutError is raised
+        :return:
+        """
+        coalescer = self._coalescer
+        if coalescer is not None and wait and timeout is None:
+            return coalescer.evaluate(expr)
+        return self._dispatchEvaluation(expr, wait = wait, timeout = timeout)
+
+    def _dispatchEvaluation(self, expr, wait = True, timeout = None):
+        if self._reader is not None:
+            return self._reader.evaluate(expr, wait = wait, timeout = timeout)
+        else:
+            return self._evaluate(expr, wait = wait, timeout = timeout)
+
+    def enable_coalescing(self, window = None, max_items = None):
+        """Turns on batching of evaluate calls: evaluations coming in from different threads within window seconds
+of each other go to the kernel together, as one EvaluatePacket
+
+        :param window: seconds to hold a batch open, defaults to Env.COALESCE_WINDOW
+        :param max_items: the most evaluations in one batch, defaults to Env.COALESCE_MAX_ITEMS
+        :return: the EvaluationCoalescer
+        """
+        from .EvaluationCoalescer import EvaluationCoalescer
+        self._coalescer = EvaluationCoalescer(self, window = window, max_items = max_items)
+        return self._coalescer
+
+    def disable_coalescing(self):
+        self._coalescer = None
+
+    def evaluate_many(self, exprs, window = None, collect = False, timeout = None):
+        """Evaluates a batch of expressions, keeping up to window of them queued up on the kernel at once
+so that the round-trip to the kernel is paid once per batch rather than once per expression.
+Results come back in the same order as exprs.
+
+        :param exprs: an iterable of expressions to evaluate
+        :param window: the max number of evaluations in flight, defaults to Env.EVALUATE_WINDOW
+        :param collect: whether to return EvaluationResults carrying the messages and printed output of each evaluation
+        :param timeout: the number of seconds to give the whole batch, as for evaluate
+        :return:
+        """
         if self._reader is not None:
-            return self._reader.evaluate(expr, wait = wait)
+            return self._reader.evaluate_many(exprs, window = window, collect = collect, timeout = timeout)
         else:
-            return self._evaluate(expr, wait = wait)
+            return self._evaluateMany(exprs, window = window, collect = collect, timeout = timeout)
+
+    def _evaluateMany(self, exprs, window = None, collect = False, timeout = None):
+        from collections import deque
+
+        if timeout is not None:
+            return self._withDeadline(timeout, self._evaluateMany, exprs, window = window, collect = collect)
+
+        if window is None:
+            window = self.Env.EVALUATE_WINDOW
+        window = max(int(window), 1)
+
+        exprs = iter(exprs)
+        results = []
+        pending = deque()
+        more = True
+        session = self._session
+        while True:
+            sent = False
+            while more and len(pending) < window:
+                try:
+                    expr = next(exprs)
+                except StopIteration:
+                    more = False
+                else:
+                    self.put(self.M._eval(session.wrap(expr)))
+                    res = [ None, [], [] ]
+                    pending.append(res)
+                    results.append(res)
+                    sent = True
+            if sent:
+                self.flush()
+            if len(pending) == 0:
+                break
+            self._collectAnswer(pending.popleft())
+
+        for res in results:
+            res[0] = session.check(res[0])
+
+        if collect:
+            return [ EvaluationResult(*res) for res in results ]
+        else:
+            return [ res[0] for res in results ]
+
+    def evaluate_stream(self, expr):
+        """Evaluates expr, yielding a KernelPacket for each packet the kernel sends back as it arrives:
+printed Text, Messages, Display data, whatever gets LinkWrite-n to us, and finally the Return.
+CallPackets and input requests are handled as usual and not yielded.
+
+        :param expr:
+        :return:
+        """
+        if self._reader is not None:
+            return self._reader.evaluate_stream(expr)
+        else:
+            return self._evaluateStream(expr)
+
+    # packets evaluate_stream hands to _handlePacket rather than yielding, since the kernel is waiting on a reply
+    _STREAM_HANDLED_PACKETS = frozenset(Env.getPacketInt(p) for p in ("Call", "Input", "InputString"))
+
+    def _evaluateStream(self, expr):
+        self._evaluateExpr(self._session.wrap(expr))
+        done = False
+        try:
+            while not done:
+                pkt = self._nextPacket()
+                allowDefaultProcessing = self.notifyPacketListeners(pkt)
+                if pkt in self._ANSWER_PACKETS:
+                    done = True
+                    pkt_name = self.Env.getPacketName(pkt)
+                    res = self.get()
+                    if pkt_name == "Return":
+                        res = self._session.check(res)
+                    self._newPacket()
+                    yield KernelPacket(pkt_name, res)
+                elif not allowDefaultProcessing:
+                    self._newPacket()
+                elif pkt in self._STREAM_HANDLED_PACKETS:
+                    self._handlePacket(pkt)
+                    self._newPacket()
+                else:
+                    pkt_name = self.Env.getPacketName(pkt)
+                    if pkt_name == "Message":
+                        content = (self.get(), self.get()) # MessagePacket[symbol, "tag"]
+                    else:
+                        content = self.get()
+                    self._newPacket()
+                    yield KernelPacket(pkt_name, content)
+        except GeneratorExit:
+            # the caller stopped listening, but the rest of the answer still has to come off the link
+            if not done:
+                self.waitForAnswer()
+                self._newPacket()
+            raise
+
+    def _collectAnswer(self, res):
+        # Like waitForAnswer, but the answer gets read off into res[0] and text coming back from the evaluation is
+        # sorted into messages (res[1], the TextPacket following a MessagePacket) and printed output (res[2])
+        # The kernel answers EvaluatePackets in order, so every packet up to the next ReturnPacket belongs to this one
+        self.__accumulatingPS = []
+        last_was_message = False
+        while True:
+            pkt = self._nextPacket()
+            pkt_name = self.Env.getPacketName(pkt)
+            allowDefaultProcessing = self.notifyPacketListeners(pkt)
+            if pkt_name in ("Return", "ReturnText", "ReturnExpr"):
+                res[0] = self.get()
+                self._newPacket()
+                break
+            elif not allowDefaultProcessing:
+                pass
+            elif pkt_name == "Message":
+                last_was_message = True
+            elif pkt_name == "Text":
+                res[1 if last_was_message else 2].append(self.get())
+                last_was_message = False
+            else:
+                self._handlePacket(pkt)
+            self._newPacket()
 
     def evaluateString(self, expr, wait=True, **opts):
         if self._reader is not None:
@@ -151,7 +419,7 @@ from Mathematica), will want to start with the handleCallPacket() method here.
             allowDefaultProcessing = self.notifyPacketListeners(pkt)
             if allowDefaultProcessing:
                 self._handlePacket(pkt)
-            if self.Env.getPacketName(pkt) in ("Return", "InputName", "ReturnText", "ReturnExpr"):
+            if pkt in self._ANSWER_PACKETS:
                 break
             else:
                 self._newPacket()
@@ -173,113 +441,172 @@ from Mathematica), will want to start with the handleCallPacket() method here.
             pkt = self.Env.getPacketName(pkt)
         self._putFunction(pkt, arg_count)
 
+    # packet name (or int) -> the name of the method that handles it, or a function taking the link and the packet int
+    # None means there's nothing to do beyond what the caller (e.g. waitForAnswer) does itself
+    _packet_handler_map = {
+        "Return"      : None,
+        "InputName"   : None,
+        "ReturnText"  : None,
+        "ReturnExpr"  : None,
+        "Menu"        : None,
+        "Message"     : None,
+        "Call"        : "_handleCallPkt",
+        "Input"       : "_handleInputPkt",
+        "InputString" : "_handleInputPkt",
+        "Display"     : "_handleDisplayPkt",
+        "DisplayEnd"  : "_handleDisplayPkt",
+        "Text"        : "_handleTextPkt",
+        "Expression"  : "_handleTextPkt",
+        "FE"          : "_handleFEPkt"
+    }
+    _packet_handler_default = "_handleUnknownPkt"
+    _packet_handlers = {} # packet int -> resolved handler, filled in as packets come through _handlePacket
+
+    @classmethod
+    def register_packet_handler(cls, packet, handler):
+        """Registers a handler for packets of the given type, replacing the default handling
+
+        :param packet: the packet name (e.g. "Text") or int
+        :param handler: either the name of a method taking the packet int, a function taking the link and the packet int, or None to ignore the packet
+        :return:
+        """
+
+        if "_packet_handler_map" not in cls.__dict__:
+            cls._packet_handler_map = dict(cls._packet_handler_map)
+        if isinstance(packet, int):
+            packet = Env.getPacketName(packet) or packet
+        cls._packet_handler_map[packet] = handler
+        cls._packet_handlers = {}
+
+    @classmethod
+    def _resolvePacketHandler(cls, pkt):
+        handler_map = cls._packet_handler_map
+        for key in (pkt, Env.getPacketName(pkt)):
+            try:
+                return handler_map[key]
+            except KeyError:
+                pass
+        return cls._packet_handler_default
+
     def _handlePacket(self, pkt):
-        pkt_name = self.Env.getPacketName(pkt)
-        self.Env.logf("Handling packet {}", pkt_name)
+        try:
+            handler = self._packet_handlers[pkt]
+        except KeyError:
+            handler = self._packet_handlers[pkt] = self._resolvePacketHandler(pkt)
 
-        if pkt_name in ("Return", "InputName", "ReturnText", "ReturnExpr", "Menu", "Message"):
-            # maybe debug print them?
+        if self.Env.LOG_DEBUG:
+            self.Env.logf("Handling packet {}", self.Env.getPacketName(pkt))
+
+        if handler is None:
             pass
-        elif pkt_name == "Call":
-            otype = self._getType()
-            tname = self.Env.fromTypeToken(otype)
+        elif isinstance(handler, str):
+            getattr(self, handler)(pkt)
+        else:
+            handler(self, pkt)
+
+        self.__last_packet_was_message = pkt == self._MESSAGE_PACKET
+
+    _MESSAGE_PACKET = Env.getPacketInt("Message")
+    _ANSWER_PACKETS = frozenset(Env.getPacketInt(p) for p in ("Return", "InputName", "ReturnText", "ReturnExpr"))
+
+    def _handleCallPkt(self, pkt):
+        otype = self._getType()
+        tname = self.Env.fromTypeToken(otype)
+        if self.Env.LOG_DEBUG:
             self.Env.logf("Handling call packet of type {}", tname)
-            if tname == "Integer":
-                # A normal CallPacket representing a call to Java via jCallJava.
-                self.__handleCallPacket()
-            elif self.FEServerLink is not None:
-                # A CallPacket destined for the FE via MathLink`CallFrontEnd[] and routed through
-                # Java due to ShareFrontEnd[]. This would only be in a 5.1 or later FE, as earlier
-                # versions do not use CallPacket and later versions would use the FE's Service Link.
-                feLink = self.FEServerLink
-                feLink.putFunction("CallPacket", 1)
-                feLink.transferExpression(self)
-                # FE will always reply to a CallPacket. Note that it is technically possible for
-                # the FE to send back an EvaluatePacket, which means that we really need to run a
-                # little loop here, not just write the result back to the kernel. But this branch
-                # is only for a 5.1 and later FE, and I don't think that they ever do that.
-                self.transferExpression(feLink);
-        elif pkt_name == "Input" or pkt_name == "InputString":
-            if self.FEServerLink is not None:
-                fe = self.FEServerLink
-                fe._putPacket(pkt_name)
-                fe.put(self._getString())
-                fe.flush()
-                self._newPacket()
-                self.put(fe._getString())
-                self.flush()
-        elif pkt_name == "Display" or pkt_name == "DisplayEnd":
-            if self.FEServerLink is not None:
-                fe = self.FEServerLink
-                try:
-                    ps = self.__accumulatingPS
-                except AttributeError:
-                    self.__accumulatingPS = None
-                if self.__accumulatingPS is None:
-                    self.__accumulatingPS = []
-                self.__accumulatingPS.append(self._getString())
-                if pkt_name == "DisplayEnd":
-                    fe = self.FEServerLink
-                    # XXXPacket[stuff] ---> Cell[GraphicsData["PostScript", stuff], "Graphics"]
-                    fe._putFunction("FrontEnd`FrontEndExecute", 1)
-                    fe._putFunction("FrontEnd`NotebookWrite", 2)
-                    fe._putFunction("FrontEnd`SelectedNotebook", 0)
-                    fe._putFunction("Cell", 2)
-                    fe._putFunction("GraphicsData", 2)
-                    fe.put("PostScript")
-                    fe.put("".join(self.__accumulatingPS))
-                    fe.put("Graphics")
-                    fe.flush()
-                    self.__accumulatingPS = None
-        elif pkt_name == "Text" or pkt_name == "Expression":
+        if tname == "Integer":
+            # A normal CallPacket representing a call to Java via jCallJava.
+            self.__handleCallPacket()
+        elif self.FEServerLink is not None:
+            # A CallPacket destined for the FE via MathLink`CallFrontEnd[] and routed through
+            # Java due to ShareFrontEnd[]. This would only be in a 5.1 or later FE, as earlier
+            # versions do not use CallPacket and later versions would use the FE's Service Link.
+            feLink = self.FEServerLink
+            feLink.putFunction("CallPacket", 1)
+            feLink.transferExpression(self)
+            # FE will always reply to a CallPacket. Note that it is technically possible for
+            # the FE to send back an EvaluatePacket, which means that we really need to run a
+            # little loop here, not just write the result back to the kernel. But this branch
+            # is only for a 5.1 and later FE, and I don't think that they ever do that.
+            self.transferExpression(feLink);
+
+    def _handleInputPkt(self, pkt):
+        if self.FEServerLink is not None:
             fe = self.FEServerLink
-            if fe is not None:
+            fe._putPacket(pkt)
+            fe.put(self._getString())
+            fe.flush()
+            self._newPacket()
+            self.put(fe._getString())
+            self.flush()
+
+    def _handleDisplayPkt(self, pkt):
+        if self.FEServerLink is not None:
+            if self.__accumulatingPS is None:
+                self.__accumulatingPS = []
+            self.__accumulatingPS.append(self._getString())
+            if self.Env.getPacketName(pkt) == "DisplayEnd":
+                fe = self.FEServerLink
+                # XXXPacket[stuff] ---> Cell[GraphicsData["PostScript", stuff], "Graphics"]
                 fe._putFunction("FrontEnd`FrontEndExecute", 1)
                 fe._putFunction("FrontEnd`NotebookWrite", 2)
                 fe._putFunction("FrontEnd`SelectedNotebook", 0)
                 fe._putFunction("Cell", 2)
-                fe.transferExpression(self)
-                fe.put("Message" if self.__last_packet_was_message else "Print")
+                fe._putFunction("GraphicsData", 2)
+                fe.put("PostScript")
+                fe.put("".join(self.__accumulatingPS))
+                fe.put("Graphics")
                 fe.flush()
-            elif pkt_name == "Expression":
-                self._getFunction()
-
-        elif pkt_name == "FE":
-            # This case is different from the others. At the point of entry, the link is at the point
-            # _before_ the "packet" has been read. As a result, we must at least open the packet.
-            # Note that FEPKT is really just a fall-through for unrecognized packets. We don't have any
-            # checks that it is truly intended for the FE.
-            fe = self.FEServerLink
-            if fe is not None:
-                mark = LinkMark(self).init()
-                try:
-                    wrapper = self._getFunction()
-                    if not wrapper.name == "FrontEnd`FrontEndExecute":
-                        fe._putFunction("FrontEnd`FrontEndExecute", 1)
-                finally:
-                    mark.revert()
+                self.__accumulatingPS = None
 
-                fe.transferExpression(self)
-                fe.flush()
-                # Wait until either the fe is ready (because what we just sent causes a return value)
-                # or kernel is ready (the computation is continuing because the kernel is not waiting
-                # for a return value).
-                import time
-                while not fe.ready() or not self.ready():
-                    time.sleep(.06)
-
-                if fe.ready():
-                    self.transferExpression(fe)
-                    self.flush()
-        else:
-            # It's OK to get here. For example, this happens if you don't share the fe, but have a
-            # button that calls NotebookCreate[]. This isn't a very good example, because that
-            # function expects the fe to return something, so Java will hang. you will get into
-            # trouble if you make calls on the fe that expect a return. Everything is OK for calls
-            # that don't expect a return, though.
+    def _handleTextPkt(self, pkt):
+        fe = self.FEServerLink
+        if fe is not None:
+            fe._putFunction("FrontEnd`FrontEndExecute", 1)
+            fe._putFunction("FrontEnd`NotebookWrite", 2)
+            fe._putFunction("FrontEnd`SelectedNotebook", 0)
+            fe._putFunction("Cell", 2)
+            fe.transferExpression(self)
+            fe.put("Message" if self.__last_packet_was_message else "Print")
+            fe.flush()
+        elif self.Env.getPacketName(pkt) == "Expression":
             self._getFunction()
 
-        self.__last_packet_was_message = pkt_name == "Message"
+    def _handleFEPkt(self, pkt):
+        # This case is different from the others. At the point of entry, the link is at the point
+        # _before_ the "packet" has been read. As a result, we must at least open the packet.
+        # Note that FEPKT is really just a fall-through for unrecognized packets. We don't have any
+        # checks that it is truly intended for the FE.
+        fe = self.FEServerLink
+        if fe is not None:
+            mark = LinkMark(self).init()
+            try:
+                wrapper = self._getFunction()
+                if not wrapper.name == "FrontEnd`FrontEndExecute":
+                    fe._putFunction("FrontEnd`FrontEndExecute", 1)
+            finally:
+                mark.revert()
+
+            fe.transferExpression(self)
+            fe.flush()
+            # Wait until either the fe is ready (because what we just sent causes a return value)
+            # or kernel is ready (the computation is continuing because the kernel is not waiting
+            # for a return value).
+            import time
+            while not fe.ready() or not self.ready():
+                time.sleep(.06)
+
+            if fe.ready():
+                self.transferExpression(fe)
+                self.flush()
+
+    def _handleUnknownPkt(self, pkt):
+        # It's OK to get here. For example, this happens if you don't share the fe, but have a
+        # button that calls NotebookCreate[]. This isn't a very good example, because that
+        # function expects the fe to return something, so Java will hang. you will get into
+        # trouble if you make calls on the fe that expect a return. Everything is OK for calls
+        # that don't expect a return, though.
+        self._getFunction()
 
     def _getLastError(self):
         err_no = self._error()
@@ -564,7 +891,7 @@ from Mathematica), will want to start with the handleCallPacket() method here.
         # Tests whether symbol waiting on link is a valid object reference. Returns false for the symbol Null.
         # Called by getNext() and getType(), after it has already been verified that the type is MLTKSYM.
 
-        mark = LinkMark(self)
+        mark = LinkMark(self, seek = True)
         res = False
         try:
             mark.init()
@@ -841,7 +1168,9 @@ from Mathematica), will want to start with the handleCallPacket() method here.
                 call_data["call"] = ""
                 call_data["env"] = {}
                 call_data["vars"] = 0
-                call_data["id"] = str(id(call_data))
+                # the variable names have to come out the same from one call to the next for the code cache to hit,
+                # so they're numbered by how deeply CallPython is nested rather than by anything unique to the call
+                call_data["id"] = str(self._call_depth)
                 call_data["indent"] = 0
             # curr = call_data["call"]
             head = pkt.head
@@ -908,18 +1237,7 @@ from Mathematica), will want to start with the handleCallPacket() method here.
                     arg = arg[0]
 
                 if isinstance(arg, str):
-                    res = None
-                    self._EXEC_ENV.update(call_data["env"])
-                    if len(arg.split("\n", 2)) == 1:
-                        try:
-                            res = eval(arg, self._EXEC_ENV, self._EXEC_ENV)
-                        except SyntaxError:
-                            exec(arg, self._EXEC_ENV, self._EXEC_ENV)
-                    else:
-                        exec(arg, self._EXEC_ENV, self._EXEC_ENV)
-
-                    for k in call_data["env"]:
-                        del self._EXEC_ENV[k]
+                    res = self.__run_python(arg, call_data["env"])
                 else:
                     res = arg
 
@@ -927,17 +1245,7 @@ from Mathematica), will want to start with the handleCallPacket() method here.
 
             elif top_call and isinstance(res, str):
                 # print(res)
-                self._EXEC_ENV.update(call_data["env"])
-                if len(res.split("\n", 2)) == 1:
-                    try:
-                        return eval(res, self._EXEC_ENV, self._EXEC_ENV)
-                    except SyntaxError:
-                        exec(res, self._EXEC_ENV, self._EXEC_ENV)
-                        return None
-                else:
-                    exec(res, self._EXEC_ENV, self._EXEC_ENV)
-                for k in call_data["env"]:
-                    del self._EXEC_ENV[k]
+                return self.__run_python(res, call_data["env"])
 
             if res is None:
                 # print(head)
@@ -945,6 +1253,201 @@ from Mathematica), will want to start with the handleCallPacket() method here.
             else:
                 return res
 
+    def __run_python(self, src, variables):
+        # compiled code is reused across calls, so only the variables bound to the packet's data change
+        env = self._EXEC_ENV
+        env.update(variables)
+        try:
+            return self._code_cache.run(src, env)
+        finally:
+            for k in variables:
+                env.pop(k, None)
+
+    @staticmethod
+    def __call_packet_type(expr):
+        if not isinstance(expr, MLExpr):
+            return None
+        head = expr.head
+        if isinstance(head, MLSym):
+            head = head.name
+        if isinstance(head, str):
+            head = head.rsplit("`", 1)[-1]
+            if head in ("PyCallPacket", "PyCallAsyncPacket", "PyCollectPacket"):
+                return head
+        return None
+
+    def __call_direct(self, pkt):
+        # PyCallPacket[f, {args...}, {key -> val, ...}]: the arguments are used as they came off the link,
+        # no code gets generated and nothing goes through _EXEC_ENV
+        fn, call_args, call_kwargs = self.__call_spec(pkt)
+        self.Env.logf("Calling {} directly", fn)
+        if isinstance(fn, ProcessCall):
+            return self.call_executor.call(fn.fn, call_args, call_kwargs)
+        return fn(*call_args, **call_kwargs)
+
+    def __call_async(self, pkt):
+        # PyCallAsyncPacket[f, {args...}, {key -> val, ...}]: the call goes off to the executor and Mathematica
+        # gets a ticket back straight away, to hand to PyCollectPacket later
+        fn, call_args, call_kwargs = self.__call_spec(pkt)
+        if isinstance(fn, ProcessCall):
+            ticket = self.call_executor.submit(fn.fn, call_args, call_kwargs, process = True)
+        else:
+            ticket = self.call_executor.submit(fn, call_args, call_kwargs)
+        self.Env.logf("Started call {} to {}", ticket, fn)
+        return self.M.F(self.M.PackageContext + "PyCallTicket", ticket)
+
+    def __collect_calls(self, pkt):
+        # PyCollectPacket[{tickets...} | All, timeout]: gives back {PyCallTicket[n] -> result, ...} for the calls
+        # that have finished, in the order they finished
+        args = pkt.args
+        tickets = None
+        if len(args) > 0 and isinstance(args[0], MLExpr):
+            tickets = [ t.args[0] if isinstance(t, MLExpr) else t for t in args[0].args ]
+        timeout = args[1] if len(args) > 1 and isinstance(args[1], (int, float)) else None
+        M = self.M
+        rules = []
+        for ticket, ok, value in self.call_executor.collect(tickets, timeout = timeout):
+            if not ok:
+                value = M.F(M.PackageContext + "PythonTraceback", value)
+            elif value is None:
+                value = MLSym("Null")
+            rules.append(M.F("Rule", M.F(M.PackageContext + "PyCallTicket", ticket), value))
+        # a plain list of expressions would go through _putArray, which takes the MLExprs for nested lists
+        return M.F("List", *rules)
+
+    @property
+    def call_executor(self):
+        """The CallExecutor that PyCallAsyncPacket requests and process callables run on, created the first time it's needed
+
+        :return:
+        """
+        if self._call_executor is None:
+            from .CallExecutor import CallExecutor
+            self._call_executor = CallExecutor()
+        return self._call_executor
+
+    def __call_spec(self, pkt):
+        args = pkt.args
+        fn = self.resolve_callable(args[0])
+        call_args = self._decodeCallArg(args[1]) if len(args) > 1 else []
+        if not isinstance(call_args, list):
+            call_args = [ call_args ]
+        call_kwargs = {}
+        if len(args) > 2:
+            kwargs = args[2]
+            if isinstance(kwargs, MLExpr):
+                kwargs = kwargs.args
+            for rule in kwargs:
+                key, val = self._decodeCallArg(rule)
+                call_kwargs[key] = val
+        return fn, call_args, call_kwargs
+
+    def _decodeCallArg(self, arg):
+        if isinstance(arg, MLSym):
+            name = arg.name
+            if name == "True":
+                return True
+            elif name == "False":
+                return False
+            elif name in ("Null", "None"):
+                return None
+            return arg
+        elif isinstance(arg, MLExpr):
+            head = arg.head
+            if isinstance(head, MLSym):
+                head = head.name
+            if head == "List":
+                return [ self._decodeCallArg(a) for a in arg.args ]
+            elif head in ("Rule", "RuleDelayed") and len(arg.args) == 2:
+                return tuple(self._decodeCallArg(a) for a in arg.args)
+            elif head == "Association":
+                return dict(self._decodeCallArg(a) for a in arg.args)
+        return arg
+
+    def register_callable(self, fn, name = None, process = False):
+        """Makes fn callable from Mathematica with PyCall[id, args, kwargs]
+
+        :param fn:
+        :param name: an additional name PyCall can use for fn
+        :param process: whether fn is CPU-bound and should run in a worker process, in which case it has to be picklable
+        :return: the id for fn
+        """
+        if process:
+            fn = ProcessCall(fn)
+        call_id = next(self._callable_ids)
+        self._callables[call_id] = fn
+        if name is not None:
+            self._callables[name] = fn
+        return call_id
+
+    def register_vectorized(self, fn, name = None, elementwise = False, typecode = None):
+        """Registers fn to be called on whole packed arrays at once, see VectorizedFunction
+
+        :param fn:
+        :param name: an additional name PyCall can use for fn
+        :param elementwise: whether fn takes single elements rather than arrays
+        :param typecode: the typecode for the array that goes back
+        :return: the id for fn
+        """
+        from .VectorizedFunction import VectorizedFunction
+        return self.register_callable(
+            VectorizedFunction(fn, elementwise = elementwise, typecode = typecode, use_numpy = self.use_numpy),
+            name = name
+        )
+
+    def unregister_callable(self, call_id):
+        return self._callables.pop(call_id, None)
+
+    def resolve_callable(self, ref):
+        """Finds the callable for a PyCallPacket: a registered id or name, or a dotted name that's looked up in
+the exec environment or else imported, in which case it's remembered after the first time
+
+        :param ref:
+        :return:
+        """
+        try:
+            return self._callables[ref]
+        except KeyError:
+            pass
+        except TypeError:
+            ref = str(ref)
+        if not isinstance(ref, str):
+            raise MathLinkException("UnknownCallType", "no callable registered as {}".format(ref))
+
+        import builtins
+
+        bits = ref.split(".")
+        env = self._EXEC_ENV
+        if bits[0] in env:
+            # names in the exec environment can be rebound, so these are looked up fresh every time
+            obj = env[bits[0]]
+            for b in bits[1:]:
+                obj = getattr(obj, b)
+            return obj
+        elif hasattr(builtins, bits[0]):
+            obj = getattr(builtins, bits[0])
+            rest = bits[1:]
+        else:
+            import importlib
+            obj = None
+            for i in range(len(bits), 0, -1):
+                try:
+                    obj = importlib.import_module(".".join(bits[:i]))
+                except ImportError:
+                    continue
+                rest = bits[i:]
+                break
+            if obj is None:
+                raise MathLinkException("UnknownCallType", "couldn't resolve callable {}".format(ref))
+        for b in rest:
+            obj = getattr(obj, b)
+        self._callables[ref] = obj
+        return obj
+
+    @property
+    def code_cache(self):
+        return self._code_cache
+
     def __callPython(self):
         ### dunno exactly how this data should come through...
 
@@ -955,7 +1458,19 @@ from Mathematica), will want to start with the handleCallPacket() method here.
 
         self.Env.logf("Calling python on packet {}", pkt)
 
-        res = self.__do_call_recursive(pkt)
+        packet = self.__call_packet_type(arg)
+        if packet == "PyCallPacket":
+            res = self.__call_direct(arg)
+        elif packet == "PyCallAsyncPacket":
+            res = self.__call_async(arg)
+        elif packet == "PyCollectPacket":
+            res = self.__collect_calls(arg)
+        else:
+            self._call_depth += 1
+            try:
+                res = self.__do_call_recursive(pkt)
+            finally:
+                self._call_depth -= 1
         self.Env.logf("Returning data {}", res)
         if res is None:
             self._putSymbol("Null")
@@ -1052,6 +1567,7 @@ class WrappedKernelLink(KernelLink):
         self._link_connected = False
         self._CORE_LINK = link # ??
         self._ACTIVE_LINK = None # equivalent of Automatic
+        self._shuttle_pool = None
 
         if isinstance(link, MathLink):
             self._CORE_LINK = link
@@ -1091,6 +1607,15 @@ class WrappedKernelLink(KernelLink):
 
     def close(self):
         # self.__ensure_connection()
+        pool = self._shuttle_pool
+        if pool is not None:
+            self._shuttle_pool = None
+            pool.close()
+        executor = self._call_executor
+        if executor is not None:
+            self._call_executor = None
+            executor.close()
+        self._session.reset()
         return self.active_link.close()
     def activate(self):
         return self.active_link.activate()
@@ -1225,8 +1750,20 @@ class WrappedKernelLink(KernelLink):
         return self.active_link._check_error(allowed)
 
     def _getTempLink(self):
+        pool = self._shuttle_pool
+        if pool is None:
+            from .LoopbackLink import ShuttleLinkPool
+            pool = self._shuttle_pool = ShuttleLinkPool(self._newTempLink)
+        return pool.acquire()
+
+    def _newTempLink(self):
+        from .MemoryLink import MemoryLink, KernelMemoryShuttleLink
         from .LoopbackLink import KernelShuttleLink
-        link = KernelShuttleLink(self)
+        if isinstance(self._CORE_LINK, MemoryLink):
+            # no reason to pull in the native library for a link that never had it
+            link = KernelMemoryShuttleLink(self)
+        else:
+            link = KernelShuttleLink(self)
         return link
 
     def _putViaLoopback(self, o, stack = None):
@@ -1322,6 +1859,10 @@ class WrappedKernelLink(KernelLink):
         self.__ensure_connection()
         return self.active_link._getFunction()
 
+    def _peekHead(self):
+        self.__ensure_connection()
+        return self.active_link._peekHead()
+
     def _putFunction(self, f, argCount):
         # self.__ensure_connection()
         return self.active_link._putFunction(f, argCount)
@@ -1387,6 +1928,9 @@ class WrappedKernelLink(KernelLink):
     def _wrap(self, checkLink = True, checkError = True, check = None, lock = True):
         return self.active_link._wrap(checkLink, checkError, check, lock)
 
+    def transaction(self, checkLink = True, checkError = True, check = None):
+        return self.active_link.transaction(checkLink = checkLink, checkError = checkError, check = check)
+
     def _nextPacket(self):
         # Code here is not just a simple call to impl.nextPacket(). For a KernelLink, nextPacket() returns a
         # wider set of packet constants than the MathLink C API itself. We want nextPacket() to work on the
@@ -1445,6 +1989,33 @@ class WrappedKernelLink(KernelLink):
             res = self.Env.toTypeToken("Object")
         return res
 
+    def _readExpression(self):
+        # Pulls a generic expression into memory in one step and decodes it there, so the token-by-token
+        # work of the converters and object checks never has to go back over the core link
+        from .MemoryLink import MemoryLink, KernelMemoryShuttleLink
+
+        link = self.active_link
+        if isinstance(link, MemoryLink):
+            return link._readExpr(self._decodeFrom, self._resolveSymbol)
+        head = link._peekHead()
+        if head is not None and len(self.Converter.decoders_for(head)) > 0:
+            # type-hinted payloads (PackedArrayInfo and friends) are read by their converters straight off the
+            # core link, so their arrays still come over in a single native GetArray instead of token by token
+            return super()._readExpression()
+        with KernelMemoryShuttleLink(self) as buf:
+            link._readTokens(buf)
+            return buf._readExpr(self._decodeFrom, self._resolveSymbol)
+
+    def _decodeFrom(self, buf):
+        # buf is the active link at this point, so the converters read from it through us
+        return self._decodeExpression()
+
+    def _resolveSymbol(self, name):
+        try:
+            return self.ObjectHandler.get(name)
+        except (KeyError, AttributeError, NameError):
+            return MLSym(name)
+
     def _getArray(self, otype, depth, headList=None):
         # This method could be left out of this class, instead relying on the superclass (KernelLinkImpl) implementation.
         # But that would eventually trickle down to the inefficient "catch-all" array-getting code in MathLinkImpl.
@@ -0,0 +1,289 @@
+"""KernelPool spreads evaluations over a set of kernels so that a single Python process can keep all of them busy
+
+"""
+
+import threading, queue
+from .MathLinkExceptions import MathLinkException
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import MLExpr, MLSym
+
+###############################################################################################
+#                                                                                             #
+#                                         KernelPool                                          #
+#                                                                                             #
+###############################################################################################
+
+class KernelPool:
+    """A pool of kernels, each owned by its own worker thread. Work goes to whichever kernel has the least
+queued up, dead kernels are swapped out for fresh ones without losing the work queued behind them,
+and every kernel runs the same warm-up expressions before it takes on any work.
+
+    with KernelPool(4, warmup = [ M.Needs("MyPackage`") ]) as pool:
+        fut = pool.submit(M.Integrate(M.Sin(M.x), M.x))
+        res = list(pool.map(M.Prime, range(1, 1000), chunksize = 50))
+
+    """
+
+    # error numbers that mean the kernel on the other end is gone (see Reader.run)
+    _DEAD_LINK_ERRORS = (1, 11)
+    _STOP = object()
+
+    def __init__(self, size = None, factory = None, warmup = (), health_check = None):
+        """
+        :param size: the number of kernels, defaults to the number of CPUs
+        :param factory: a function that launches a new KernelLink, defaults to WrappedKernelLink.from_new_kernel
+        :param warmup: expressions to evaluate on every kernel before it's given work
+        :param health_check: the expression check_health evaluates to see if a kernel is alive
+        """
+        if size is None:
+            import os
+            size = os.cpu_count() or 1
+        if factory is None:
+            from .KernelLink import WrappedKernelLink
+            factory = WrappedKernelLink.from_new_kernel
+        if health_check is None:
+            health_check = MLSym("$ProcessID")
+
+        self.factory = factory
+        self.warmup = tuple(warmup)
+        self.health_check = health_check
+        self.replacements = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [ _PoolWorker(self, i) for i in range(max(int(size), 1)) ]
+        for w in self._workers:
+            w.start()
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    @property
+    def links(self):
+        return [ w.link for w in self._workers ]
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "{}(size={}, replacements={})".format(type(self).__name__, self.size, self.replacements)
+
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    ###########################################################################################
+    #                                      Public API                                         #
+    ###########################################################################################
+
+    def submit(self, expr, timeout = None):
+        """Queues expr for evaluation on the least loaded kernel
+
+        :param expr:
+        :param timeout: seconds the evaluation gets once it's sent, as for KernelLink.evaluate
+        :return: a concurrent.futures.Future for the result, which can be cancelled until it's sent
+        """
+        return self.submit_call(self._evaluate, expr, timeout = timeout)
+
+    def submit_call(self, fn, *args, **kwargs):
+        """Queues fn(link, *args, **kwargs) to run against the least loaded kernel
+
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        from concurrent.futures import Future
+
+        fut = Future()
+        with self._lock:
+            if self._closed:
+                raise MathLinkException("LinkIsNull", "{} is closed".format(type(self).__name__))
+            worker = min(self._workers, key = lambda w: w.load)
+            worker.load += 1
+        worker.jobs.put((fn, args, kwargs, fut))
+        return fut
+
+    def map(self, fn_expr, items, chunksize = 1, timeout = None):
+        """Applies fn_expr to each of items across the pool, like Executor.map.
+Each chunk of items goes to a single kernel, where it's pipelined through evaluate_many.
+
+        :param fn_expr: the function to apply, e.g. M.Prime or a Function[...] expression
+        :param items:
+        :param chunksize: how many items to hand each kernel at a time
+        :param timeout: how long (in seconds) to wait on each chunk
+        :return: an iterator over the results, in order
+        """
+        if isinstance(fn_expr, str):
+            fn_expr = MLSym(fn_expr)
+        chunksize = max(int(chunksize), 1)
+
+        items = list(items)
+        futs = [
+            self.submit_call(self._evaluateChunk, [ MLExpr(fn_expr, (item, )) for item in items[i:i+chunksize] ])
+            for i in range(0, len(items), chunksize)
+        ]
+        return self._iterResults(futs, timeout)
+
+    def check_health(self, timeout = None):
+        """Runs the health check on every kernel at once, replacing any that fail it.
+The check waits behind whatever work is already queued on a kernel, and is only timed once it's sent.
+
+        :param timeout: how long (in seconds) each kernel gets to answer, as for KernelLink.evaluate
+        :return: a list with whether each kernel passed
+        """
+        futs = [ w.submit(self._checkHealth, w, timeout) for w in self._workers ]
+        res = []
+        for f in futs:
+            try:
+                res.append(f.result())
+            except Exception: # a kernel that can't even be relaunched isn't healthy either
+                res.append(False)
+        return res
+
+    def close(self, wait = True):
+        """Shuts down the workers once their queued work is done and closes the kernels
+
+        :param wait: whether to wait for the workers to finish
+        :return:
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for w in self._workers:
+            w.jobs.put(self._STOP)
+        if wait:
+            for w in self._workers:
+                w.join()
+
+    ###########################################################################################
+    #                                         Jobs                                            #
+    ###########################################################################################
+
+    @staticmethod
+    def _evaluate(link, expr, timeout = None):
+        return link._evaluate(expr, wait = True, timeout = timeout)
+
+    @staticmethod
+    def _evaluateChunk(link, exprs):
+        return link._evaluateMany(exprs)
+
+    def _checkHealth(self, link, worker, timeout = None):
+        from concurrent.futures import TimeoutError
+        try:
+            self._evaluate(link, self.health_check, timeout = timeout)
+        except TimeoutError:
+            # the deadline has already escalated on it, but a kernel that can't answer the check in time goes anyway
+            worker._replace(link, "timed out on its health check")
+            return False
+        return True
+
+    @staticmethod
+    def _iterResults(futs, timeout):
+        from concurrent.futures import TimeoutError
+        try:
+            for f in futs:
+                try:
+                    chunk = f.result(timeout)
+                except TimeoutError:
+                    f.cancel()
+                    raise
+                for r in chunk:
+                    yield r
+        finally:
+            for f in futs:
+                f.cancel()
+
+    def _launch(self):
+        # starts up a new kernel and runs the warm-up on it
+        link = self.factory()
+        try:
+            for expr in self.warmup:
+                self._evaluate(link, expr)
+        except:
+            link.close()
+            raise
+        return link
+
+    def _isDead(self, link, exc):
+        return exc.no in self._DEAD_LINK_ERRORS or not link._clearError()
+
+class _PoolWorker(threading.Thread):
+    """The thread that owns one kernel of a KernelPool"""
+
+    def __init__(self, pool, index):
+        super().__init__(name = "PJLinkPool-{}".format(index), daemon = True)
+        self.pool = pool
+        self.index = index
+        self.jobs = queue.Queue()
+        self.load = 0 # jobs queued or running, updated under the pool lock
+        self.link = None
+
+    def submit(self, fn, *args, **kwargs):
+        from concurrent.futures import Future
+
+        fut = Future()
+        with self.pool._lock:
+            self.load += 1
+        self.jobs.put((fn, args, kwargs, fut))
+        return fut
+
+    def run(self):
+        pool = self.pool
+        try:
+            try:
+                self.link = pool._launch()
+            except Exception:
+                # left for the first job to retry, so the failure lands on its future
+                Env.log_tb()
+            while True:
+                job = self.jobs.get()
+                if job is pool._STOP:
+                    break
+                fn, args, kwargs, fut = job
+                running = fut.set_running_or_notify_cancel()
+                if running:
+                    res, exc = self._runJob(fn, args, kwargs)
+                # the load has to drop before the caller hears back, or its next submit sees this kernel as busy
+                with pool._lock:
+                    self.load -= 1
+                if running:
+                    if exc is None:
+                        fut.set_result(res)
+                    else:
+                        fut.set_exception(exc)
+                        link = self.link
+                        if isinstance(exc, MathLinkException) and link is not None and pool._isDead(link, exc):
+                            self._replace(link)
+        finally:
+            if self.link is not None:
+                try:
+                    self.link.close()
+                except MathLinkException:
+                    pass
+                self.link = None
+
+    def _runJob(self, fn, args, kwargs):
+        try:
+            if self.link is None:
+                self.link = self.pool._launch()
+            return fn(self.link, *args, **kwargs), None
+        except Exception as e:
+            return None, e
+
+    def _replace(self, link, reason = "died"):
+        # swaps in a fresh kernel; if that fails too, the next job tries again
+        Env.logf("Kernel {} of {} {}, replacing it", self.index, self.pool, reason, level = "Error")
+        self.link = None
+        with self.pool._lock:
+            self.pool.replacements += 1
+        try:
+            link.close()
+        except MathLinkException:
+            pass
+        try:
+            self.link = self.pool._launch()
+        except Exception:
+            Env.log_tb()
@@ -0,0 +1,103 @@
+"""KernelSession keeps track of what PJLink has already set up on the kernel at the other end of a link
+
+"""
+
+import threading
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import MLExpr, MLSym, MPackage
+
+###############################################################################################
+#                                                                                             #
+#                                        KernelSession                                        #
+#                                                                                             #
+###############################################################################################
+
+class KernelSession:
+    """Installs the PJLink package and its type-hint machinery on a kernel once, so that evaluations after
+that only need to carry the AddTypeHints wrapper instead of re-sending Needs["PJLink`", path] every time.
+
+If the kernel loses the package (e.g. it was restarted underneath us), AddTypeHints comes back unevaluated.
+check notices that, reinstalls the package and applies the type hints to the value that came back.
+reset forces a reinstall on the next evaluation.
+
+    """
+
+    def __init__(self, link):
+        self.link = link
+        self.installed = False
+        self.process_id = None
+        self.installs = 0
+        self._lock = threading.RLock()
+        self._hints_head = MPackage.PackageTypeHints + "AddTypeHints"
+
+    def __repr__(self):
+        return "{}(installed={}, process_id={})".format(type(self).__name__, self.installed, self.process_id)
+
+    def install(self):
+        """Loads PJLink on the kernel, whether or not it has been already
+
+        :return:
+        """
+        link = self.link
+        M = link.M
+        with self._lock:
+            link._evaluateExpr(M.CompoundExpression(M._load_PJLink(), MLSym("$ProcessID")))
+            link.waitForAnswer()
+            self.process_id = link.get()
+            self.installed = True
+            self.installs += 1
+            if Env.LOG_INFO:
+                Env.logf("Installed PJLink on kernel {} ({} times)", self.process_id, self.installs, level = "Info")
+
+    def ensure(self):
+        if not self.installed:
+            with self._lock:
+                if not self.installed:
+                    self.install()
+
+    def reset(self):
+        """Forgets that PJLink has been installed, e.g. after the kernel has been restarted
+
+        :return:
+        """
+        self.installed = False
+        self.process_id = None
+
+    def wrap(self, expr):
+        """Installs PJLink if need be and wraps expr for evaluation
+
+        :param expr:
+        :return:
+        """
+        self.ensure()
+        return self.link.M._type_hints(expr)
+
+    def needs_install(self, res):
+        """Whether res is an AddTypeHints the kernel didn't know what to do with
+
+        :param res:
+        :return:
+        """
+        if isinstance(res, MLExpr) and len(res.args) == 1:
+            head = res.head
+            if isinstance(head, MLSym):
+                head = head.name
+            return head == self._hints_head
+        return False
+
+    def check(self, res):
+        """Reinstalls PJLink if res shows the kernel has lost it, giving back the value with its type hints applied
+
+        :param res:
+        :return:
+        """
+        if not self.needs_install(res):
+            return res
+        link = self.link
+        with self._lock:
+            Env.log("Kernel lost the PJLink package, reinstalling it", level = "Info")
+            self.reset()
+            self.install()
+            link._evaluateExpr(link.M._type_hints(res.args[0]))
+            link.waitForAnswer()
+            return link.get()
@@ -19,13 +19,27 @@ MathLinkFactory class.
 LoopbackLink has no methods; it is simply a type that marks certain links as having
 special properties.
 """
+
+    _pool = None
+
     def __enter__(self):
         return self
     def __exit__(self, exc_type, exc_val, exc_tb):
-        try:
-            self.close()
-        except:
-            pass
+        if self._pool is not None:
+            self._pool.release(self, failed = exc_type is not None)
+        else:
+            try:
+                self.close()
+            except:
+                pass
+
+    def _recycle(self, failed = False):
+        """Gets the link ready to be handed out again by a ShuttleLinkPool
+
+        :param failed: whether the last use of the link ended in an exception
+        :return: whether the link can be reused
+        """
+        return False
 
 
 class NativeLoopbackLink(NativeLink, LoopbackLink):
@@ -56,6 +70,10 @@ class NativeLoopbackLink(NativeLink, LoopbackLink):
         else:
             super().__init__(init)
 
+    def _recycle(self, failed = False):
+        # a failed put can leave a partial expression on the link which we have no way to clear
+        return (not failed) and (not self.closed) and self._error() == 0 and not self.ready
+
     def _setUseNumPy(self, flag):
         self._USE_NUMPY = flag
         return flag
@@ -84,14 +102,19 @@ class NativeShuttleLink(NativeLoopbackLink):
         return NativeLink._putMLExpr(self, call, stack = stack)
 
     def shuttle(self, expr, link, stack = None, use_loopback = False):
-        self.Env.logf("Shuttling {} to {}", expr, link)
+        if self.Env.LOG_TRANSFER:
+            self.Env.logf("Shuttling {} to {}", expr, link, level = "Transfer")
         self.put(expr, stack = stack, use_loopback = False)
         return link.transferToEndOfLoopbackLink(self)
 
     def _getUseNumPy(self):
         return self.parent.use_numpy
 
-class KernelShuttleLink(NativeShuttleLink):
+class KernelShuttleMixin:
+    """Makes a shuttle link the active link of its parent kernel for the duration of a with block
+so that nested puts end up on the shuttle rather than the core link
+
+    """
 
     def __enter__(self):
         try:
@@ -106,3 +129,74 @@ class KernelShuttleLink(NativeShuttleLink):
         except AttributeError:
             pass
         return super().__exit__(exc_type, exc_val, exc_tb)
+
+class KernelShuttleLink(KernelShuttleMixin, NativeShuttleLink):
+    pass
+
+###############################################################################################
+#                                                                                             #
+#                                       ShuttleLinkPool                                       #
+#                                                                                             #
+###############################################################################################
+
+class ShuttleLinkPool:
+    """A bounded pool of shuttle links. Links handed out by acquire() come back to the pool when their
+with block exits, so repeated puts don't have to open and close a fresh loopback link every time.
+Links that can't be cleanly reset (or that don't fit in the pool) are closed instead.
+
+    """
+
+    def __init__(self, factory, max_size = None):
+        import threading
+        from collections import deque
+
+        self._factory = factory
+        self._max_size = Env.SHUTTLE_POOL_SIZE if max_size is None else max_size
+        self._links = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def size(self):
+        return len(self._links)
+
+    def acquire(self):
+        with self._lock:
+            try:
+                link = self._links.pop()
+            except IndexError:
+                link = None
+        if link is None:
+            link = self._factory()
+            link._pool = self
+        return link
+
+    def release(self, link, failed = False):
+        try:
+            reuse = (not self._closed) and link._recycle(failed)
+        except Exception:
+            reuse = False
+
+        if reuse:
+            with self._lock:
+                if len(self._links) < self._max_size:
+                    self._links.append(link)
+                    return
+
+        self._discard(link)
+
+    @staticmethod
+    def _discard(link):
+        link._pool = None
+        try:
+            link.close()
+        except:
+            pass
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            links = list(self._links)
+            self._links.clear()
+        for link in links:
+            self._discard(link)
@@ -5,6 +5,7 @@ from abc import *
 from .MathLinkExceptions import *
 from .MathLinkEnvironment import MathLinkEnvironment as Env
 from .HelperClasses import *
+from .ExprProgram import ExprProgram
 
 ###############################################################################################
 #                                                                                             #
@@ -284,6 +285,20 @@ Follow this with calls to put the argument
         """
         raise NotImplemented
 
+    @abstractmethod
+    def transaction(self, checkLink = True, checkError = True, check = None):
+        """Returns a context manager that groups a set of puts into a single transaction.
+The link's lock is held for the whole block and the error state is checked once, when the block exits, rather than after every call.
+Transactions nest, so it is always safe to open one inside code that may itself be running inside a transaction.
+Gets inside a transaction don't raise on a link error, so don't read from the link in one unless you check the error state yourself.
+
+        :param checkLink: whether to check that the link is open when entering the transaction
+        :param checkError: whether to check the link's error state when leaving the transaction
+        :param check: the error codes that are allowed when leaving the transaction
+        :return:
+        """
+        raise NotImplemented
+
     @abstractmethod
     def checkpoint(self):
         raise NotImplemented
@@ -701,11 +716,27 @@ by more direct methods (specifically, STRING, BOOLEAN, LONG, BIGDECIMAL, BIGINTE
             else:
                 self._putRecursionError(arg)
     def _putMLExpr(self, call, stack = None):
-        self._putMLFunction(MLFunction(call.head, len(call.args)))
-        for a in call.args:
-            self._putMLExprArg(a, stack=stack)
-        if call.end:
-            self._endPacket()
+        program = ExprProgram.compile(call, self._compileSkips())
+        with self.transaction():
+            if program is not None:
+                self._putProgram(program)
+            else:
+                self._putMLFunction(MLFunction(call.head, len(call.args)))
+                for a in call.args:
+                    self._putMLExprArg(a, stack=stack)
+            if call.end:
+                self._endPacket()
+    def _putProgram(self, program):
+        """Writes out a compiled ExprProgram. Implementations that can do better than one put per token should override this
+
+        :param program:
+        :return:
+        """
+        func = self.Env.toTypeToken("Function")
+        def put_function(argc):
+            self._putNext(func)
+            self._putArgCount(argc)
+        program.run(put_function, self._putSymbol, self._putString, self._putInt, self._putDouble, self._putArray)
     def _putRecursionError(self, expr):
         self._putFunction("PJLink`RecursionError", 2)
         self._putString(repr(expr))
@@ -733,36 +764,98 @@ by more direct methods (specifically, STRING, BOOLEAN, LONG, BIGDECIMAL, BIGINTE
     del decimal
     del fraction
 
+    _putter_cache = {} # type -> resolved putter, filled in as new types come through _getPutter
+    _registered_putters = () # types given putters through register_putter
+    _compile_skips = None # types _putMLExpr can't compile because a registration covers them, see _compileSkips
+    _NUMPY_PUTTER = object()
+    _TYPE_NAME_PUTTER = object()
+
+    @classmethod
+    def register_putter(cls, otype, putter):
+        """Registers a putter for objects of type otype and for subclasses of it without a more specific putter
+
+        :param otype: the type to register for
+        :param putter: either the name of a put method, as in the values of _putter_map, or a function taking the link and the object
+        :return:
+        """
+
+        if "_putter_map" not in cls.__dict__:
+            cls._putter_map = dict(cls._putter_map)
+        cls._putter_map[otype] = putter
+        cls._putter_cache = {}
+        cls._registered_putters = cls._registered_putters + (otype, )
+        cls._compile_skips = None
+
+    @classmethod
+    def _compileSkips(cls):
+        skips = cls._compile_skips
+        if skips is None:
+            # besides the registered types themselves, a registration for a base class or an ABC
+            # can take over types ExprProgram would otherwise compile, e.g. Sequence covers list
+            registered = cls._registered_putters
+            skips = frozenset(registered).union(t for t in ExprProgram.compiled_types() if issubclass(t, registered))
+            cls._compile_skips = skips
+        return skips
+
+    @classmethod
+    def _resolvePutter(cls, otype):
+        putter_map = cls._putter_map
+        # walking the MRO means the most specific registration wins, e.g. bool over int or MLExpr over tuple
+        for base in otype.__mro__:
+            try:
+                putter = putter_map[base]
+            except KeyError:
+                pass
+            else:
+                break
+        else:
+            for key, putter in putter_map.items(): # picks up virtual subclasses of registered ABCs
+                if issubclass(otype, key):
+                    break
+            else:
+                putter = None
+
+        if putter is None:
+            array_types = (list, tuple, BufferedNDArray)
+            if Env.HAS_NUMPY:
+                import numpy as np
+                array_types = array_types + (np.ndarray, )
+            if issubclass(otype, array_types[:3]):
+                putter = "_putArray"
+            elif issubclass(otype, array_types):
+                putter = cls._NUMPY_PUTTER # only usable when the link has use_numpy set
+            elif hasattr(otype, "__getitem__"):
+                putter = cls._TYPE_NAME_PUTTER
+        elif isinstance(putter, str):
+            putter = "_put" + putter
+
+        return putter
+
     def _getPutter(self, o):
 
-        putter = None
         if o is None:
-            putter = self._putNone
-        else:
+            return self._putNone
+
+        otype = type(o)
+        try:
+            putter = self._putter_cache[otype]
+        except KeyError:
+            putter = self._putter_cache[otype] = self._resolvePutter(otype)
+
+        if isinstance(putter, str):
+            putter = getattr(self, putter)
+        elif putter is None:
+            pass
+        elif putter is self._NUMPY_PUTTER:
+            putter = self._putArray if self.use_numpy else None
+        elif putter is self._TYPE_NAME_PUTTER:
             try:
-                type_name = o["TypeName"]
-                putter = getattr(self, '_put'+type_name)
+                putter = getattr(self, '_put'+o["TypeName"])
             except:
-                for key, val in self._putter_map.items():
-                    if isinstance(o, key):
-                        putter = getattr(self, '_put'+val)
-                        break
-                else:
-                    array_types = (list, tuple, BufferedNDArray)
-                    if self.use_numpy:
-                        import numpy as np
-                        array_types = array_types + (np.ndarray, )
-                    if isinstance(o, array_types):
-                        putter = self._putArray
-                    else:
-                        putter = None
-                   # try:
-                   #
-                   #     it = iter(o) # check if is iterable
-                   #     putter = self._putArray
-                   # except:
-                   #     # self.Env.logf("couldn't get putter for {}", o)
-                   #     putter = None#self._putSingleObject # Dunno what the fallback should be
+                putter = None
+        else:
+            from types import MethodType
+            putter = MethodType(putter, self)
         return putter
 
     def put(self, o, stack = None):
@@ -806,6 +899,63 @@ by more direct methods (specifically, STRING, BOOLEAN, LONG, BIGDECIMAL, BIGINTE
         else:
             self.put(o, stack = stack)
 
+    def _transferTokens(self, source):
+        """Copies a single expression from source onto this link token by token.
+Generic fallback for transferExpression when the two links have no more direct way to move data between them.
+
+        :param source:
+        :return:
+        """
+
+        tname = self.Env.fromTypeToken(source._getType())
+        if tname == "Function":
+            argc = source._getArgCount()
+            self._putNext(self.Env.toTypeToken("Function"))
+            self._putArgCount(argc)
+            for i in range(argc + 1): # the head comes first
+                self._transferTokens(source)
+        elif tname == "Integer":
+            self._putInt(source._getInt())
+        elif tname == "Real":
+            self._putDouble(source._getDouble())
+        elif tname == "String":
+            self._putString(source._getString())
+        elif tname in ("Symbol", "Object"):
+            self._putSymbol(source._getSymbol())
+        else:
+            source._check_error()
+            raise MathLinkException("GetOutOfSequence", "cannot transfer token of type {}".format(tname))
+
+    def _readTokens(self, target):
+        """Reads one complete expression off this link onto the MemoryLink target.
+Links that can pull tokens more directly than through the generic getters should override this.
+
+        :param target:
+        :return:
+        """
+
+        target._transferTokens(self)
+
+    def _peekHead(self):
+        """Gives the name of the head of the function waiting on the link without reading it,
+or None if the next thing on the link isn't a function with a symbol for a head
+
+        :return:
+        """
+
+        if self._getType() != self.Env.toTypeToken("Function"):
+            return None
+        mark = self._createMark()
+        try:
+            head = self._getFunction().head
+        except MathLinkException:
+            self._clearError()
+            head = None
+        finally:
+            self._seekMark(mark)
+            self._destroyMark(mark)
+        return head
+
 class MathLink(MathLinkImplBase):
     """The step right below MathLink implementation wise
 
@@ -1015,6 +1165,23 @@ class MathLink(MathLinkImplBase):
 
         return allowFurtherProcessing
 
+    @staticmethod
+    def _isException(errCode, check=None):
+        if check is None:
+            err = errCode != 0 and errCode != 10
+        elif isinstance(check, int):
+            err = errCode != check
+        elif isinstance(check, str):
+            err = errCode != Env.getErrorInt(check)
+        elif callable(check):
+            err = check(errCode)
+        else:
+            try:
+                err = errCode not in check
+            except:
+                raise ValueError("cannot test error code against check {}".format(check))
+        return err
+
     @abstractmethod
     def _setUseNumPy(self, flag):
         raise NotImplemented
@@ -1042,4 +1209,9 @@ class MathLink(MathLinkImplBase):
         return [ pkt for pkt in self ]
 
     def setLogging(self, val=True):
-        self.Env.ALLOW_LOGGING = bool(val)
\ No newline at end of file
+        """Turns logging on or off, or sets the level to log at
+
+        :param val: a bool or a level from Env.LOG_LEVELS
+        :return:
+        """
+        self.Env.setLogLevel(val)
\ No newline at end of file
@@ -10,7 +10,17 @@ import os
 #                                                                                            #
 ##############################################################################################
 
-class MathLinkEnvironment:
+class _EnvironmentType(type):
+    """Lets ALLOW_LOGGING be set on the class directly while keeping the per-level flags in step with it"""
+
+    @property
+    def ALLOW_LOGGING(cls):
+        return cls._ALLOW_LOGGING
+    @ALLOW_LOGGING.setter
+    def ALLOW_LOGGING(cls, val):
+        cls.setLogLevel(cls.LOG_LEVEL if val else 0)
+
+class MathLinkEnvironment(metaclass = _EnvironmentType):
 
     """A class holding all of the MathLink environment flags that will be used elsewhere in the package
     """
@@ -84,8 +94,13 @@ class MathLinkEnvironment:
     ERROR_TYPES = {
         # Some of these need to agree with C code.
         "Ok"                 : 0,
+        "GetOutOfSequence"   : 3,
+        "PutOutOfSequence"   : 4,
+        "BadToken"           : 5,
+        "Overflow"           : 6,
         "Memory"             : 8,
         "Unconnected"        : 10,
+        "Closed"             : 11,
         "UnknownPacket"      : 23,
         "User"               : 1000,
         "NonMLError"         : 1000,
@@ -106,6 +121,12 @@ class MathLinkEnvironment:
     ERROR_TYPE_NAMES.update(tuple((item, key) for key, item in ERROR_TYPES.items()))
 
     ERROR_MESSAGES = {
+        "GetOutOfSequence": "Attempt to get out of sequence.",
+        "PutOutOfSequence": "Attempt to put out of sequence.",
+        "BadToken"        : "Bad token type requested.",
+        "Overflow"        : "Data was larger than the size that was promised.",
+        "Closed"          : "Link closed by the other side.",
+        "UnknownPacket"   : "Unknown packet head on link.",
         "ArrayTooShallow" : "Array is not as deep as requested.",
         "BadComplex"      : "Expression could not be read as a complex number.",
         "ConnectTimeout"  : "The link was not connected before the requested time limit elapsed.",
@@ -240,6 +261,8 @@ class MathLinkEnvironment:
         "Integer": "Int"
     }
 
+    TYPES = None # the TypeRegistry built from all of these, set up at the bottom of this module
+
     CALL_TYPES = {
         "CallPython"       : 1,
         "Throw"            : 2,
@@ -314,6 +337,44 @@ class MathLinkEnvironment:
     # Not currently used -- will force copies of data buffers to protect against corruption
     COPY_DATA_BUFFERS = False # I'm not sure I can actually disable this?
 
+    # Max number of idle shuttle links a WrappedKernelLink keeps around for reuse by put
+    SHUTTLE_POOL_SIZE = 8
+
+    # Default number of EvaluatePackets evaluate_many keeps in flight at once
+    EVALUATE_WINDOW = 16
+
+    # Max number of symbols MLSym keeps interned before starting its table over
+    SYMBOL_TABLE_SIZE = 2**16
+
+    # Default bound (in bytes) on what KernelLink.enable_cache keeps around
+    EVALUATION_CACHE_BYTES = 64 * 2**20
+
+    # How many compiled snippets of CallPython code KernelLink keeps around
+    CODE_CACHE_SIZE = 512
+
+    # How many threads run the CallPython requests Mathematica marks as independent, and how many finished results
+    # are held for collection before the oldest are dropped
+    CALL_POOL_SIZE = 8
+    CALL_RESULTS_SIZE = 1024
+
+    # The worker processes for CPU-bound callables: how many there are (None meaning one per core), the modules
+    # each one imports when it starts, and how big (in bytes) an array argument has to be to go through shared memory
+    CALL_PROCESS_POOL_SIZE = None
+    CALL_PROCESS_PRELOAD = ()
+    SHARED_MEMORY_THRESHOLD = 2**16
+
+    # How long KernelLink's coalescing mode holds a batch open for more evaluations, and the most it puts in one
+    COALESCE_WINDOW    = .002
+    COALESCE_MAX_ITEMS = 64
+
+    # What an evaluation that runs past its timeout gets put through: each step is a KernelLink method and the
+    # number of seconds to wait after the previous step before taking it (the first one happens at the deadline)
+    EVALUATION_ESCALATION = (
+        ("interruptEvaluation", 0.),
+        ("abortEvaluation",     1.),
+        ("terminateKernel",     5.)
+    )
+
     import platform
     PLATFORM = platform.system()
     del platform
@@ -328,10 +389,35 @@ class MathLinkEnvironment:
     if HAS_NUMPY:
         del np
 
-    # Used to turn logging on or off
-    ALLOW_LOGGING = False
+    # Used to turn logging on or off, through ALLOW_LOGGING (which goes through setLogLevel)
+    _ALLOW_LOGGING = False
     LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log.txt")
 
+    # Each level also logs everything at the levels below it
+    LOG_LEVELS = {
+        "Off"      : 0,
+        "Error"    : 1,
+        "Info"     : 2,
+        "Debug"    : 3, # what log and logf use unless told otherwise
+        "Transfer" : 4  # per-token and per-put chatter from the links themselves
+    }
+    # The level used once ALLOW_LOGGING is on, kept when logging is turned off
+    LOG_LEVEL = 3
+    # One flag per level, kept in sync by setLogLevel, so that hot code can decide whether to log with one lookup
+    LOG_ERROR    = False
+    LOG_INFO     = False
+    LOG_DEBUG    = False
+    LOG_TRANSFER = False
+
+    # The log file gets rotated to log.txt.1, log.txt.2, ... once it passes LOG_MAX_BYTES
+    LOG_MAX_BYTES = 10 * 2**20
+    LOG_BACKUP_COUNT = 3
+    # How often (in seconds) the background writer pushes buffered lines out to the log file
+    LOG_FLUSH_INTERVAL = .5
+    # Lines past this many waiting on the writer are dropped (and counted in the log) rather than piling up in memory
+    LOG_MAX_BUFFERED = 100000
+    _LOG_WRITER = None
+
     def __init__(self):
         raise TypeError("{} is a standalone class and cannot be instantiated".format(type(self).__name__))
 
@@ -350,23 +436,13 @@ class MathLinkEnvironment:
         :return:
         """
 
-        tint = None
         try:
-            tint = cls.TYPE_INTEGERS[o]
+            return cls.TYPES.type_ints[o]
         except KeyError:
-            for m in (cls.TYPE_MAP, cls.TYPECODE_MAP, cls.TYPE_INTEGERS, cls.TYPENAME_MAP):
-                try:
-                    tint = m[o]
-                    if isinstance(tint, str):
-                        tint = cls.TYPE_INTEGERS[tint]
-                    break
-                except KeyError:
-                    pass
-
-        return tint
+            return None
 
     @classmethod
-    def fromTypeInt(cls, tint, mode="intname"): ### THIS IS TERRIBLY DESIGNED TODO: MAKE IT NOT SUCK
+    def fromTypeInt(cls, tint, mode="intname"):
         """A convenience function that turns a type int into a python type, typecode, or typename
 
         :param tint:
@@ -374,47 +450,29 @@ class MathLinkEnvironment:
         :return:
         """
 
-        try:
-            if isinstance(tint, int):
-                tint = cls.TYPE_INTEGER_NAMES[tint]
-            if mode == "typename":
-                if tint in cls.TYPENAME_MAP:
-                    otype = cls.TYPENAME_MAP[tint]
-                elif isinstance(tint, str):
-                    otype = tint
-                else:
-                    otype = None
-            elif mode == "typecode":
-                otype = cls.TYPECODE_MAP[tint]
-            elif mode == "type":
-                otype = cls.TYPE_MAP[tint]
-            else:
-                otype = cls.TYPENAME_MAP[tint]
-        except KeyError:
-            otype = None
-
-        return otype
+        return cls.TYPES.from_type_int(tint, mode)
 
     @classmethod
     def getTypeNameFromTypeInt(cls, tint):
-        return cls.__lookup(cls.TYPE_INTEGER_NAMES, tint)
+        try:
+            return cls.TYPES.records[tint].name
+        except KeyError:
+            return None
     @classmethod
     def getTypeCodeFromTypeInt(cls, tint):
         if isinstance(tint, int):
-            tint = cls.getTypeNameFromTypeInt(tint)
+            try:
+                return cls.TYPES.records[tint].typecode
+            except KeyError:
+                return None
         return cls.__lookup(cls.TYPECODE_MAP, tint)
     @classmethod
     def getShortNameFromTypeInt(cls, tint):
-        return cls.fromTypeInt(cls.TYPENAME_MAP, "typename")
+        return cls.fromTypeInt(tint, "typename")
 
     @classmethod
     def getObjectTypeInt(cls, ob):
-        tint = None
-        for t, n in cls.TYPE_MAP.items():
-            if not isinstance(t, str) and isinstance(ob, t):
-                tint = cls.TYPE_INTEGERS[n]
-
-        return tint
+        return cls.TYPES.object_type_int(type(ob))
 
     @classmethod
     def getObjectArrayTypeInt(cls, arr):
@@ -426,18 +484,19 @@ class MathLinkEnvironment:
         from array import array
         from .HelperClasses import BufferedNDArray
 
+        type_ints = cls.TYPES.type_ints
         tint = None
         if isinstance(arr, (bytes, bytearray)):
-            tint = cls.toTypeInt("Byte")
+            tint = type_ints["Byte"]
         elif isinstance(arr, str):
-            tint = cls.toTypeInt("Char")
+            tint = type_ints["Char"]
         elif isinstance(arr, (BufferedNDArray, array)):
-            tint = cls.toTypeInt(arr.typecode)
+            tint = type_ints.get(arr.typecode, None)
 
         if tint is None and cls.HAS_NUMPY:
             import numpy as np
             if isinstance(arr, np.ndarray):
-                tint = cls.toTypeInt(arr.dtype.type)
+                tint = type_ints.get(arr.dtype.type, None)
 
         if tint is None:
 
@@ -504,18 +563,18 @@ class MathLinkEnvironment:
 
     @classmethod
     def getNumPyType(cls, tint):
-        """A convenience function that turns a numpy.dtype a type int
+        """A convenience function that turns a type int (or type name) into a numpy type
 
-        :param dtype:
+        :param tint:
         :return:
         """
 
-        try:
-            ttype = cls.NUMPY_TYPE_MAP[tint]
-        except KeyError:
-            ttype = None
-
-        return ttype
+        if isinstance(tint, int):
+            try:
+                return cls.TYPES.records[tint].numpy_type
+            except KeyError:
+                return None
+        return cls.__lookup(cls.TYPES.numpy_types, tint)
 
     @classmethod
     def allowRagged(cls):
@@ -926,18 +985,94 @@ class MathLinkEnvironment:
         return lib_name
 
     @classmethod
-    def log(cls, *expr):
-        if cls.ALLOW_LOGGING:
-            mode = "w+"
-            if os.path.isfile(cls.LOG_FILE):
-                mode = "a"
-            with open(cls.LOG_FILE, mode) as logger:
-                print(*expr, file=logger)
+    def setLogLevel(cls, level, log_file = None):
+        """Sets how much gets logged. True means everything, False means nothing.
+
+        :param level: a level name from LOG_LEVELS, the corresponding int, or a bool
+        :param log_file: the file to log to, if it should change
+        :return:
+        """
+
+        if level is True:
+            level = max(cls.LOG_LEVELS.values())
+        elif level is False or level is None:
+            level = 0
+        elif not isinstance(level, int):
+            level = cls.LOG_LEVELS[level]
+
+        if log_file is not None and log_file != cls.LOG_FILE:
+            cls.closeLog()
+            cls.LOG_FILE = log_file
+
+        if level > 0:
+            cls.LOG_LEVEL = level
+        for name, lvl in cls.LOG_LEVELS.items():
+            if lvl > 0:
+                setattr(cls, "LOG_" + name.upper(), level >= lvl)
+        cls._ALLOW_LOGGING = level > 0
+
+    @classmethod
+    def _logLevel(cls, level):
+        if isinstance(level, int):
+            return level
+        return cls.LOG_LEVELS[level]
+
+    @classmethod
+    def _logWriter(cls):
+        writer = cls._LOG_WRITER
+        if writer is None:
+            writer = cls._LOG_WRITER = LogWriter(
+                cls.LOG_FILE, cls.LOG_MAX_BYTES, cls.LOG_BACKUP_COUNT, cls.LOG_FLUSH_INTERVAL,
+                max_lines = cls.LOG_MAX_BUFFERED, format_arg = cls._logArg
+            )
+        return writer
+
+    @classmethod
+    def flushLog(cls):
+        writer = cls._LOG_WRITER
+        if writer is not None:
+            writer.flush()
+
+    @classmethod
+    def closeLog(cls):
+        writer = cls._LOG_WRITER
+        cls._LOG_WRITER = None
+        if writer is not None:
+            writer.close()
+
+    @classmethod
+    def log(cls, *expr, level = 3):
+        if cls._ALLOW_LOGGING and cls.LOG_LEVEL >= cls._logLevel(level):
+            cls._logWriter().write(" ".join(str(e) for e in expr))
 
     @classmethod
-    def logf(cls, logs, *args, **kwargs):
-        if cls.ALLOW_LOGGING:
-            cls.log(logs.format(*args, **kwargs))
+    def logf(cls, logs, *args, level = 3, **kwargs):
+        # the message is formatted on the writer thread, with big containers and arrays abbreviated,
+        # so the caller only pays for queueing it
+        if cls._ALLOW_LOGGING and cls.LOG_LEVEL >= cls._logLevel(level):
+            cls._logWriter().write_format(logs, args, kwargs)
+
+    _LOG_REPR = None
+    _LOG_ARRAY_TYPES = None
+    @classmethod
+    def _logArg(cls, a):
+        if type(a) in (list, tuple, dict, set, frozenset):
+            if cls._LOG_REPR is None:
+                import reprlib
+                cls._LOG_REPR = reprlib.Repr()
+                cls._LOG_REPR.maxlevel = 3
+            return cls._LOG_REPR.repr(a)
+
+        if cls._LOG_ARRAY_TYPES is None:
+            from .HelperClasses import BufferedNDArray
+            array_types = (BufferedNDArray, )
+            if cls.HAS_NUMPY:
+                import numpy as np
+                array_types = array_types + (np.ndarray, )
+            cls._LOG_ARRAY_TYPES = array_types
+        if isinstance(a, cls._LOG_ARRAY_TYPES):
+            a = "<{} shape={}>".format(type(a).__name__, tuple(a.shape))
+        return a
 
     TRACEBACK_LIMIT = 3
     @classmethod
@@ -949,5 +1084,276 @@ class MathLinkEnvironment:
 
     @classmethod
     def log_tb(cls, limit = None):
-        if cls.ALLOW_LOGGING:
-            cls.log(cls.get_tb(limit))
\ No newline at end of file
+        if cls._ALLOW_LOGGING and cls.LOG_LEVEL >= 1:
+            cls.log(cls.get_tb(limit), level = "Error")
+
+##############################################################################################
+#                                                                                            #
+#                                        LogWriter                                           #
+#                                                                                            #
+##############################################################################################
+
+class LogWriter:
+    """Buffers log lines in memory and writes them out from a background thread, keeping the file open
+in between and rotating it once it gets too big. Callers only ever pay for appending to a list; messages
+queued through write_format are formatted on the background thread too. Once max_lines are waiting,
+further lines are dropped and the count of them gets written out in their place.
+
+    """
+
+    def __init__(self, path, max_bytes = None, backup_count = 3, flush_interval = .5, max_buffer = 1000,
+                 max_lines = 100000, format_arg = None):
+        import threading, atexit
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_lines = max_lines
+        self.format_arg = format_arg
+        self.dropped = 0
+
+        self._buffer = []
+        self._failed = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = None
+
+        self._thread = threading.Thread(target = self._run, name = "PJLinkLogWriter", daemon = True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line):
+        self._queue(line)
+
+    def write_format(self, fmt, args = (), kwargs = None):
+        """Queues fmt.format(*args, **kwargs) to be formatted when it gets written out
+
+        :param fmt:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+
+        self._queue((fmt, args, kwargs))
+
+    def _queue(self, entry):
+        with self._lock:
+            n = len(self._buffer)
+            if n < self.max_lines:
+                self._buffer.append(entry)
+            else:
+                self.dropped += 1
+        if n + 1 >= self.max_buffer:
+            self._wake.set()
+
+    def _format(self, entry):
+        if type(entry) is str:
+            return entry
+        fmt, args, kwargs = entry
+        if kwargs is None:
+            kwargs = {}
+        fa = self.format_arg
+        try:
+            if fa is not None:
+                args = [ fa(a) for a in args ]
+                kwargs = { k : fa(a) for k, a in kwargs.items() }
+            return fmt.format(*args, **kwargs)
+        except Exception as e:
+            return "{} (couldn't format the log message: {!r})".format(fmt, e)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                if not self._failed: # once is enough, this would otherwise come up every cycle
+                    self._failed = True
+                    import sys
+                    sys.stderr.write("PJLink: couldn't write to the log file {}: {!r}\n".format(self.path, e))
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        return self._file
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = "{}.{}".format(self.path, i)
+                if os.path.exists(src):
+                    os.replace(src, "{}.{}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def flush(self):
+        with self._lock:
+            lines = self._buffer
+            self._buffer = []
+            dropped = self.dropped
+            self.dropped = 0
+        with self._write_lock:
+            if dropped:
+                lines.append("... {} log lines dropped, the writer couldn't keep up".format(dropped))
+            if lines:
+                lines = [ self._format(l) for l in lines ]
+                f = self._open()
+                f.write("\n".join(lines))
+                f.write("\n")
+                f.flush()
+                if self.max_bytes is not None and f.tell() >= self.max_bytes:
+                    self._rotate()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            self.flush()
+            with self._write_lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+##############################################################################################
+#                                                                                            #
+#                                       TypeRegistry                                         #
+#                                                                                            #
+##############################################################################################
+
+from collections import namedtuple
+TypeRecord = namedtuple("TypeRecord", ["type_int", "name", "short_name", "typecode", "numpy_type", "python_type"])
+
+class TypeRegistry:
+    """Everything the environment knows about data types, worked out once up front. Every type int gets a
+TypeRecord tying together its name, short name, array typecode, numpy type and python type, and everything that
+toTypeInt and fromTypeInt can resolve sits in a flat read-only table so lookups are a single dict hit.
+The python type of an object is resolved once per type and cached.
+
+    """
+
+    def __init__(self, env):
+        from types import MappingProxyType
+
+        self._env = env
+        numpy_map = env.NUMPY_TYPE_MAP if env.HAS_NUMPY else {}
+
+        # every key the old lookup chains could get anywhere with
+        keys = []
+        for m in (env.TYPE_INTEGERS, env.TYPE_MAP, env.TYPECODE_MAP, env.TYPENAME_MAP, env.TYPE_INTEGER_NAMES):
+            keys.extend(m.keys())
+
+        type_ints = {}
+        for k in keys:
+            tint = self._resolveTypeInt(env, k)
+            if tint is not None:
+                type_ints[k] = tint
+        self.type_ints = MappingProxyType(type_ints)
+
+        from_modes = {}
+        for mode in ("typename", "typecode", "type", "intname"):
+            table = {}
+            for k in keys:
+                res = self._resolveFromTypeInt(env, k, mode)
+                if res is not None:
+                    table[k] = res
+            from_modes[mode] = MappingProxyType(table)
+        self._from_modes = MappingProxyType(from_modes)
+
+        records = {}
+        for name, tint in env.TYPE_INTEGERS.items():
+            records[tint] = TypeRecord(
+                tint,
+                env.TYPE_INTEGER_NAMES[tint],
+                from_modes["typename"].get(tint, None),
+                env.TYPECODE_MAP.get(name, None),
+                numpy_map.get(name, None),
+                env.TYPE_MAP.get(name, None)
+            )
+        self.records = MappingProxyType(records)
+        self.numpy_types = MappingProxyType(dict(numpy_map))
+
+        self._python_types = tuple((t, env.TYPE_INTEGERS[n]) for t, n in env.TYPE_MAP.items() if not isinstance(t, str))
+        self._object_type_ints = {}
+
+    def __repr__(self):
+        return "{}({} types)".format(type(self).__name__, len(self.records))
+
+    @staticmethod
+    def _resolveTypeInt(env, o):
+        # the lookup chain toTypeInt used to walk on every call
+        tint = None
+        try:
+            tint = env.TYPE_INTEGERS[o]
+        except KeyError:
+            for m in (env.TYPE_MAP, env.TYPECODE_MAP, env.TYPE_INTEGERS, env.TYPENAME_MAP):
+                try:
+                    tint = m[o]
+                    if isinstance(tint, str):
+                        tint = env.TYPE_INTEGERS[tint]
+                    break
+                except KeyError:
+                    pass
+        return tint
+
+    @staticmethod
+    def _resolveFromTypeInt(env, tint, mode):
+        # the branching fromTypeInt used to do on every call
+        try:
+            if isinstance(tint, int):
+                tint = env.TYPE_INTEGER_NAMES[tint]
+            if mode == "typename":
+                if tint in env.TYPENAME_MAP:
+                    otype = env.TYPENAME_MAP[tint]
+                elif isinstance(tint, str):
+                    otype = tint
+                else:
+                    otype = None
+            elif mode == "typecode":
+                otype = env.TYPECODE_MAP[tint]
+            elif mode == "type":
+                otype = env.TYPE_MAP[tint]
+            else:
+                otype = env.TYPENAME_MAP[tint]
+        except KeyError:
+            otype = None
+        return otype
+
+    def from_type_int(self, tint, mode = "intname"):
+        try:
+            table = self._from_modes[mode]
+        except KeyError:
+            table = self._from_modes["intname"]
+        try:
+            return table[tint]
+        except KeyError:
+            # type names we know nothing about are passed through as their own short name
+            if mode == "typename" and isinstance(tint, str):
+                return tint
+            return None
+
+    def object_type_int(self, otype):
+        """Gives the type int for objects of type otype
+
+        :param otype:
+        :return:
+        """
+
+        try:
+            return self._object_type_ints[otype]
+        except KeyError:
+            tint = None
+            for t, i in self._python_types:
+                if issubclass(otype, t): # the last match wins, so bool beats int
+                    tint = i
+            self._object_type_ints[otype] = tint
+            return tint
+
+MathLinkEnvironment.TYPES = TypeRegistry(MathLinkEnvironment)
@@ -0,0 +1,854 @@
+"""MemoryLink implements the MathLink interface in pure python on top of an in-memory token buffer. It never touches
+PJLinkNativeLibrary, so it can serve as a cheap scratch link (loopback links, put shuttles, Expr buffers) and it allows
+the put/get machinery to be exercised on machines that do not have Mathematica installed."""
+
+from .LoopbackLink import LoopbackLink, KernelShuttleMixin
+from .MathLinkExceptions import *
+from .HelperClasses import *
+
+###############################################################################################
+#                                                                                             #
+#                                          MemoryLink                                         #
+#                                                                                             #
+###############################################################################################
+
+class MemoryLink(LoopbackLink):
+    """MemoryLink is a loopback link that lives entirely in memory.
+
+Data is stored as a flat sequence of tokens: a typed array of token types and a parallel list of values.
+Atomic tokens carry their value directly. A Function token carries its argument count and is followed by
+its head and then its arguments, exactly as they come off a real link.
+Reads move a cursor through the buffer, so marks are just saved cursor positions and transferring an
+expression between two MemoryLinks is a slice copy.
+    """
+
+    _FUNCTION = Env.toTypeToken("Function")
+    _STRING   = Env.toTypeToken("String")
+    _SYMBOL   = Env.toTypeToken("Symbol")
+    _REAL     = Env.toTypeToken("Real")
+    _INTEGER  = Env.toTypeToken("Integer")
+    _ATOMS    = (_STRING, _SYMBOL, _REAL, _INTEGER)
+
+    _PACKET_HEADS = { name + "Packet" : pkt for name, pkt in Env.PACKET_TYPES.items() }
+    _PACKET_HEADS.update({
+        "EnterExpressionPacket"  : Env.getPacketInt("EnterExpr"),
+        "ReturnExpressionPacket" : Env.getPacketInt("ReturnExpr")
+    })
+
+    # the consumed part of the buffer is dropped once it is at least this long and makes up half the buffer
+    _COMPACT_SIZE = 256
+    _NO_HEAD = object() # marks a function whose (non-symbol) head hasn't been read yet
+
+    def __init__(self, name = None):
+        import threading
+        from array import array
+        from collections import deque
+
+        self._types = array('i')
+        self._values = []
+        self._pos = 0
+        self._packet_end = None
+        self._get_text = None
+        self._pending = None
+        self._marks = {}
+        self._mark_id = 0
+        self._markStack = deque()
+        self._messages = deque()
+        self._err = 0
+        self._err_msg = None
+        self._USE_NUMPY = None
+        self._lock = threading.RLock()
+        self._closed = None
+        self._kernel = None
+        self._link = id(self)
+        self._link_name = "MemoryLink-{}".format(self._link) if name is None else name
+
+    ###########################################################################################
+    #                                    Link state                                           #
+    ###########################################################################################
+
+    @property
+    def link(self):
+        return self._link
+
+    @property
+    def thread_lock(self):
+        return self._lock
+
+    def _wrap(self, checkLink = True, checkError = True, check = None, lock = True, timeout = None, poll = 20):
+        return LinkWrapper(self, checkLink = checkLink, checkError = checkError, check = check, lock = lock, timeout=timeout, poll=poll)
+
+    # LinkTransaction bookkeeping
+    _transaction_owner = None
+    _transaction_depth = 0
+
+    def transaction(self, checkLink = True, checkError = True, check = None):
+        # every call on a MemoryLink raises its errors straight away so this only serves to hold the lock
+        return LinkTransaction(self, checkLink = checkLink, checkError = checkError, check = check)
+
+    def activate(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._reset()
+
+    def _reset(self):
+        del self._types[:]
+        self._values = []
+        self._pos = 0
+        self._packet_end = None
+        self._get_text = None
+        self._pending = None
+        self._marks.clear()
+        self._markStack.clear()
+
+    def _recycle(self, failed = False):
+        # unlike a native loopback link we can always get back to a clean state
+        self._reset()
+        self._clearError()
+        self._messages.clear()
+        return not self._closed
+
+    def _check_link(self):
+        if self._closed:
+            raise MathLinkException("LinkIsNull")
+
+    def _check_error(self, allowed = None):
+        if self._isException(self._err, allowed):
+            raise MathLinkException(self._err, self._errorMessage())
+
+    def _fail(self, err, msg = None):
+        """Sets the error state of the link and raises the corresponding MathLinkException
+
+        :param err: error name or number
+        :param msg: extended error message
+        :return:
+        """
+
+        if isinstance(err, str):
+            err = self.Env.getErrorInt(err)
+        self._err = err
+        self._err_msg = msg
+        raise MathLinkException(err, self._errorMessage())
+
+    def _connect(self):
+        if self._closed is None:
+            self._closed = False
+        return True
+
+    def _name(self):
+        return self._link_name
+
+    def _error(self):
+        if self._closed:
+            return self.Env.getErrorInt("LinkIsNull")
+        return self._err
+
+    def _clearError(self):
+        self._err = 0
+        self._err_msg = None
+        self._pending = None
+        return not self._closed
+
+    def _errorMessage(self):
+        if self._closed:
+            return MathLinkException.lookupMessageText("LinkIsNull")
+        elif self._err_msg is not None:
+            return self._err_msg
+        else:
+            return MathLinkException.lookupMessageText(self._err)
+
+    def _setError(self, err):
+        self._err = err
+        return True
+
+    def _ready(self):
+        return self._pos < len(self._types)
+
+    def flush(self):
+        return True
+
+    def _compact(self):
+        pos = self._pos
+        if self._marks or pos < self._COMPACT_SIZE or 2 * pos < len(self._types):
+            return
+        del self._types[:pos]
+        del self._values[:pos]
+        if self._packet_end is not None:
+            self._packet_end -= pos
+        self._pos = 0
+
+    def _skip(self, pos):
+        """Finds the end of the expression starting at pos
+
+        :param pos:
+        :return:
+        """
+
+        types = self._types
+        values = self._values
+        func = self._FUNCTION
+        remaining = 1
+        end = len(types)
+        while remaining > 0:
+            if pos >= end:
+                self._fail("GetOutOfSequence", "incomplete expression on link")
+            if types[pos] == func:
+                remaining += values[pos] + 1
+            remaining -= 1
+            pos += 1
+        return pos
+
+    ###########################################################################################
+    #                                       Packets                                           #
+    ###########################################################################################
+
+    def _nextPacket(self):
+        if self._packet_end is not None and self._pos < self._packet_end:
+            self._pos = self._packet_end
+        self._packet_end = None
+        self._get_text = None
+
+        pos = self._pos
+        types = self._types
+        if pos >= len(types):
+            self._fail("GetOutOfSequence", "no packet on link")
+
+        pkt = None
+        if types[pos] == self._FUNCTION and pos + 1 < len(types) and types[pos + 1] == self._SYMBOL:
+            pkt = self._PACKET_HEADS.get(self._values[pos + 1], None)
+
+        self._packet_end = self._skip(pos)
+        if pkt is None:
+            # the cursor stays at the start of the expression so that it can be read in its entirety
+            self._fail("UnknownPacket")
+        self._pos = pos + 2
+
+        return pkt
+
+    def _newPacket(self):
+        if self._packet_end is not None and self._pos < self._packet_end:
+            self._pos = self._packet_end
+        self._packet_end = None
+        self._get_text = None
+        self._compact()
+        return True
+
+    def _endPacket(self):
+        if self._pending is not None:
+            self._fail("PutOutOfSequence", "packet ended before all promised data was put")
+        return True
+
+    ###########################################################################################
+    #                                       Getting                                           #
+    ###########################################################################################
+
+    def _take(self, *tokens):
+        pos = self._pos
+        try:
+            t = self._types[pos]
+        except IndexError:
+            self._fail("GetOutOfSequence", "no data left to read on link")
+        if t not in tokens:
+            self._fail(
+                "GetOutOfSequence",
+                "expected token of type {} but got {}".format(
+                    "/".join(self.Env.fromTypeToken(k) for k in tokens),
+                    self.Env.fromTypeToken(t)
+                )
+            )
+        self._pos = pos + 1
+        self._get_text = None
+        return self._values[pos]
+
+    def _getType(self):
+        try:
+            return self._types[self._pos]
+        except IndexError:
+            self._fail("GetOutOfSequence", "no data left to read on link")
+
+    def _getNext(self):
+        if self._get_text is not None:
+            # drop the remainder of a partially read atom
+            self._pos += 1
+            self._get_text = None
+        return self._getType()
+
+    def _getArgCount(self):
+        return self._take(self._FUNCTION)
+
+    def _getFunction(self):
+        argc = self._take(self._FUNCTION)
+        head = self._take(self._SYMBOL)
+        return MLFunction(head, argc)
+
+    def _peekHead(self):
+        pos = self._pos + 1
+        types = self._types
+        if pos < len(types) and types[pos - 1] == self._FUNCTION and types[pos] == self._SYMBOL:
+            return self._values[pos]
+        return None
+
+    def _checkFunction(self, f, argCount = None):
+        if isinstance(f, MLFunction):
+            f, argCount = f.head, f.argCount
+        if isinstance(f, MLSym):
+            f = f.name
+
+        func = self._getFunction()
+        if func.head != f or (argCount is not None and func.argCount != argCount):
+            self._fail(
+                "GetOutOfSequence",
+                "expected function {}[{}] but got {}[{}]".format(f, argCount, func.head, func.argCount)
+            )
+        return func.argCount
+
+    def _getSymbol(self):
+        return self._take(self._SYMBOL)
+    def _getString(self):
+        return self._tokenText(self._take(*self._ATOMS))
+    def _getByteString(self, missing = 0):
+        s = self._take(self._STRING, self._SYMBOL)
+        return bytes(ord(c) if ord(c) < 256 else missing for c in s)
+    def _getInt(self):
+        return int(self._take(self._INTEGER, self._REAL))
+    def _getByte(self):
+        return self._getInt()
+    def _getShort(self):
+        return self._getInt()
+    def _getLong(self):
+        return self._getInt()
+    def _getChar(self):
+        return chr(self._getInt())
+    def _getDouble(self):
+        return float(self._take(self._REAL, self._INTEGER))
+    def _getFloat(self):
+        return self._getDouble()
+
+    @staticmethod
+    def _tokenText(val):
+        if isinstance(val, float):
+            return repr(val)
+        else:
+            return str(val)
+
+    def _bytesToGet(self):
+        if self._get_text is None:
+            pos = self._pos
+            if pos >= len(self._types) or self._types[pos] == self._FUNCTION:
+                return 0
+            return len(self._tokenText(self._values[pos]).encode("utf-8"))
+        else:
+            return len(self._get_text)
+
+    def _getData(self, num):
+        if self._get_text is None:
+            pos = self._pos
+            if pos >= len(self._types) or self._types[pos] == self._FUNCTION:
+                self._fail("GetOutOfSequence", "no textual data to read on link")
+            self._get_text = self._tokenText(self._values[pos]).encode("utf-8")
+        chunk = self._get_text[:num]
+        self._get_text = self._get_text[num:]
+        if len(self._get_text) == 0:
+            self._pos += 1
+            self._get_text = None
+        return chunk
+
+    def get(self):
+        """Reads the next complete expression off the link as python data.
+Functions come back as MLExpr, symbols as MLSym and atoms as the corresponding python type.
+
+        :return:
+        """
+
+        return self._readExpr()
+
+    def _readExpr(self, decode = None, symbol = MLSym):
+        """Reads the next complete expression off the link in a single pass, using an explicit stack
+of the functions still waiting on arguments rather than recursing
+
+        :param decode: called with the cursor at each function, returns the decoded value or None to read the function as an MLExpr
+        :param symbol: turns a symbol name into a value
+        :return:
+        """
+
+        if self._pos >= len(self._types):
+            self._fail("GetOutOfSequence", "no data left to read on link")
+        self._get_text = None
+
+        # decode can create and destroy marks, so hold one of our own to keep the buffer from being compacted under us
+        mark = self._createMark()
+        try:
+            return self._readExprLoop(decode, symbol)
+        finally:
+            self._destroyMark(mark)
+
+    def _readExprLoop(self, decode, symbol):
+        stack = [] # [ head, argc, args ] for each function still being read
+        types = self._types
+        values = self._values
+        func = self._FUNCTION
+        sym = self._SYMBOL
+        no_head = self._NO_HEAD
+
+        while True:
+            pos = self._pos
+            try:
+                t = types[pos]
+            except IndexError:
+                self._fail("GetOutOfSequence", "incomplete expression on link")
+
+            res = None
+            if t == func:
+                if decode is not None:
+                    res = decode(self)
+                if res is None:
+                    argc = values[pos]
+                    if pos + 1 < len(types) and types[pos + 1] == sym:
+                        self._pos = pos + 2
+                        head = values[pos + 1]
+                        if argc > 0:
+                            stack.append([head, argc, []])
+                            continue
+                        res = MLExpr(head, ())
+                    else:
+                        self._pos = pos + 1
+                        stack.append([no_head, argc, []])
+                        continue
+            elif t == sym:
+                self._pos = pos + 1
+                res = symbol(values[pos])
+            else:
+                self._pos = pos + 1
+                res = values[pos]
+
+            # hand the value up to the functions it completes
+            while stack:
+                frame = stack[-1]
+                if frame[0] is no_head:
+                    frame[0] = res.name if isinstance(res, MLSym) else res
+                    if frame[1] > 0:
+                        break
+                else:
+                    frame[2].append(res)
+                    if len(frame[2]) < frame[1]:
+                        break
+                stack.pop()
+                res = MLExpr(frame[0], tuple(frame[2]))
+            if not stack:
+                return res
+
+    def _getArrayLevel(self, getter, depth, heads, level):
+        func = self._getFunction()
+        if heads is not None and level < len(heads):
+            heads[level] = func.head
+        if level == depth - 1:
+            return [ getter() for i in range(func.argCount) ]
+        else:
+            return [ self._getArrayLevel(getter, depth, heads, level + 1) for i in range(func.argCount) ]
+
+    def _getArray(self, otype, depth, headList = None):
+        import array, itertools
+
+        if not isinstance(otype, int):
+            otype = self.Env.toTypeInt(otype)
+
+        tname = self.Env.getTypeNameFromTypeInt(otype)
+        tc = self.Env.getTypeCodeFromTypeInt(otype)
+
+        if isinstance(tc, str):
+            getter = self._getDouble if tc in "fd" else self._getInt
+        else:
+            getter = lambda : self._getSingleObject(tname)
+
+        res = self._getArrayLevel(getter, depth, headList, 0)
+
+        if isinstance(tc, str):
+            dims = []
+            sub = res
+            for i in range(depth):
+                dims.append(len(sub))
+                if len(sub) == 0:
+                    dims.extend([ 0 ] * (depth - len(dims)))
+                    break
+                sub = sub[0]
+
+            flat = res
+            for i in range(depth - 1):
+                flat = list(itertools.chain.from_iterable(flat))
+
+            size = 1
+            for d in dims:
+                size *= d
+            if len(flat) != size:
+                if self.Env.allowRagged():
+                    return res
+                else:
+                    raise MathLinkException("ArrayTooShallow", "array on link is ragged")
+
+            res = BufferedNDArray(array.array(tc, flat), dims)
+            if self.use_numpy:
+                res = res.tonumpy()
+
+        return res
+
+    ###########################################################################################
+    #                                       Putting                                           #
+    ###########################################################################################
+
+    def _putToken(self, t, val):
+        self._types.append(t)
+        self._values.append(val)
+
+    def _putSymbol(self, s):
+        if isinstance(s, MLSym):
+            s = s.name
+        self._putToken(self._SYMBOL, s)
+    def _putString(self, s):
+        self._putToken(self._STRING, s)
+    def _putInt(self, i):
+        self._putToken(self._INTEGER, int(i))
+    def _putDouble(self, f):
+        self._putToken(self._REAL, float(f))
+    def _putBool(self, b):
+        self._putToken(self._SYMBOL, "True" if b else "False")
+    def _putFloat(self, d):
+        import math
+        if math.isnan(d):
+            self._putSymbol("Indeterminate")
+        elif math.isinf(d):
+            if d > 0:
+                self._putSymbol("Infinity")
+            else:
+                self._putFunction("DirectedInfinity", 1)
+                self._putInt(-1)
+        else:
+            self._putDouble(d)
+
+    def _putByteString(self, data, num = None):
+        if isinstance(num, int) and num > 0:
+            data = data[:num]
+        self._putToken(self._STRING, bytes(data).decode("latin-1"))
+
+    def _putFunction(self, f, argCount = None):
+        if isinstance(f, MLFunction):
+            f, argCount = f.head, f.argCount
+        elif argCount is None:
+            raise ValueError("Can't put function without argcount")
+        if isinstance(f, MLSym):
+            f = f.name
+
+        self._putToken(self._FUNCTION, argCount)
+        if isinstance(f, str):
+            self._putToken(self._SYMBOL, f)
+        else:
+            self.put(f)
+
+    def _putNext(self, ptype):
+        if ptype != self._FUNCTION and ptype not in self._ATOMS:
+            self._fail("BadToken", "cannot put token of type {}".format(ptype))
+        self._pending = [ ptype, None, bytearray() ]
+
+    def _putArgCount(self, argCount):
+        if self._pending is None or self._pending[0] != self._FUNCTION:
+            self._fail("PutOutOfSequence", "argument count put without a preceding Function token")
+        self._pending = None
+        self._putToken(self._FUNCTION, argCount)
+
+    def _putSize(self, size):
+        if self._pending is None or self._pending[0] == self._FUNCTION or self._pending[1] is not None:
+            self._fail("PutOutOfSequence", "size put without a preceding atomic token")
+        self._pending[1] = size
+        if size == 0:
+            self._commitPending()
+
+    def _bytesToPut(self):
+        if self._pending is None or self._pending[1] is None:
+            return 0
+        return self._pending[1] - len(self._pending[2])
+
+    def _putData(self, data, num = None):
+        from array import array
+        if isinstance(data, (bytes, bytearray)):
+            pass
+        elif isinstance(data, array) and data.typecode == 'b':
+            data = data.tobytes()
+        else:
+            raise ValueError("cannot interpret data as bytes-compatible object")
+        if self._pending is None or self._pending[1] is None:
+            self._fail("PutOutOfSequence", "data put without a preceding size")
+        if not isinstance(num, int):
+            num = len(data)
+
+        ptype, size, buf = self._pending
+        buf.extend(data[:num])
+        if len(buf) > size:
+            self._fail("Overflow")
+        elif len(buf) == size:
+            self._commitPending()
+
+    def _commitPending(self):
+        ptype, size, buf = self._pending
+        self._pending = None
+        text = bytes(buf).decode("utf-8")
+        if ptype == self._INTEGER:
+            val = int(text)
+        elif ptype == self._REAL:
+            val = float(text.replace(self.Env.EXP_STRING, "e"))
+        else:
+            val = text
+        self._putToken(ptype, val)
+
+    def put(self, o, stack = None, use_loopback = False):
+        """Same as the NativeLink version: objects without a direct putter go through the attached kernel
+
+        :param o:
+        :param stack:
+        :return:
+        """
+
+        putter = self._getPutter(o)
+        if putter is None:
+            if self._kernel is None:
+                raise MathLinkException("CannotPut", "no putter for object of type {}".format(type(o).__name__))
+            self._kernel.put(o, stack = stack, coerce = True)
+        else:
+            if stack is None:
+                stack = set()
+            if putter is self._putMLExpr or putter is self._putArray:
+                return putter(o, stack = stack)
+            else:
+                return putter(o)
+
+    def _putArray(self, o, headList = None, stack = None):
+        flat = None
+        if isinstance(o, BufferedNDArray):
+            start, end = o.offsets
+            flat = o._buffer[start:len(o._buffer) - end].tolist()
+            dims = o.shape
+            real = o.typecode in "fd"
+        elif self.use_numpy:
+            import numpy as np
+            if isinstance(o, np.ndarray) and o.ndim > 0 and o.dtype.kind in "iuf":
+                flat = o.ravel().tolist()
+                dims = o.shape
+                real = o.dtype.kind == "f"
+
+        if flat is not None:
+            self._putFlatArray(flat, dims, headList, self._REAL if real else self._INTEGER, 0, 0)
+        else:
+            self._putArraySequence(o, headList, 0, stack)
+
+    def _putProgram(self, program):
+        # the reference implementation: a program maps straight onto our token buffer
+        types = self._types
+        values = self._values
+        strings = program.strings
+        arrays = program.arrays
+        ints = iter(program.ints)
+        reals = iter(program.reals)
+        tokens = (self._FUNCTION, self._SYMBOL, self._STRING, self._INTEGER, self._REAL)
+        SYMBOL, STRING, REAL, ARRAY = program.SYMBOL, program.STRING, program.REAL, program.ARRAY
+
+        for op in program.ops:
+            if op == ARRAY:
+                self._putArray(arrays[next(ints)])
+                continue
+            types.append(tokens[op])
+            if op == SYMBOL or op == STRING:
+                values.append(strings[next(ints)])
+            elif op == REAL:
+                values.append(next(reals))
+            else:
+                values.append(next(ints))
+
+    @staticmethod
+    def _arrayHead(heads, level):
+        head = None
+        if heads is not None and level < len(heads):
+            head = heads[level]
+        return head if isinstance(head, str) else "List"
+
+    def _putFlatArray(self, flat, dims, heads, tok, level, start):
+        from array import array
+
+        n = dims[level]
+        self._putToken(self._FUNCTION, n)
+        self._putToken(self._SYMBOL, self._arrayHead(heads, level))
+        if level == len(dims) - 1:
+            self._types.extend(array('i', [ tok ]) * n)
+            self._values.extend(flat[start:start + n])
+            start += n
+        else:
+            for i in range(n):
+                start = self._putFlatArray(flat, dims, heads, tok, level + 1, start)
+        return start
+
+    def _putArraySequence(self, o, heads, level, stack):
+        self._putFunction(self._arrayHead(heads, level), len(o))
+        for el in o:
+            if el is o:
+                self._putRecursionError(o)
+            elif isinstance(el, (list, tuple)):
+                self._putArraySequence(el, heads, level + 1, stack)
+            else:
+                self.put(el, stack = stack)
+
+    ###########################################################################################
+    #                                Transfer and marks                                       #
+    ###########################################################################################
+
+    def transferExpression(self, source):
+        if isinstance(source, MemoryLink):
+            start = source._pos
+            end = source._skip(start)
+            self._types.extend(source._types[start:end])
+            self._values.extend(source._values[start:end])
+            source._pos = end
+            source._get_text = None
+            source._compact()
+        elif hasattr(source, "getMathLink"):
+            self.transferExpression(source.getMathLink())
+        else:
+            source._readTokens(self)
+
+    def _readTokens(self, target):
+        target.transferExpression(self)
+
+    def transferToEndOfLoopbackLink(self, source):
+        if isinstance(source, MemoryLink):
+            start = source._pos
+            self._types.extend(source._types[start:])
+            self._values.extend(source._values[start:])
+            source._pos = len(source._types)
+            source._get_text = None
+            source._compact()
+        else:
+            while source.ready:
+                self.transferExpression(source)
+
+    @property
+    def checkpoint(self):
+        try:
+            m = self._markStack[-1]
+        except IndexError:
+            m = None
+        return m
+
+    def make_checkpoint(self):
+        mark = LinkMark(self)
+        mark.init()
+        self._markStack.append(mark)
+        return mark
+
+    def revert_checkpoint(self):
+        try:
+            mark = self._markStack.pop()
+            if mark is not None:
+                mark.revert()
+        except IndexError:
+            pass
+
+    def _createMark(self):
+        self._mark_id += 1
+        self._marks[self._mark_id] = (self._pos, self._packet_end)
+        return self._mark_id
+
+    def _seekMark(self, mark):
+        try:
+            self._pos, self._packet_end = self._marks[mark]
+        except KeyError:
+            pass
+        else:
+            self._get_text = None
+
+    def _destroyMark(self, mark):
+        self._marks.pop(mark, None)
+        self._compact()
+
+    ###########################################################################################
+    #                                 Messages and settings                                   #
+    ###########################################################################################
+
+    def _getMessage(self):
+        try:
+            return self._messages.popleft()
+        except IndexError:
+            return 0
+
+    def _putMessage(self, msg):
+        msg_cached = msg
+        if not isinstance(msg, int):
+            msg = self.Env.getMessageInt(msg)
+        if msg is None:
+            raise ValueError("MathLink error message {} unknown".format(msg_cached))
+        self._messages.append(msg)
+        return True
+
+    def _messageReady(self):
+        return len(self._messages) > 0
+
+    def setYieldFunction(self, meth):
+        return False
+    def _setYieldFunctionOn(self, target, meth):
+        return False
+    def addMessageHandler(self, meth):
+        return False
+    def _addMessageHandlerOn(self, target, meth):
+        return False
+
+    @property
+    def use_numpy(self):
+        if self._USE_NUMPY is None:
+            self._USE_NUMPY = self.Env.HAS_NUMPY
+        return self._USE_NUMPY
+
+    @use_numpy.setter
+    def use_numpy(self, val):
+        self._setUseNumPy(val)
+
+    def _setUseNumPy(self, flag):
+        self._USE_NUMPY = bool(flag)
+        return self._USE_NUMPY
+    def _getUseNumPy(self):
+        return self.use_numpy
+
+    def _setDebugLevel(self, val):
+        pass
+
+###############################################################################################
+#                                                                                             #
+#                                      MemoryShuttleLink                                      #
+#                                                                                             #
+###############################################################################################
+
+class MemoryShuttleLink(MemoryLink):
+    """The MemoryLink counterpart of NativeShuttleLink
+
+    """
+
+    def __init__(self, parent, name = None):
+        super().__init__(name)
+        self.parent = parent
+        try:
+            self._kernel = parent._kernel
+        except AttributeError:
+            self._kernel = parent
+
+    def shuttle(self, expr, link, stack = None, use_loopback = False):
+        if self.Env.LOG_TRANSFER:
+            self.Env.logf("Shuttling {} to {}", expr, link, level = "Transfer")
+        self.put(expr, stack = stack, use_loopback = False)
+        return link.transferToEndOfLoopbackLink(self)
+
+    def _getUseNumPy(self):
+        return self.parent.use_numpy
+
+class KernelMemoryShuttleLink(KernelShuttleMixin, MemoryShuttleLink):
+    pass
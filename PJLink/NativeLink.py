@@ -5,6 +5,7 @@ not require direct calls into the native library. The code that resides in Nativ
 layer of the functionality of a MathLink implementation, where there is nothing left to do but call into
 the MathLink C library."""
 
+import threading
 from .MathLink import MathLink
 from .MathLinkExceptions import *
 from .HelperClasses import *
@@ -26,6 +27,11 @@ class NativeLink(MathLink):
     __LIBRARY_LOAD_EXCEPTION = None
     __NATIVE_LIBRARY_EXISTS = False
 
+    # LinkTransaction bookkeeping
+    _transaction_owner = None
+    _transaction_depth = 0
+    _NULL_WRAPPER = NullLinkWrapper()
+
     def __init__(self, init = None, debug_level = 0, errMsgOut = None):
 
         import os, re, threading
@@ -171,8 +177,14 @@ class NativeLink(MathLink):
 
     def _wrap(self, checkLink = True, checkError = True, check = None, lock = True, timeout = None, poll = 20):
         # self.Env.logf("acquiring LinkWrapper(checkLink = {}, checkError = {}, check = {}, lock = {}, timeout = {}, poll = {})", checkLink, checkError, check, lock, timeout, poll)
+        if self._transaction_owner is not None and self._transaction_owner == threading.get_ident():
+            # the open transaction already holds the lock and will check for errors when it closes
+            return self._NULL_WRAPPER
         return LinkWrapper(self, checkLink = checkLink, checkError = checkError, check = check, lock = lock, timeout=timeout, poll=poll)
 
+    def transaction(self, checkLink = True, checkError = True, check = None):
+        return LinkTransaction(self, checkLink = checkLink, checkError = checkError, check = check)
+
     def activate(self):
         return self.__lib.Activate(self)
 
@@ -190,23 +202,6 @@ class NativeLink(MathLink):
             self._link = 0
             self._MLINK = None
 
-    @staticmethod
-    def _isException(errCode, check=None):
-        if check is None:
-            err = errCode != 0 and errCode != 10
-        elif isinstance(check, int):
-            err = errCode != check
-        elif isinstance(check, str):
-            err = errCode != Env.getErrorInt(check)
-        elif callable(check):
-            err = check(errCode)
-        else:
-            try:
-                err = errCode not in check
-            except:
-                raise ValueError("cannot test error code against check {}".format(check))
-        return err
-
     def _check_link(self):
         if self._link == 0:
             raise MathLinkException("LinkIsNull")
@@ -420,11 +415,10 @@ class NativeLink(MathLink):
         elif argCount is None:
             raise ValueError("Can't put function without argcount")
         with self._wrap():
-            self.Env.log("Puting Function type token")
+            if self.Env.LOG_TRANSFER:
+                self.Env.logf("Putting function {} with argcount {}", f, argCount, level = "Transfer")
             self._call("PutNext", self.Env.toTypeToken('Function'))
-            self.Env.logf("Puting argcount {}", argCount)
             self._call("PutArgCount", argCount)
-            self.Env.logf("Puting symbol {}", f)
             self._call("PutSymbol", f)
 
     def _checkFunction(self, f, argCount = None):
@@ -441,20 +435,23 @@ class NativeLink(MathLink):
 
     def transferExpression(self, source, checkError=True):
         with self._wrap(checkError=checkError):
-            Env.logf("Transferring to {} from {}", self, source)
+            if Env.LOG_TRANSFER:
+                Env.logf("Transferring to {} from {}", self, source, level = "Transfer")
             with source._wrap():
                 if isinstance(source, NativeLink):
                     self._call("TransferExpression", source)
                 elif hasattr(source, "getMathLink"):
                     self.transferExpression(source.getMathLink())
                 else:
-                    self.put(source.getExpr())
+                    self._transferTokens(source)
 
-            Env.logf("Transferred to {} from {}", self, source)
+            if Env.LOG_TRANSFER:
+                Env.logf("Transferred to {} from {}", self, source, level = "Transfer")
 
     def transferToEndOfLoopbackLink(self, source):
         with self._wrap():
-            Env.logf("Transferring to {} from {}", self, source)
+            if Env.LOG_TRANSFER:
+                Env.logf("Transferring to {} from {}", self, source, level = "Transfer")
             with source._wrap():
                 if isinstance(source, NativeLink):
                     self._call("TransferToEndOfLoopbackLink", source)
@@ -462,6 +459,43 @@ class NativeLink(MathLink):
                     while source.ready:
                         self.transferExpression(source)
 
+    def _readTokens(self, target):
+        # Same idea as _putProgram: resolve the native getters once and pull the whole expression inside a
+        # single transaction, with a count of the tokens still owed instead of recursion
+        get_type = self._lib_func("GetType")
+        get_arg_count = self._lib_func("GetArgCount")
+        get_symbol = self._lib_func("GetSymbol")
+        get_string = self._lib_func("GetString")
+        get_int = self._lib_func("GetInteger")
+        get_double = self._lib_func("GetDouble")
+        func, sym, string, integer, real = [ self.Env.toTypeToken(t) for t in ("Function", "Symbol", "String", "Integer", "Real") ]
+        put = target._putToken
+
+        with self.transaction():
+            remaining = 1
+            try:
+                while remaining > 0:
+                    remaining -= 1
+                    t = get_type(self)
+                    if t == func:
+                        argc = get_arg_count(self)
+                        put(func, argc)
+                        remaining += argc + 1 # the head comes first
+                    elif t == sym:
+                        put(sym, get_symbol(self))
+                    elif t == string:
+                        put(string, get_string(self))
+                    elif t == integer:
+                        put(integer, get_int(self))
+                    elif t == real:
+                        put(real, get_double(self))
+                    else:
+                        raise MathLinkException("GetOutOfSequence", "cannot read token of type {}".format(self.Env.fromTypeToken(t)))
+            except Exception:
+                # a failed get hands back junk that can trip up the target first, but the link error is the real one
+                self._check_error()
+                raise
+
     def _getMessage(self):
         with self._wrap(checkError=False, lock=False):
             return self._call("GetMessage")
@@ -577,19 +611,21 @@ class NativeLink(MathLink):
         """
 
         putter = self._getPutter(o)
-        self.Env.logf("Putter {}", putter)
+        if self.Env.LOG_TRANSFER:
+            self.Env.logf("Putter {}", putter, level = "Transfer")
         if putter is None:
             self._kernel.put(o, stack = stack, coerce = True)
         else:
             # self.Env.logf("delegating put to {}", putter)
             if stack is None:
                 stack = set()
-            # the checking of whether an object is on the stack should only be done
-            # where necessary, which in general will be in _putMLExpr
-            if putter is self._putMLExpr or putter is self._putArray:
-                return putter(o, stack = stack)
-            else:
-                return putter(o)
+            with self.transaction():
+                # the checking of whether an object is on the stack should only be done
+                # where necessary, which in general will be in _putMLExpr
+                if putter is self._putMLExpr or putter is self._putArray:
+                    return putter(o, stack = stack)
+                else:
+                    return putter(o)
 
     def _putArray(self, o, headList=None):
         # Already guaranteed by caller (MathLinkImpl) that data is an array and not null. All
@@ -601,13 +637,14 @@ class NativeLink(MathLink):
 
             arr, tint, dims, depth = self._get_put_array_params(o) # will not be accurate for ragged arrays, but we won't use the result in that case.
 
-            self.Env.logf("Putting array {} of type {} with dimensions {} and depth {} on link", arr, tint, dims, depth)
+            if self.Env.LOG_TRANSFER:
+                self.Env.logf("Putting array {} of type {} with dimensions {} and depth {} on link", arr, tint, dims, depth, level = "Transfer")
 
             if tint is not None:
                 sent = False
                 if depth == 1:
                     if isinstance(arr, BufferedNDArray):
-                        ostart, ostop = arr.offsets == (0, 0)
+                        ostart, ostop = arr.offsets
                         if ostart == 0 and ostop == 0:
                             arr = arr._buffer
                         else:
@@ -649,6 +686,37 @@ class NativeLink(MathLink):
             else:
                 self._putArrayPiecemeal(o, headList, 0)
 
+    def _putProgram(self, program):
+        # There's no single native entry point for a whole program, so the next best thing is to resolve the
+        # native calls once and drive them directly, inside one transaction, skipping the per-token wrapping
+        func = self.Env.toTypeToken("Function")
+        put_next = self._lib_func("PutNext")
+        put_arg_count = self._lib_func("PutArgCount")
+        put_symbol = self._lib_func("PutSymbol")
+        put_string = self._lib_func("PutString")
+        put_int = self._lib_func("PutInteger")
+        put_double = self._lib_func("PutDouble")
+        put_array = self._lib_func("PutArray")
+
+        def put_function(argc):
+            put_next(self, func)
+            put_arg_count(self, argc)
+        def put_packed(arr):
+            if isinstance(arr, BufferedNDArray) and arr.ndim == 1 and arr.offsets == (0, 0):
+                put_array(self, self.Env.toTypeInt(arr.typecode), arr._buffer, None)
+            else:
+                self._putArray(arr)
+
+        with self.transaction():
+            program.run(
+                put_function,
+                lambda s : put_symbol(self, s),
+                lambda s : put_string(self, s),
+                lambda i : put_int(self, i),
+                lambda d : put_double(self, d),
+                put_packed
+            )
+
     def _putArraySlices(self, o, tint, head_list, head_index ):
         try:
             len(o)
@@ -661,18 +729,19 @@ class NativeLink(MathLink):
             head_list = []
             head_num = 0
 
-        if head_index == head_num - 1:
-            self._call("PutArray", tint, o, head_list[head_index])
-        else:
-            try:
-                head = head_list[head_index]
-            except IndexError:
-                head = "List"
-                head_list += [ "List" ] * ( head_index - head_num + 1)
-
-            self._putFunction(head, len(o))
-            for e in o:
-                self._putArraySlices(e, tint, head_list, head_index + 1)
+        with self.transaction():
+            if head_index == head_num - 1:
+                self._call("PutArray", tint, o, head_list[head_index])
+            else:
+                try:
+                    head = head_list[head_index]
+                except IndexError:
+                    head = "List"
+                    head_list += [ "List" ] * ( head_index - head_num + 1)
+
+                self._putFunction(head, len(o))
+                for e in o:
+                    self._putArraySlices(e, tint, head_list, head_index + 1)
 
     def nativeYielderCallback(self, ignore):
         return self._yielderCallback()
@@ -3,9 +3,12 @@ from .KernelLink import KernelLink
 from .StdLink import StdLink
 from .MathLinkExceptions import MathLinkException
 from .MathLinkEnvironment import MathLinkEnvironment as Env
-from collections import deque
+from collections import deque, namedtuple
 from .HelperClasses import MPackage
 
+EvaluationBatch = namedtuple("EvaluationBatch", ["exprs", "window", "collect"])
+EvaluationStream = namedtuple("EvaluationStream", ["expr", "emit"])
+
 class Reader:
     """
      The Reader is what listens for calls from Mathematica for the "installable Java" functionality
@@ -37,11 +40,8 @@ class Reader:
         self.__always_poll = always_poll
         self.__killer = threading.Event()
 
-        # this is for a polling setup, mainly
+        # evaluations requested from other threads, each paired with the Future its caller waits on
         self.__eval_queue = deque([])
-        self.__results_queue = deque([])
-        self.__eval_number = 0
-        self.__results_number = 0
 
         #  The Reader needs to operate slightly differently on the mainLink (JavaLink[]) than when used
         #  on the new preemptiveLink. Specifically, it never polls on the preemptiveLink because that
@@ -107,21 +107,114 @@ class Reader:
     def started(self):
         return self.__started
 
-    def evaluate(self, expr, wait=True):
+    def submit(self, expr, timeout = None):
+        """Queues expr for evaluation on the reader thread
+
+        :param expr: the expression (or EvaluationBatch) to evaluate
+        :param timeout: the number of seconds the evaluation gets, counting the time spent in the queue
+        :return: a concurrent.futures.Future that gets the result as soon as the reader thread has it. Cancelling it works until the evaluation has been sent.
+        """
+        from concurrent.futures import Future
+        import time
+
+        fut = Future()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.__eval_queue.append((expr, fut, deadline))
+        if not self.__started:
+            # the thread went away while we were queueing
+            self._abandonEvaluations()
+        return fut
+
+    def evaluate(self, expr, wait=True, timeout=None):
+        """Evaluates expr, by way of the reader thread if it's running
+
+        :param expr:
+        :param wait: whether to wait for the result or just give back the Future for it
+        :param timeout: how long (in seconds) to wait before giving up. An evaluation that hasn't been sent yet is cancelled on timeout.
+        :return:
+        """
         if self.__started:
-            self.__eval_queue.append(expr)
+            fut = self.submit(expr, timeout = timeout)
             if wait:
-                import time
-                self.__eval_number += 1
-                eval_num = self.__eval_number
-                while eval_num > self.__results_number:
-                    time.sleep(.05)
-                return self.__results_queue.popleft()
+                from concurrent.futures import TimeoutError
+                try:
+                    return fut.result(timeout)
+                except TimeoutError:
+                    if fut.cancel():
+                        raise
+                # it's been sent, so the reader thread will see it through its deadline
+                return fut.result()
+            else:
+                return fut
+        else:
+            return self.__link.evaluate(expr, wait, timeout = timeout)
+
+    def evaluate_many(self, exprs, window = None, collect = False, timeout = None):
+        # the whole batch goes through the queue as one item so the reader thread runs it in a single pipelined pass
+        if self.__started:
+            return self.evaluate(EvaluationBatch(list(exprs), window, collect), wait = True, timeout = timeout)
         else:
-            return self.__link.evaluate(expr, wait)
+            return self.__link._evaluateMany(exprs, window = window, collect = collect, timeout = timeout)
+
+    def evaluate_stream(self, expr, timeout = None):
+        # the reader thread runs the stream and hands the packets over through a queue as they come in
+        if not self.__started:
+            yield from self.__link._evaluateStream(expr)
+            return
+
+        import queue
+        pkts = queue.Queue()
+        fut = self.submit(EvaluationStream(expr, pkts.put))
+        fut.add_done_callback(lambda f: pkts.put(None)) # however the evaluation ends, the stream does too
+        while True:
+            try:
+                pkt = pkts.get(timeout = timeout)
+            except queue.Empty:
+                if fut.cancel():
+                    from concurrent.futures import TimeoutError
+                    raise TimeoutError()
+                continue # already running, so the packets are on their way
+            if pkt is None:
+                break
+            yield pkt
+        fut.result()
+
+    def evaluateString(self, expr, wait=True, timeout=None):
+        return self.evaluate(MPackage.ToExpression(expr), wait, timeout)
+
+    def _runEvaluation(self, to_eval, fut, deadline = None):
+        # set_running_or_notify_cancel is False if the caller gave up on it while it was queued
+        if fut.set_running_or_notify_cancel():
+            try:
+                timeout = None
+                if deadline is not None:
+                    import time
+                    from concurrent.futures import TimeoutError
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError("evaluation timed out before it was sent")
+                if isinstance(to_eval, EvaluationBatch):
+                    ev_res = self.__link._evaluateMany(to_eval.exprs, window = to_eval.window, collect = to_eval.collect, timeout = timeout)
+                elif isinstance(to_eval, EvaluationStream):
+                    for pkt in self.__link._evaluateStream(to_eval.expr):
+                        to_eval.emit(pkt)
+                    ev_res = None
+                else:
+                    ev_res = self.__link._evaluate(to_eval, wait = True, timeout = timeout)
+            except Exception as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(ev_res)
 
-    def evaluateString(self, expr, wait=True):
-        self.evaluate(MPackage.ToExpression(expr), wait)
+    def _abandonEvaluations(self):
+        # nothing will ever answer these once the thread is gone, so don't leave anyone waiting on them
+        while len(self.__eval_queue) > 0:
+            try:
+                to_eval, fut, deadline = self.__eval_queue.popleft()
+            except IndexError:
+                break
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(MathLinkException("LinkIsNull", "reader thread stopped before evaluation was sent"))
 
     def stop_reader(self):
         # StopReader() will generally only be effective if you have called startReader() with alwaysPoll=true. Always call this
@@ -141,15 +234,13 @@ class Reader:
             while not self.__stop_requested:
                 if len(self.__eval_queue) > 0:
                     try:
-                        to_eval = self.__eval_queue.popleft()
+                        to_eval, fut, deadline = self.__eval_queue.popleft()
                     except IndexError as e:
                         # import traceback as tb
                         # self.__link.Env.log(tb.format_exc())
                         pass
                     else:
-                        ev_res = self.__link._evaluate(to_eval, wait = True)
-                        self.__results_queue.append(ev_res)
-                        self.__results_number += 1
+                        self._runEvaluation(to_eval, fut, deadline)
 
                     continue
 
@@ -196,14 +287,14 @@ class Reader:
                         except MathLinkException as e:
                             # 11 is "other side closed link"; not sure why this succeeds clearError, but it does.
                             import traceback as tb
-                            self.__link.Env.log(tb.format_exc())
+                            self.__link.Env.log(tb.format_exc(), level = "Error")
                             if e.no == 11 or e.no == 1 or not self.__link._clearError():
                                 return None
                             self.__link._newPacket()
 
         except Exception as e:
             import traceback as tb
-            self.__link.Env.log(tb.format_exc())
+            self.__link.Env.log(tb.format_exc(), level = "Error")
 
         finally:
             # Get here on unrecoverable MathLinkException, ThreadDeath exception caused by "hard" aborts
@@ -211,6 +302,7 @@ class Reader:
             # TODO: For sake of JavaKernel, do I want to move the link-closing stuff up here before the quitWhenLinkEnds test?
             self.__link.Env.log("Bailing out of run")
             self.__started = False
+            self._abandonEvaluations()
             if self.__quit_on_link_end:
                 self.__link.close()
                 self.__link = None
@@ -0,0 +1,152 @@
+"""VectorizedFunction lets Mathematica call a Python function over whole packed arrays in a single CallPacket
+
+"""
+
+from .MathLinkEnvironment import MathLinkEnvironment as Env
+from .HelperClasses import BufferedNDArray
+
+###############################################################################################
+#                                                                                             #
+#                                     VectorizedFunction                                      #
+#                                                                                             #
+###############################################################################################
+
+class VectorizedFunction:
+    """Wraps a Python function so it can be applied to packed arrays in one go. The arrays come in as NumPy arrays
+or BufferedNDArrays (through the PackedArrayInfo decoder) and whatever comes back is made into an array again,
+so it goes out through _putArray as one flat block instead of element by element.
+
+An elementwise function is applied to each element in turn, ufunc-style: array arguments have to line up and
+anything else is passed through as is. Otherwise the function gets the arrays themselves.
+
+    fid = link.register_vectorized(math.erf, elementwise = True)
+    # PyCall[fid, {RandomReal[1, {1000, 1000}]}] on the Mathematica side
+
+    """
+
+    _type_codes = { int : "l", float : "d" }
+
+    def __init__(self, fn, elementwise = False, typecode = None, use_numpy = None):
+        """
+        :param fn: the function to call
+        :param elementwise: whether fn takes single elements rather than arrays
+        :param typecode: the array typecode (or NumPy dtype) for the result, inferred from the first element by default
+        :param use_numpy: whether to give back NumPy arrays, defaults to Env.HAS_NUMPY
+        """
+        self.fn = fn
+        self.elementwise = elementwise
+        self.typecode = typecode
+        self.use_numpy = Env.HAS_NUMPY if use_numpy is None else use_numpy
+
+    def __repr__(self):
+        return "{}({}, elementwise={})".format(type(self).__name__, self.fn, self.elementwise)
+
+    def __call__(self, *args, **kwargs):
+        if not self.elementwise:
+            return self._toArray(self.fn(*args, **kwargs))
+
+        shape = None
+        flat = []
+        for arg in args:
+            arg_shape = self._shapeOf(arg)
+            if arg_shape is None:
+                flat.append(None)
+                continue
+            if shape is None:
+                shape = arg_shape
+            elif arg_shape != shape:
+                raise ValueError("{}: array arguments have shapes {} and {}, which don't line up".format(
+                    type(self).__name__, shape, arg_shape
+                ))
+            flat.append(self._flatten(arg))
+
+        if shape is None:
+            return self.fn(*args, **kwargs)
+
+        fn = self.fn
+        n = len(next(f for f in flat if f is not None))
+        columns = [ f if f is not None else (arg, ) * n for f, arg in zip(flat, args) ]
+        res = [ fn(*vals, **kwargs) for vals in zip(*columns) ]
+        return self._toArray(res, shape)
+
+    @staticmethod
+    def _shapeOf(arg):
+        if isinstance(arg, BufferedNDArray):
+            return arg.shape
+        elif isinstance(arg, (list, tuple)):
+            shape = []
+            while isinstance(arg, (list, tuple)):
+                shape.append(len(arg))
+                if len(arg) == 0:
+                    break
+                arg = arg[0]
+            return tuple(shape)
+        elif Env.HAS_NUMPY:
+            import numpy
+            if isinstance(arg, numpy.ndarray):
+                return arg.shape
+        return None
+
+    @staticmethod
+    def _flatten(arg):
+        if isinstance(arg, BufferedNDArray):
+            start, end = arg.offsets
+            buff = arg._buffer
+            return buff[start:len(buff) - end]
+        elif isinstance(arg, (list, tuple)):
+            flat = []
+            stack = [ arg ]
+            while stack:
+                a = stack.pop()
+                if isinstance(a, (list, tuple)):
+                    stack.extend(reversed(a))
+                else:
+                    flat.append(a)
+            return flat
+        else:
+            return arg.ravel()
+
+    def _toArray(self, res, shape = None):
+        # gets res into a form _putArray can send flat
+        if isinstance(res, BufferedNDArray):
+            return res
+        if Env.HAS_NUMPY:
+            import numpy
+            if isinstance(res, numpy.generic):
+                # a NumPy scalar would go out as an ObjectInstance
+                return res.item()
+            if self.use_numpy and (shape is not None or isinstance(res, (numpy.ndarray, list, tuple))):
+                res = numpy.asarray(res, dtype = self.typecode)
+                if shape is not None:
+                    res = res.reshape(shape)
+                if res.dtype.kind not in "ifc" or Env.getNumPyTypeInt(res.dtype) is None:
+                    # bools, strings and the like don't pack, so they go back as plain (nested) lists of Python values
+                    return res.tolist()
+                return res
+        if shape is None:
+            shape = self._shapeOf(res)
+            if shape is None:
+                return res
+            res = self._flatten(res)
+        import array
+
+        typecode = self.typecode
+        if typecode is None:
+            if len(res) == 0:
+                typecode = "d"
+            else:
+                if Env.HAS_NUMPY:
+                    import numpy
+                    if isinstance(res[0], numpy.generic):
+                        res = [ r.item() if isinstance(r, numpy.generic) else r for r in res ]
+                typecode = self._type_codes.get(type(res[0]))
+                if typecode is None:
+                    # not something that packs, so it goes back as a plain nested list
+                    return self._reshape(list(res), shape)
+        return BufferedNDArray(array.array(typecode, res), shape)
+
+    @staticmethod
+    def _reshape(flat, shape):
+        for dim in reversed(shape[1:]):
+            flat = [ flat[i:i + dim] for i in range(0, len(flat), dim) ]
+        return flat
@@ -5,5 +5,14 @@ from .MathLinkExceptions import *
 from .KernelLink import *
 from .MathLink import *
 from .NativeLink import *
+from .MemoryLink import *
 from .HelperClasses import *
-from .Reader import *
\ No newline at end of file
+from .Reader import *
+from .AsyncKernelLink import *
+from .KernelPool import *
+from .EvaluationCache import *
+from .CodeCache import *
+from .KernelSession import *
+from .EvaluationCoalescer import *
+from .VectorizedFunction import *
+from .CallExecutor import *
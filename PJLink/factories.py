@@ -11,8 +11,7 @@ def create_math_link(init = None, debug_level = 0, log = ""):
     if isinstance(log, str):
         import os
         if len(log)>0 and os.path.exists(os.path.dirname(log)):
-            Env.LOG_FILE = log
-            Env.ALLOW_LOGGING = True
+            Env.setLogLevel(True, log_file = log)
     link = NativeLink(init, debug_level)
     return link
 
@@ -0,0 +1,107 @@
+from .TestUtils import *
+
+def _double(a):
+    a *= 2 # in place, so the result points into the shared block
+    return a
+
+class CallExecutorTest(TestCase):
+
+    @debugTest
+    def sharedArrays(self):
+        import array, numpy
+        from PJLink.CallExecutor import _SharedArray
+        from PJLink.HelperClasses import BufferedNDArray
+        data = numpy.arange(2**14, dtype = "float64")
+        buffered = BufferedNDArray(array.array("l", range(2**14)), (2**7, 2**7))
+        shared = []
+        small = data[:10]
+        self.assertIs(_SharedArray.share(small, shared), small)
+        self.assertEqual(shared, [])
+        ref = _SharedArray.share(data, shared)
+        bref = _SharedArray.share(buffered, shared)
+        self.assertEqual(len(shared), 2)
+        attached = []
+        arr = ref.attach(attached)
+        self.assertTrue(numpy.array_equal(arr, data))
+        back = bref.attach(attached)
+        self.assertEqual(back.shape, buffered.shape)
+        self.assertEqual(list(back._buffer), list(buffered._buffer))
+        del arr
+        for shm in attached:
+            shm.close()
+        _SharedArray.release(shared)
+        self.assertEqual(shared, [])
+
+    @debugTest
+    def processCall(self):
+        import numpy
+        from PJLink.CallExecutor import CallExecutor
+        executor = CallExecutor(max_processes = 1)
+        try:
+            data = numpy.arange(2**14, dtype = "float64")
+            # the result is a view on the shared block, which is gone by the time it gets back
+            res = executor.call(_double, (data, ))
+            self.assertTrue(numpy.array_equal(res, data * 2))
+            self.assertTrue(numpy.array_equal(data, numpy.arange(2**14)))
+            self.assertEqual(executor.process_pool._mp_context.get_start_method(), "forkserver")
+        finally:
+            executor.close(wait = True)
+
+    @debugTest
+    def submitAndCollect(self):
+        import threading
+        from PJLink.CallExecutor import CallExecutor
+        executor = CallExecutor(max_workers = 2)
+        try:
+            release = threading.Event()
+            slow = executor.submit(release.wait, (5, ))
+            fast = executor.submit(pow, (2, 10))
+            self.assertEqual(executor.collect([ fast ], timeout = 1), [ (fast, True, 1024) ])
+            # nothing else is done yet, so this gives up after the timeout
+            self.assertEqual(executor.collect(timeout = .05), [])
+            self.assertEqual(executor.pending, 1)
+            release.set()
+            self.assertEqual(executor.collect(timeout = 1), [ (slow, True, True) ])
+            failed = executor.submit(divmod, (1, 0))
+            [ (ticket, ok, tb) ] = executor.collect(timeout = 1)
+            self.assertEqual((ticket, ok), (failed, False))
+            self.assertIn("ZeroDivisionError", tb)
+        finally:
+            executor.close(wait = True)
+
+    @debugTest
+    def uncollectedResultsAreBounded(self):
+        from PJLink.CallExecutor import CallExecutor
+        executor = CallExecutor(max_workers = 1, max_results = 3)
+        try:
+            tickets = [ executor.submit(abs, (-i, )) for i in range(5) ]
+            executor.thread_pool.submit(int).result(1) # the pool runs them in order, so they're all done by now
+            self.assertEqual(executor.collect(timeout = 1), [ (t, True, i) for t, i in zip(tickets[2:], range(2, 5)) ])
+            self.assertEqual(executor.dropped, 2)
+            self.assertEqual(executor.collect(tickets[:2], timeout = 1), [])
+        finally:
+            executor.close(wait = True)
+
+    @debugTest
+    def collectPacket(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr
+        core = MemoryLink()
+        link = WrappedKernelLink(core)
+        ctx = link.M.PackageContext
+        fid = link.register_callable(divmod)
+        def call(pkt):
+            core.put(pkt)
+            link._KernelLink__callPython()
+            return core.get()
+        ticket = call(MLExpr(ctx + "PyCallAsyncPacket", (fid, [ 7, 0 ], [])))
+        self.assertEqual(ticket.head, ctx + "PyCallTicket")
+        res = call(MLExpr(ctx + "PyCollectPacket", ([ ticket ], 1)))
+        self.assertEqual(res.head, "List")
+        [ rule ] = res.args
+        self.assertEqual(rule.head, "Rule")
+        self.assertEqual(rule.args[0], ticket)
+        self.assertEqual(rule.args[1].head, ctx + "PythonTraceback")
+        self.assertIn("ZeroDivisionError", rule.args[1].args[0])
+        link.call_executor.close(wait = True)
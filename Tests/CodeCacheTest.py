@@ -0,0 +1,32 @@
+from .TestUtils import *
+
+class CodeCacheTest(TestCase):
+
+    @debugTest
+    def hitsAndMisses(self):
+        from PJLink.CodeCache import CodeCache
+        cache = CodeCache(max_entries = 2)
+        code, is_expression = cache.compile("1 + 1")
+        self.assertTrue(is_expression)
+        self.assertIs(cache.compile("1 + 1")[0], code)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.compile("2 + 2")
+        cache.compile("3 + 3") # pushes out 1 + 1, the least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.compile("1 + 1")[0], code)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    @debugTest
+    def evalAndExec(self):
+        from PJLink.CodeCache import CodeCache
+        cache = CodeCache()
+        env = { "x" : 2 }
+        self.assertEqual(cache.run("x * 3", env), 6)
+        self.assertIsNone(cache.run("y = x * 4", env))
+        self.assertEqual(env["y"], 8)
+        # a multi-line block is run as statements, so even a trailing expression gives back None (Null)
+        self.assertIsNone(cache.run("z = y + 1\nz", env))
+        self.assertEqual(env["z"], 9)
+        self.assertFalse(cache.compile("z = y + 1\nz")[1])
+        self.assertEqual(cache.run("x * 3", { "x" : 5 }), 15)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
@@ -0,0 +1,65 @@
+from .TestUtils import *
+
+class DeadlineSchedulerTest(TestCase):
+
+    @debugTest
+    def scheduleOrder(self):
+        import threading
+        from PJLink.DeadlineScheduler import DeadlineScheduler
+        sched = DeadlineScheduler()
+        fired = []
+        done = threading.Event()
+        sched.schedule(.06, fired.append, 3)
+        sched.schedule(.02, fired.append, 1)
+        sched.schedule(.04, fired.append, 2)
+        dropped = sched.schedule(.03, fired.append, "cancelled")
+        sched.schedule(.08, done.set)
+        self.assertTrue(sched.cancel(dropped))
+        self.assertTrue(done.wait(1))
+        self.assertEqual(fired, [ 1, 2, 3 ])
+        self.assertFalse(sched.cancel(dropped))
+
+    @debugTest
+    def escalationOrder(self):
+        import time
+        from PJLink.DeadlineScheduler import DeadlineScheduler, EvaluationDeadline
+        class Kernel:
+            def __init__(self):
+                self.steps = []
+            def interruptEvaluation(self):
+                self.steps.append("interrupt")
+            def abortEvaluation(self):
+                self.steps.append("abort")
+            def terminateKernel(self):
+                self.steps.append("terminate")
+        escalation = (("interruptEvaluation", 0.), ("abortEvaluation", .03), ("terminateKernel", .03))
+        kernel = Kernel()
+        with EvaluationDeadline(kernel, .02, escalation = escalation, scheduler = DeadlineScheduler()) as deadline:
+            time.sleep(.3)
+        self.assertTrue(deadline.expired)
+        self.assertEqual(kernel.steps, [ "interrupt", "abort", "terminate" ])
+        kernel = Kernel()
+        with EvaluationDeadline(kernel, .1, escalation = escalation, scheduler = DeadlineScheduler()) as deadline:
+            pass
+        time.sleep(.15)
+        self.assertFalse(deadline.expired)
+        self.assertEqual(kernel.steps, [])
+
+    @debugTest
+    def wrapperTimeoutReleasesLock(self):
+        import time, threading
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.HelperClasses import LinkWrapper
+        link = MemoryLink()
+        with LinkWrapper(link, timeout = .05) as wrapper:
+            time.sleep(.15)
+        self.assertTrue(wrapper.expired)
+        acquired = []
+        def grab():
+            acquired.append(link.thread_lock.acquire(timeout = .5))
+            if acquired[-1]:
+                link.thread_lock.release()
+        t = threading.Thread(target = grab)
+        t.start()
+        t.join()
+        self.assertEqual(acquired, [ True ])
@@ -0,0 +1,80 @@
+from .TestUtils import *
+
+class EnvironmentTest(TestCase):
+
+    @debugTest
+    def loggingFlags(self):
+        from PJLink.MathLinkEnvironment import MathLinkEnvironment as Env
+        level = Env.LOG_LEVEL
+        try:
+            Env.setLogLevel("Info")
+            self.assertEqual((Env.LOG_ERROR, Env.LOG_INFO, Env.LOG_DEBUG), (True, True, False))
+            Env.ALLOW_LOGGING = False
+            self.assertFalse(Env.ALLOW_LOGGING)
+            self.assertEqual((Env.LOG_ERROR, Env.LOG_INFO, Env.LOG_DEBUG), (False, False, False))
+            # turning it back on goes back to the level it was at
+            Env.ALLOW_LOGGING = True
+            self.assertTrue(Env.ALLOW_LOGGING)
+            self.assertEqual(Env.LOG_LEVEL, Env.LOG_LEVELS["Info"])
+            self.assertEqual((Env.LOG_ERROR, Env.LOG_INFO, Env.LOG_DEBUG), (True, True, False))
+        finally:
+            Env.setLogLevel(False)
+            Env.LOG_LEVEL = level
+
+    @debugTest
+    def typeRegistry(self):
+        from PJLink.MathLinkEnvironment import MathLinkEnvironment as Env
+        real = Env.toTypeInt("Real")
+        # names, typecodes and types all land on the same type int
+        self.assertEqual({ Env.toTypeInt(k) for k in ("Double", "d", float) }, { real })
+        record = Env.TYPES.records[real]
+        self.assertEqual((record.name, record.typecode, record.python_type), ("Double", "d", float))
+        self.assertEqual(Env.fromTypeInt(real, "typecode"), "d")
+        self.assertEqual(Env.fromTypeInt(real, "type"), float)
+        self.assertEqual(Env.getShortNameFromTypeInt(real), "Double")
+        self.assertIsNone(Env.toTypeInt("NotAType"))
+        self.assertEqual(Env.fromTypeInt("NotAType", "typename"), "NotAType")
+        # bool is more specific than int, and subclasses get looked up once and remembered
+        class Flag(int):
+            pass
+        self.assertNotEqual(Env.getObjectTypeInt(True), Env.getObjectTypeInt(1))
+        self.assertEqual(Env.getObjectTypeInt(Flag(1)), Env.getObjectTypeInt(1))
+        self.assertIn(Flag, Env.TYPES._object_type_ints)
+        with self.assertRaises(TypeError):
+            Env.TYPES.type_ints["Real"] = 0
+
+    @debugTest
+    def logWriter(self):
+        import os, io, time, tempfile, contextlib, numpy
+        from PJLink.MathLinkEnvironment import MathLinkEnvironment as Env, LogWriter
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "log.txt")
+            writer = LogWriter(path, flush_interval = 60, max_lines = 3, format_arg = Env._logArg)
+            try:
+                writer.write("plain")
+                writer.write_format("{} {x}", (numpy.zeros((2, 3)), ), { "x" : list(range(100)) })
+                writer.write_format("{} {}", (1, ))
+                writer.write("dropped")
+                writer.write("dropped")
+                self.assertEqual(writer.dropped, 2)
+                writer.flush()
+            finally:
+                writer.close()
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0], "plain")
+            self.assertTrue(lines[1].startswith("<ndarray shape=(2, 3)> [0, 1, 2"), lines[1])
+            self.assertIn("couldn't format", lines[2])
+            self.assertIn("2 log lines dropped", lines[3])
+            # a writer that can't write says so once rather than every time it tries
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                writer = LogWriter(os.path.join(tmp, "missing", "log.txt"), flush_interval = .01)
+                try:
+                    for _ in range(3):
+                        writer.write("lost")
+                        time.sleep(.05)
+                finally:
+                    writer.flush = lambda: None # nothing to write to, so close can't flush either
+                    writer.close()
+            self.assertEqual(err.getvalue().count("couldn't write to the log file"), 1)
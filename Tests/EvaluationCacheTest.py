@@ -0,0 +1,54 @@
+from .TestUtils import *
+
+class EvaluationCacheTest(TestCase):
+
+    @debugTest
+    def cacheable(self):
+        from PJLink.EvaluationCache import EvaluationCache
+        from PJLink.HelperClasses import MLExpr, MLSym
+        cache = EvaluationCache(pure = ("ExportString", MLSym("Lookup")))
+        data = MLExpr("List", (1, 2, 3))
+        self.assertTrue(cache.cacheable(MLExpr("ExportString", (data, "PNG"))))
+        self.assertTrue(cache.cacheable(MLExpr(MLSym("Lookup"), ([ MLExpr("Rule", ("a", 1)) ], "a"))))
+        # every head has to be pure, not just the outermost one
+        self.assertFalse(cache.cacheable(MLExpr("Lookup", (MLSym("assoc"), MLExpr("RandomReal", ())))))
+        self.assertFalse(cache.cacheable(MLExpr("ExportString", ([ MLExpr("Now", ()) ], "PNG"))))
+        self.assertFalse(cache.cacheable(MLExpr("RandomReal", ())))
+        self.assertIsNone(cache.key(MLExpr("Lookup", (MLSym("assoc"), MLExpr("RandomReal", ())))))
+        self.assertIsNotNone(cache.key(MLExpr("ExportString", (data, "PNG"))))
+
+    @debugTest
+    def pureIsPerCache(self):
+        from PJLink.EvaluationCache import EvaluationCache
+        from PJLink.HelperClasses import MLExpr
+        cache = EvaluationCache()
+        other = EvaluationCache()
+        @cache.pure
+        def thumbnail(img):
+            return MLExpr("Rasterize", (img, ))
+        expr = thumbnail("img")
+        self.assertTrue(cache.cacheable(expr))
+        self.assertFalse(other.cacheable(expr))
+
+    @debugTest
+    def hitsAreCopies(self):
+        import numpy
+        from PJLink.EvaluationCache import EvaluationCache
+        from PJLink.HelperClasses import MLExpr
+        cache = EvaluationCache(pure = ("Range", ))
+        key = cache.key(MLExpr("Range", (3, )))
+        res = [ 1, 2, [ 3 ] ]
+        cache.put(key, res)
+        res[2].append(4)
+        hit = cache.get(key)
+        self.assertEqual(hit, [ 1, 2, [ 3 ] ])
+        hit[2].append(5)
+        self.assertEqual(cache.get(key), [ 1, 2, [ 3 ] ])
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+        arr = numpy.arange(3)
+        cache.put(key, arr)
+        arr[0] = 10
+        hit = cache.get(key)
+        self.assertEqual(hit.tolist(), [ 0, 1, 2 ])
+        self.assertFalse(hit.flags.writeable)
+        self.assertRaises(ValueError, hit.__setitem__, 0, 10)
@@ -0,0 +1,74 @@
+from .TestUtils import *
+
+class EvaluationCoalescerTest(TestCase):
+
+    @staticmethod
+    def standInKernel(sent):
+        # a kernel link over a MemoryLink that evaluates List[PyCoalescedItem[...], ...] batches
+        # Square[n] squares, Abort[] aborts just its item and Crash[] takes down the whole batch
+        import time
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr, MLSym
+        core = MemoryLink()
+        link = WrappedKernelLink(core)
+        link.session.installed = True
+        def head(e):
+            h = e.head
+            return h.name if isinstance(h, MLSym) else h
+        def item(e):
+            h = head(e)
+            if h == "Square":
+                return e.args[0] ** 2
+            elif h == "Abort":
+                return MLSym("$Aborted")
+            return e
+        def put(o, **kw):
+            batch = o.args[0].args[0] # EvaluatePacket[AddTypeHints[List[...]]]
+            sent.append(batch)
+            time.sleep(.005)
+            if any(head(i.args[0]) == "Crash" for i in batch.args):
+                res = MLSym("$Aborted")
+            else:
+                res = MLExpr("List", tuple(MLExpr("PJLink`Package`PyCoalescedResult", (item(i.args[0]), )) for i in batch.args))
+            core.put(MLExpr("ReturnPacket", (res, )))
+        link.put = put
+        link.flush = lambda: None
+        return link
+
+    @debugTest
+    def batching(self):
+        import threading
+        from PJLink.HelperClasses import MLExpr
+        sent = []
+        link = self.standInKernel(sent)
+        coalescer = link.enable_coalescing(window = .02)
+        res = {}
+        def worker(i):
+            res[i] = [ link.evaluate(MLExpr("Square", (10 * i + j, ))) for j in range(5) ]
+        threads = [ threading.Thread(target = worker, args = (i, )) for i in range(8) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(res, { i : [ (10 * i + j) ** 2 for j in range(5) ] for i in range(8) })
+        self.assertEqual(coalescer.items, 40)
+        self.assertEqual(len(sent), coalescer.batches)
+        self.assertLess(coalescer.batches, 40)
+
+    @debugTest
+    def isolation(self):
+        from PJLink.HelperClasses import MLExpr, MLSym
+        from PJLink.MathLinkExceptions import MathLinkException
+        sent = []
+        link = self.standInKernel(sent)
+        link.enable_coalescing(window = 0)
+        # a lone evaluation goes out wrapped just like a batched one
+        self.assertEqual(link.evaluate(MLExpr("Square", (3, ))), 9)
+        self.assertEqual(sent[-1].args[0].head, MLSym("PJLink`Package`PyCoalescedItem"))
+        self.assertEqual(link.evaluate(MLExpr("Abort", ())), MLSym("$Aborted"))
+        # a batch that comes back in the wrong shape fails instead of being sent again
+        n = len(sent)
+        with self.assertRaises(MathLinkException):
+            link.evaluate(MLExpr("Crash", ()))
+        self.assertEqual(len(sent), n + 1)
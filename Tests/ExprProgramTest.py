@@ -0,0 +1,76 @@
+from .TestUtils import *
+
+class ExprProgramTest(TestCase):
+
+    @staticmethod
+    def countingLink():
+        from PJLink.MemoryLink import MemoryLink
+        class CountingLink(MemoryLink):
+            programs = 0
+            def _putProgram(self, program):
+                self.programs += 1
+                return super()._putProgram(program)
+        return CountingLink()
+
+    @debugTest
+    def roundTrip(self):
+        from PJLink.ExprProgram import ExprProgram
+        from PJLink.HelperClasses import MLExpr, MLSym, BufferedNDArray
+        link = self.countingLink()
+        expr = MLExpr("f", (1, 1.5, "s", MLSym("x"), None, True, 1+2j, float("inf"), MLExpr(MLExpr("g", ()), ("h", ))))
+        prog = ExprProgram.compile(expr)
+        self.assertEqual(prog.strings.count("s"), 1)
+        self.assertEqual(ExprProgram.compile(expr).digest(), prog.digest())
+        link.put(expr)
+        self.assertEqual(link.programs, 1)
+        self.assertEqual(link.get(), MLExpr("f", (
+            1, 1.5, "s", MLSym("x"), MLSym("Null"), MLSym("True"), MLExpr("Complex", (1., 2.)), MLSym("Infinity"),
+            MLExpr(MLExpr("g", ()), ("h", ))
+        )))
+        # flat lists of numbers go out as one packed array
+        prog = ExprProgram.compile(MLExpr("f", ([ 1, 2, 3 ], [ 1., 2. ])))
+        self.assertEqual(len(prog.arrays), 2)
+        self.assertIsInstance(prog.arrays[0], BufferedNDArray)
+
+    @debugTest
+    def cycles(self):
+        from PJLink.ExprProgram import ExprProgram
+        from PJLink.HelperClasses import MLExpr
+        link = self.countingLink()
+        loop = [ "a" ]
+        loop.append(loop)
+        self.assertIsNotNone(ExprProgram.compile(MLExpr("f", (loop, ))))
+        link.put(MLExpr("f", (loop, )))
+        res = link.get()
+        self.assertEqual(res.args[0].args[0], "a")
+        self.assertEqual(res.args[0].args[1].head, "PJLink`RecursionError")
+        # the same list twice side by side isn't a cycle
+        shared = [ "b" ]
+        link.put(MLExpr("f", (shared, shared)))
+        self.assertEqual(link.get(), MLExpr("f", (MLExpr("List", ("b", )), MLExpr("List", ("b", )))))
+
+    @debugTest
+    def bigIntFallback(self):
+        from PJLink.ExprProgram import ExprProgram
+        from PJLink.HelperClasses import MLExpr
+        link = self.countingLink()
+        expr = MLExpr("f", (2**70, [ 1, 2**64 ]))
+        self.assertIsNone(ExprProgram.compile(expr))
+        link.put(expr)
+        self.assertEqual(link.programs, 0)
+        res = link.get()
+        self.assertEqual(res.args[0], 2**70)
+        self.assertEqual(list(res.args[1].args), [ 1, 2**64 ])
+
+    @debugTest
+    def tupleSubclasses(self):
+        from PJLink.ExprProgram import ExprProgram
+        from PJLink.HelperClasses import MLExpr, MLFunction
+        link = self.countingLink()
+        # an MLFunction is a header, so it takes the next argument with it rather than going out as a List
+        expr = MLExpr("f", (MLFunction("g", 1), 2))
+        self.assertIsNone(ExprProgram.compile(expr))
+        link.put(expr)
+        link.put(3)
+        self.assertEqual(link.programs, 0)
+        self.assertEqual(link.get(), MLExpr("f", (MLExpr("g", (2, )), 3)))
@@ -0,0 +1,194 @@
+from .TestUtils import *
+
+class KernelLinkTest(TestCase):
+
+    @staticmethod
+    def standInKernel(answer, installed = True):
+        # a kernel link over a MemoryLink that holds on to EvaluatePackets until the link is flushed, then answers
+        # each one with the packets answer(expr) gives back (the ReturnPacket by itself, if it's not a list)
+        # expr is what went into AddTypeHints, or with installed = False the whole packet body, installs and all
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr
+        core = MemoryLink()
+        link = WrappedKernelLink(core)
+        link.session.installed = installed
+        link.queued = []
+        link.in_flight = []
+        def put(o, **kw):
+            link.queued.append(o.args[0].args[0] if installed else o.args[0]) # EvaluatePacket[AddTypeHints[expr]]
+        def flush():
+            link.in_flight.append(len(link.queued))
+            for expr in link.queued:
+                pkts = answer(expr)
+                if not isinstance(pkts, list):
+                    pkts = [ MLExpr("ReturnPacket", (pkts, )) ]
+                for pkt in pkts:
+                    core.put(pkt)
+            del link.queued[:]
+        link.put = put
+        link.flush = flush
+        return link
+
+    @debugTest
+    def evaluateMany(self):
+        from PJLink.HelperClasses import MLExpr, MLSym
+        link = self.standInKernel(lambda e: e.args[0] ** 2)
+        res = link.evaluate_many([ MLExpr("Square", (i, )) for i in range(10) ], window = 4)
+        self.assertEqual(res, [ i ** 2 for i in range(10) ])
+        # the first four go out together, then one more each time an answer comes back
+        self.assertEqual(link.in_flight, [ 4 ] + [ 1 ] * 6)
+
+    @debugTest
+    def evaluateManyCollect(self):
+        from PJLink.HelperClasses import MLExpr, MLSym
+        def answer(e):
+            n = e.args[0]
+            pkts = [ MLExpr("TextPacket", ("printed {}".format(n), )) ]
+            if n % 2:
+                pkts += [ MLExpr("MessagePacket", (MLSym("Odd"), "odd")), MLExpr("TextPacket", ("Odd::odd", )) ]
+            return pkts + [ MLExpr("ReturnPacket", (n, )) ]
+        link = self.standInKernel(answer)
+        res = link.evaluate_many([ MLExpr("Echo", (i, )) for i in range(3) ], collect = True)
+        self.assertEqual([ r.result for r in res ], [ 0, 1, 2 ])
+        self.assertEqual([ r.messages for r in res ], [ [], [ "Odd::odd" ], [] ])
+        self.assertEqual([ r.output for r in res ], [ [ "printed {}".format(i) ] for i in range(3) ])
+
+    @debugTest
+    def readerCancellation(self):
+        from concurrent.futures import Future, TimeoutError
+        from PJLink.Reader import Reader
+        from PJLink.MathLinkExceptions import MathLinkException
+        from PJLink.HelperClasses import MLExpr
+        link = self.standInKernel(lambda e: e.args[0] ** 2)
+        reader = Reader(link, quit_on_link_end = False)
+        # with no thread to run it, the evaluation is abandoned rather than left waiting
+        with self.assertRaises(MathLinkException):
+            reader.submit(MLExpr("Square", (2, ))).result(1)
+        # stands in for a reader thread that's busy elsewhere, so the evaluation sits in the queue until it times out
+        reader._Reader__started = True
+        with self.assertRaises(TimeoutError):
+            reader.evaluate(MLExpr("Square", (3, )), timeout = .05)
+        [ (expr, fut, deadline) ] = reader._Reader__eval_queue
+        self.assertTrue(fut.cancelled())
+        reader._runEvaluation(expr, fut, deadline)
+        self.assertEqual(link.in_flight, []) # cancelled in the queue, so never sent
+        fut = Future()
+        reader._runEvaluation(MLExpr("Square", (4, )), fut)
+        self.assertEqual(fut.result(0), 16)
+        self.assertEqual(link.in_flight, [ 1 ])
+
+    @debugTest
+    def sessionReinstall(self):
+        from PJLink.HelperClasses import MLExpr, MLSym
+        kernel = { "loaded" : False, "pid" : 100 }
+        def answer(e):
+            # EvaluatePacket bodies: CompoundExpression[Needs[...], $ProcessID] to install, AddTypeHints[expr] otherwise
+            head = e.head.name if isinstance(e.head, MLSym) else e.head
+            if head == "CompoundExpression":
+                kernel["loaded"] = True
+                return kernel["pid"]
+            if not kernel["loaded"]:
+                return e # nothing knows what AddTypeHints is, so it comes back unevaluated
+            return e.args[0].args[0] ** 2
+        link = self.standInKernel(answer, installed = False)
+        session = link.session
+        self.assertEqual(link.evaluate(MLExpr("Square", (3, ))), 9)
+        self.assertEqual(link.evaluate(MLExpr("Square", (4, ))), 16)
+        self.assertEqual((session.installs, session.process_id), (1, 100))
+        # the kernel restarts without us hearing about it
+        kernel.update(loaded = False, pid = 200)
+        self.assertEqual(link.evaluate(MLExpr("Square", (5, ))), 25)
+        self.assertEqual((session.installs, session.process_id), (2, 200))
+        self.assertEqual(link.evaluate(MLExpr("Square", (6, ))), 36)
+        self.assertEqual(session.installs, 2)
+
+    @debugTest
+    def packetHandlers(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.MathLinkEnvironment import MathLinkEnvironment as Env
+        from PJLink.HelperClasses import MLExpr
+        seen = []
+        class HandlerLink(WrappedKernelLink):
+            def _handleDisplayPkt(self, pkt):
+                seen.append(("display", self.get()))
+        HandlerLink.register_packet_handler("Text", lambda link, pkt: seen.append(("text", link.get())))
+        HandlerLink.register_packet_handler(Env.getPacketInt("Display"), "_handleDisplayPkt") # ints get stored by name
+        self.assertEqual(HandlerLink._packet_handler_map["Display"], "_handleDisplayPkt")
+        core = MemoryLink()
+        link = HandlerLink(core)
+        core.put(MLExpr("TextPacket", ("printed", )))
+        core.put(MLExpr("DisplayPacket", ("shown", )))
+        core.put(MLExpr("ReturnPacket", (1, )))
+        link.waitForAnswer()
+        self.assertEqual(link.get(), 1)
+        self.assertEqual(seen, [ ("text", "printed"), ("display", "shown") ])
+        # registrations stay on the class they were made on
+        self.assertEqual(WrappedKernelLink._packet_handler_map["Text"], "_handleTextPkt")
+        self.assertIsNot(WrappedKernelLink._packet_handlers, HandlerLink._packet_handlers)
+
+    @debugTest
+    def evaluateStream(self):
+        from PJLink.HelperClasses import MLExpr, MLSym
+        def answer(e):
+            if e == MLSym("x"):
+                return 1
+            return [
+                MLExpr("TextPacket", ("step 1", )),
+                MLExpr("MessagePacket", (MLSym("General"), "warn")),
+                MLExpr("TextPacket", ("General::warn", )),
+                MLExpr("ReturnPacket", (e.args[0], ))
+            ]
+        link = self.standInKernel(answer)
+        pkts = list(link.evaluate_stream(MLExpr("Steps", (3, ))))
+        self.assertEqual([ p[0] for p in pkts ], [ "Text", "Message", "Text", "Return" ])
+        self.assertEqual(pkts[1][1], (MLSym("General"), "warn"))
+        self.assertEqual(pkts[-1][1], 3)
+        # closing the stream early still reads the rest of the answer off, so the next evaluation gets its own
+        stream = link.evaluate_stream(MLExpr("Steps", (4, )))
+        self.assertEqual(next(stream)[1], "step 1")
+        stream.close()
+        self.assertFalse(link.ready)
+        self.assertEqual(link.evaluate(MLSym("x")), 1)
+
+    @debugTest
+    def pyCallPacket(self):
+        from PJLink.MathLinkExceptions import MathLinkException
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr, MLSym
+        core = MemoryLink()
+        link = WrappedKernelLink(core)
+        ctx = link.M.PackageContext
+        def call(*pkt):
+            core.put(MLExpr(ctx + "PyCallPacket", pkt))
+            link._KernelLink__callPython()
+            return core.get()
+        calls = []
+        def record(*args, **kwargs):
+            calls.append((args, kwargs))
+            return len(calls)
+        fid = link.register_callable(record, name = "record")
+        # arguments are used as they come off the link: lists, rules, associations and True/False/Null get decoded
+        res = call(fid, [ 1, "s", MLSym("True"), MLSym("Null"), MLSym("x"), [ 1.5, 2.5 ],
+            MLExpr("Association", (MLExpr("Rule", ("a", 1)), )) ], [ MLExpr("Rule", ("key", MLSym("False"))) ])
+        self.assertEqual(res, 1)
+        args, kwargs = calls[0]
+        self.assertEqual(args[:5], (1, "s", True, None, MLSym("x")))
+        self.assertEqual(list(args[5]), [ 1.5, 2.5 ])
+        self.assertEqual(args[6], { "a" : 1 })
+        self.assertEqual(kwargs, { "key" : False })
+        self.assertEqual(call("record", [ ]), 2)
+        # anything else is looked up in the exec environment, then builtins, then imported
+        self.assertEqual(call("max", [ 3, 7 ]), 7)
+        import os
+        self.assertEqual(call("os.path.join", [ "a", "b" ]), os.path.join("a", "b"))
+        self.assertIn("os.path.join", link._callables)
+        self.assertIs(link.resolve_callable("Kernel.evaluate").__self__, link)
+        self.assertNotIn("Kernel.evaluate", link._callables)
+        link.unregister_callable(fid)
+        with self.assertRaises(MathLinkException):
+            link.resolve_callable(fid)
+        with self.assertRaises(MathLinkException):
+            link.resolve_callable("no_such_module_here.fn")
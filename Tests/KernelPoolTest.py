@@ -0,0 +1,105 @@
+from .TestUtils import *
+
+class KernelPoolTest(TestCase):
+
+    @staticmethod
+    def standInKernel(fn):
+        # a kernel link over a MemoryLink that answers each EvaluatePacket with fn of the wrapped expression
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr
+        core = MemoryLink()
+        link = WrappedKernelLink(core)
+        def put(o, **kw):
+            # EvaluatePacket[AddTypeHints[expr]], after the session's one-off EvaluatePacket[CompoundExpression[Needs[...], $ProcessID]]
+            body = o.args[0]
+            if link.session.installed:
+                res = fn(link, body.args[0])
+            else:
+                res = id(core)
+            core.put(MLExpr("ReturnPacket", (res, )))
+        link.put = put
+        link.flush = lambda: None
+        return link
+
+    @debugTest
+    def poolMap(self):
+        import threading
+        from PJLink.KernelPool import KernelPool
+        from PJLink.HelperClasses import MLSym
+        release = threading.Event()
+        def answer(link, expr):
+            if expr == MLSym("block"):
+                release.wait(1)
+            return expr.args[0] ** 2 if getattr(expr, "head", None) == MLSym("Square") else id(link)
+        with KernelPool(3, factory = lambda: self.standInKernel(answer), warmup = [ MLSym("x") ]) as pool:
+            self.assertEqual(list(pool.map("Square", range(20), chunksize = 3)), [ i ** 2 for i in range(20) ])
+            # with one kernel stuck, the next two requests go to the other two
+            futs = [ pool.submit(MLSym("block")), pool.submit(MLSym("y")), pool.submit(MLSym("y")) ]
+            release.set()
+            self.assertEqual(len(set(f.result(1) for f in futs)), 3)
+
+    @debugTest
+    def poolReplacesDeadKernels(self):
+        from PJLink.KernelPool import KernelPool
+        from PJLink.MathLinkExceptions import MathLinkException
+        from PJLink.HelperClasses import MLSym
+        def answer(link, expr):
+            if expr == MLSym("die"):
+                link.active_link.close()
+            return 1
+        with KernelPool(1, factory = lambda: self.standInKernel(answer)) as pool:
+            with self.assertRaises(MathLinkException):
+                pool.submit(MLSym("die")).result(1)
+            self.assertEqual(pool.submit(MLSym("x")).result(1), 1)
+            self.assertEqual(pool.replacements, 1)
+            self.assertEqual(pool.check_health(1), [True])
+
+    @debugTest
+    def healthCheckTimeouts(self):
+        import time, threading
+        from PJLink.KernelPool import KernelPool
+        launched = []
+        def factory():
+            link = self.standInKernel(lambda link, expr: 1)
+            if threading.current_thread().name == "PJLinkPool-0" and not any(l.stuck for l in launched):
+                # the first worker's first kernel hangs until the deadline steps in
+                link.stuck = True
+                unstuck = threading.Event()
+                answer = link._getAnswer
+                link._getAnswer = lambda: (unstuck.wait(5), answer())[1]
+                link.interruptEvaluation = unstuck.set
+            else:
+                link.stuck = False
+            launched.append(link)
+            return link
+        with KernelPool(3, factory = factory) as pool:
+            start = time.time()
+            self.assertEqual(pool.check_health(.2), [ False, True, True ])
+            # the kernels are checked in parallel, not one timeout after another
+            self.assertLess(time.time() - start, .5)
+            self.assertEqual(pool.replacements, 1)
+            self.assertEqual(len(launched), 4)
+            self.assertEqual(pool.check_health(.2), [ True, True, True ])
+
+    @debugTest
+    def healthCheckRelaunchFails(self):
+        from PJLink.KernelPool import KernelPool
+        from PJLink.MathLinkExceptions import MathLinkException
+        from PJLink.HelperClasses import MLSym
+        launched = []
+        def answer(link, expr):
+            if expr == MLSym("die"):
+                link.active_link.close()
+            return 1
+        def factory():
+            if launched:
+                raise FileNotFoundError("no kernel binary")
+            launched.append(self.standInKernel(answer))
+            return launched[-1]
+        with KernelPool(1, factory = factory) as pool:
+            with self.assertRaises(MathLinkException):
+                pool.submit(MLSym("die")).result(1)
+            # the replacement couldn't be launched, and neither can the one the check asks for
+            self.assertEqual(pool.check_health(1), [False])
+            self.assertEqual(pool.replacements, 1)
@@ -0,0 +1,32 @@
+from .TestUtils import *
+
+class MLSymTest(TestCase):
+
+    @debugTest
+    def interning(self):
+        from PJLink.HelperClasses import MLSym
+        from PJLink.MathLinkEnvironment import MathLinkEnvironment as Env
+        name = "".join([ "Intern", "Me" ]) # built at runtime, so it isn't already interned
+        a = MLSym(name)
+        self.assertIs(MLSym("InternMe"), a)
+        self.assertIs(a.name, "InternMe")
+        self.assertEqual(a, ("InternMe", )) # still a tuple, which the call-packet code relies on
+        self.assertEqual(MLSym([ "unhashable" ]).name, [ "unhashable" ])
+        size = Env.SYMBOL_TABLE_SIZE
+        try:
+            Env.SYMBOL_TABLE_SIZE = len(MLSym._table) + 1
+            MLSym("FillsTheTable")
+            MLSym("StartsItOver")
+            self.assertEqual(len(MLSym._table), 1)
+            self.assertEqual(MLSym("InternMe"), a)
+        finally:
+            Env.SYMBOL_TABLE_SIZE = size
+
+    @debugTest
+    def packageAttributes(self):
+        from PJLink.HelperClasses import MPackage, MLSym
+        sym = MPackage.Some_Context_Thing
+        self.assertEqual(sym, MLSym("Some`Context`Thing"))
+        self.assertIn("Some_Context_Thing", vars(MPackage)) # memoized as a real attribute
+        self.assertIs(MPackage.Some_Context_Thing, sym)
+        self.assertEqual(MPackage.ProcessID_, MLSym("$ProcessID"))
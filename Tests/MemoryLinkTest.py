@@ -0,0 +1,187 @@
+from .TestUtils import *
+
+class MemoryLinkTest(TestCase):
+
+    @debugTest
+    def roundTrip(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.HelperClasses import MLExpr, MLSym
+        link = MemoryLink()
+        expr = MLExpr("f", (1, 2.5, "s", MLSym("x"), MLExpr("g", (MLSym("y"), ))))
+        link.put(expr)
+        self.assertEqual(link.get(), expr)
+        self.assertFalse(link.ready)
+
+    @debugTest
+    def marksAndPackets(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.HelperClasses import MLExpr
+        link = MemoryLink()
+        link.put(MLExpr("ReturnPacket", ([1, 2, 3], )))
+        mark = link._createMark()
+        self.assertEqual(link._nextPacket(), link.Env.getPacketInt("Return"))
+        self.assertEqual(link._getFunction().argCount, 3)
+        link._seekMark(mark)
+        link._destroyMark(mark)
+        link._nextPacket()
+        self.assertEqual(list(link._getArray("Integer", 1)), [1, 2, 3])
+
+    @debugTest
+    def transfer(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.HelperClasses import MLExpr
+        source = MemoryLink()
+        target = MemoryLink()
+        source.put(MLExpr("f", ("a", )))
+        source.put(2)
+        target.transferToEndOfLoopbackLink(source)
+        self.assertFalse(source.ready)
+        self.assertEqual(target.get(), MLExpr("f", ("a", )))
+        self.assertEqual(target.get(), 2)
+
+    @debugTest
+    def bulkRead(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr, MLSym
+        core = MemoryLink()
+        kernel = WrappedKernelLink(core)
+        expr = MLExpr("List", (1, "s", MLSym("x"), MLExpr("Foo", ()), MLExpr(MLExpr("Hoo", (1, )), (2.5, ))))
+        core.put(expr)
+        self.assertEqual(kernel.get(), expr)
+        self.assertFalse(core.ready)
+
+    @debugTest
+    def hintedReadSkipsBuffer(self):
+        import array
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr, MLSym, BufferedNDArray
+        class CoreLink:
+            # stands in for a NativeLink: not a MemoryLink, so WrappedKernelLink can't read it in place
+            def __init__(self):
+                self.link = MemoryLink()
+                self.buffered = 0
+            def _readTokens(self, target):
+                self.buffered += 1
+                return self.link._readTokens(target)
+            def __getattr__(self, item):
+                return getattr(self.link, item)
+        core = CoreLink()
+        kernel = WrappedKernelLink(core)
+        data = BufferedNDArray(array.array("d", range(6)), (2, 3))
+        core.put(MLExpr("PJLink`TypeHints`PackedArrayInfo", (MLSym("Real"), [ 2, 3 ], data)))
+        res = kernel.get()
+        self.assertEqual(res.shape if hasattr(res, "shape") else None, (2, 3))
+        self.assertEqual(core.buffered, 0)
+        expr = MLExpr("f", (1, MLSym("x")))
+        core.put(expr)
+        self.assertEqual(kernel.get(), expr)
+        self.assertEqual(core.buffered, 1)
+
+    @debugTest
+    def transactions(self):
+        import threading
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr
+        link = MemoryLink()
+        with link.transaction():
+            with link.transaction():
+                link.put(1)
+            self.assertEqual(link._transaction_depth, 1)
+            acquired = []
+            t = threading.Thread(target = lambda: acquired.append(link.thread_lock.acquire(timeout = .05)))
+            t.start()
+            t.join()
+            self.assertEqual(acquired, [ False ])
+        self.assertEqual(link._transaction_depth, 0)
+        self.assertEqual(link.get(), 1)
+        # packets get read outside of any transaction so that the getters raise on link errors
+        depths = []
+        class CoreLink(MemoryLink):
+            def _getFunction(self):
+                depths.append(self._transaction_depth)
+                return super()._getFunction()
+        core = CoreLink()
+        kernel = WrappedKernelLink(core)
+        core.put(MLExpr("ReturnPacket", (1, )))
+        self.assertEqual(kernel.getPacket(), MLExpr("ReturnPacket", (1, )))
+        self.assertTrue(len(depths) > 0 and not any(depths))
+
+    @debugTest
+    def shuttlePool(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.LoopbackLink import ShuttleLinkPool
+        from PJLink.KernelLink import WrappedKernelLink
+        from PJLink.HelperClasses import MLExpr
+        pool = ShuttleLinkPool(MemoryLink, max_size = 1)
+        with pool.acquire() as link:
+            link.put(1) # left on the link, which gets cleared on the way back in
+        self.assertEqual(pool.size, 1)
+        with pool.acquire() as again:
+            self.assertIs(again, link)
+            self.assertFalse(again.ready)
+            other = pool.acquire()
+            self.assertIsNot(other, link)
+        other.__exit__(None, None, None) # the pool is already full, so this one gets closed
+        self.assertTrue(other.closed)
+        self.assertEqual(pool.size, 1)
+        pool.close()
+        self.assertTrue(link.closed)
+        self.assertEqual(pool.size, 0)
+        # puts on a kernel link go through the same shuttle every time
+        core = MemoryLink()
+        kernel = WrappedKernelLink(core)
+        shuttles = []
+        new = kernel._newTempLink
+        kernel._newTempLink = lambda: shuttles.append(new()) or shuttles[-1]
+        for i in range(3):
+            kernel._putViaLoopback(MLExpr("f", (i, )))
+        self.assertEqual(len(shuttles), 1)
+        self.assertEqual([ core.get() for i in range(3) ], [ MLExpr("f", (i, )) for i in range(3) ])
+
+    @debugTest
+    def putterDispatch(self):
+        from PJLink.MemoryLink import MemoryLink
+        from PJLink.HelperClasses import MLExpr
+        class PutterLink(MemoryLink):
+            pass
+        class Flag(int):
+            pass
+        class Point:
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+        class Point3D(Point):
+            pass
+        link = PutterLink()
+        # the most specific registration wins: bool over int, and int for a subclass of it
+        self.assertEqual(link._getPutter(True), link._putBool)
+        self.assertEqual(link._getPutter(Flag(3)), link._putInt)
+        self.assertIn(Flag, link._putter_cache)
+        self.assertIsNone(link._getPutter(Point(1, 2)))
+        PutterLink.register_putter(Point, lambda link, p: link.put(MLExpr("Point", ([ p.x, p.y ], ))))
+        self.assertNotIn(Flag, PutterLink._putter_cache) # registering starts the cache over
+        link.put(Point3D(1, 2))
+        self.assertEqual(link.get(), MLExpr("Point", (MLExpr("List", (1, 2)), )))
+        PutterLink.register_putter(Point3D, lambda link, p: link._putString("3D"))
+        link.put(Point3D(1, 2))
+        link.put(Point(1, 2))
+        self.assertEqual(link.get(), "3D")
+        self.assertEqual(link.get().head, "Point")
+        # registrations apply inside of expressions too, not just at the top level
+        class Vec(list):
+            pass
+        PutterLink.register_putter(Vec, lambda link, v: link.put(MLExpr("Vec", (len(v), ))))
+        PutterLink.register_putter(complex, lambda link, z: link._putString("z"))
+        link.put(Vec([ 1, 2 ]))
+        self.assertEqual(link.get(), MLExpr("Vec", (2, )))
+        link.put(MLExpr("f", (Vec([ 1, 2 ]), )))
+        self.assertEqual(link.get(), MLExpr("f", (MLExpr("Vec", (2, )), )))
+        link.put(MLExpr("f", ([ 1j ], )))
+        self.assertEqual(link.get(), MLExpr("f", (MLExpr("List", ("z", )), )))
+        # registrations stay on the class they were made on
+        self.assertIsNone(MemoryLink()._getPutter(Point(1, 2)))
+        link = MemoryLink()
+        link.put(MLExpr("f", (1j, )))
+        self.assertEqual(link.get(), MLExpr("f", (MLExpr("Complex", (0., 1.)), )))
@@ -0,0 +1,27 @@
+from .TestUtils import *
+
+class TypeConverterTest(TestCase):
+
+    @debugTest
+    def decoderLookup(self):
+        from PJLink.HelperClasses import TypeConverter
+        conv = TypeConverter()
+        packed = conv.decoders_for("PJLink`TypeHints`PackedArrayInfo")
+        self.assertEqual(packed, (conv.decoders["PackedArrayInfo"], ))
+        self.assertEqual(conv.decoders_for("List"), ())
+        self.assertIs(conv.decoders_for("List"), conv.decoders_for("List")) # cached
+        class AnyHead:
+            # no _head, so it has to be tried on everything
+            def decode(self, link):
+                return None
+        class Never:
+            _head = None
+        class Either:
+            _head = ("Foo", "Bar")
+        generic = AnyHead()
+        conv.add_decoder("Generic", generic)
+        conv.add_decoder("Never", Never())
+        conv.add_decoder("Either", Either())
+        self.assertEqual(conv.decoders_for("List"), (generic, ))
+        self.assertEqual(conv.decoders_for("PJLink`TypeHints`PackedArrayInfo"), (conv.decoders["PackedArrayInfo"], generic))
+        self.assertEqual(conv.decoders_for("Ctx`Bar"), (generic, conv.decoders["Either"]))
@@ -0,0 +1,48 @@
+from .TestUtils import *
+
+class VectorizedFunctionTest(TestCase):
+
+    @debugTest
+    def elementwise(self):
+        import math, numpy
+        from PJLink.VectorizedFunction import VectorizedFunction
+        erf = VectorizedFunction(math.erf, elementwise = True)
+        data = numpy.linspace(0, 1, 6).reshape(2, 3)
+        res = erf(data)
+        self.assertIsInstance(res, numpy.ndarray)
+        self.assertEqual(res.shape, (2, 3))
+        self.assertAlmostEqual(res[1, 2], math.erf(1))
+        # NumPy scalars and bools don't pack, so they come back as plain Python values
+        positive = VectorizedFunction(lambda x: x > .5, elementwise = True)
+        res = positive(data)
+        self.assertEqual(res, [ [ False, False, False ], [ True, True, True ] ])
+        self.assertIs(type(res[0][0]), bool)
+        total = VectorizedFunction(numpy.sum)
+        self.assertIs(type(total(data)), float)
+
+    @debugTest
+    def alignedArrays(self):
+        import array, operator
+        from PJLink.VectorizedFunction import VectorizedFunction
+        from PJLink.HelperClasses import BufferedNDArray
+        add = VectorizedFunction(operator.add, elementwise = True, use_numpy = False)
+        a = BufferedNDArray(array.array("l", range(6)), (2, 3))
+        res = add(a, [ [ 10, 10, 10 ], [ 20, 20, 20 ] ])
+        self.assertIsInstance(res, BufferedNDArray)
+        self.assertEqual(res.shape, (2, 3))
+        self.assertEqual(list(res._buffer), [ 10, 11, 12, 23, 24, 25 ])
+        # anything that isn't an array gets passed along to every element
+        res = add(a, 1)
+        self.assertEqual(list(res._buffer), [ 1, 2, 3, 4, 5, 6 ])
+        self.assertRaises(ValueError, add, a, [ 1, 2 ])
+
+    @debugTest
+    def nonPackable(self):
+        import numpy
+        from PJLink.VectorizedFunction import VectorizedFunction
+        label = VectorizedFunction(lambda x: "n{}".format(x), elementwise = True, use_numpy = False)
+        self.assertEqual(label([ [ 1, 2 ], [ 3, 4 ] ]), [ [ "n1", "n2" ], [ "n3", "n4" ] ])
+        names = VectorizedFunction(lambda a: numpy.array([ "a", "b" ]))
+        self.assertEqual(names([ 1, 2 ]), [ "a", "b" ])
+        flags = VectorizedFunction(lambda x: numpy.bool_(x > 1), elementwise = True, use_numpy = False)
+        self.assertEqual(flags([ 1, 2 ]), [ False, True ])
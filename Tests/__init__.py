@@ -1,4 +1,17 @@
 
 
 from .CompilationTest import CompilationTest
-from .TestUtils import TestRunner, DebugTests, ValidationTests, TimingTests, LoadTests, load_tests
\ No newline at end of file
+from .MemoryLinkTest import MemoryLinkTest
+from .ExprProgramTest import ExprProgramTest
+from .TypeConverterTest import TypeConverterTest
+from .MLSymTest import MLSymTest
+from .KernelLinkTest import KernelLinkTest
+from .KernelPoolTest import KernelPoolTest
+from .DeadlineSchedulerTest import DeadlineSchedulerTest
+from .EvaluationCoalescerTest import EvaluationCoalescerTest
+from .EvaluationCacheTest import EvaluationCacheTest
+from .CodeCacheTest import CodeCacheTest
+from .VectorizedFunctionTest import VectorizedFunctionTest
+from .CallExecutorTest import CallExecutorTest
+from .EnvironmentTest import EnvironmentTest
+from .TestUtils import TestRunner, DebugTests, ValidationTests, TimingTests, LoadTests, load_tests